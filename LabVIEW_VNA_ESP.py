@@ -6,7 +6,6 @@ Date: 05/05/25
 
 """
 
-import pyvisa
 import os
 import time
 import numpy as np
@@ -14,6 +13,10 @@ from datetime import datetime
 import re
 import glob
 import csv
+import threading
+import itertools
+from instruments import VNA, ESP, resource_manager, POOL
+from scan_data import write_position_file, write_frequency_files, serpentine_matrix, grid_shape, LiveView, save_scan_store, ScanStore, STORE_EXT
 
 def find_ind(arr, freq):
     ind = []
@@ -53,71 +56,46 @@ def extraire_valeur(chemin_fichier, li, co):
 
 def matrix_tps_reel(dossier, ligne_cible, colonne_cible, X, pas):
     fichiers = sorted([f for f in os.listdir(dossier) if re.match(r"Balayage_\d+\.txt", f)],key=lambda x: int(re.findall(r'\d+', x)[0]))
-    nb = int(np.ceil((X/pas+1)**2))
-    if int(len(fichiers) ** 0.5) == nb:
-        N = int(len(fichiers) ** 0.5)
-    else:
-        N = nb
-    matrice = np.zeros((N, N), dtype=float)
+    N = int(round(X/pas + 1)) # positions not measured yet are set to 0
+    valeurs = np.zeros(len(fichiers), dtype=float)
     for idx, fichier in enumerate(fichiers):
         with open(os.path.join(dossier, fichier), 'r') as f:
           lignes = f.readlines()
           if 0 <= ligne_cible < len(lignes):
             ligne = lignes[ligne_cible].strip().split()
             if 0 <= colonne_cible < len(ligne):
-                valeur = ligne[colonne_cible]
-        row = N - 1 - (idx // N)
-        col_index = idx % N
-        if (N - 1 - row) % 2 == 0:
-            col = N - 1 - col_index  
-        else:
-            col = col_index         
-        matrice[row][col] = valeur
-    return matrice
+                valeurs[idx] = ligne[colonne_cible]
+    return serpentine_matrix(valeurs, N)
 
-def matrix(dossier, ligne_cible, colonne_cible, rot=False):
+def matrix(dossier, ligne_cible, colonne_cible, rot=False, A=None, B=None, pas_x=1, pas_y=None):
     if rot ==True:
         fichiers = sorted([f for f in os.listdir(dossier) if re.match(r"Rotation_\d+\.txt", f)],key=lambda x: int(re.findall(r'\d+', x)[0]))
     else :
         fichiers = sorted([f for f in os.listdir(dossier) if re.match(r"Balayage_\d+\.txt", f)],key=lambda x: int(re.findall(r'\d+', x)[0]))
-    N = int(len(fichiers) ** 0.5)
-    matrice = np.zeros((N, N), dtype=float)
+    shape = int(len(fichiers) ** 0.5) if A is None or B is None else grid_shape(A, B, pas_x, pas_y)
+    valeurs = np.zeros(len(fichiers), dtype=float)
     for idx, fichier in enumerate(fichiers):
         with open(os.path.join(dossier, fichier), 'r') as f:
           lignes = f.readlines()
           if 0 <= ligne_cible < len(lignes):
             ligne = lignes[ligne_cible].strip().split()
             if 0 <= colonne_cible < len(ligne):
-                valeur = ligne[colonne_cible]
-        row = N - 1 - (idx // N)
-        col_index = idx % N
-        if (N - 1 - row) % 2 == 0:
-            col = N - 1 - col_index  
-        else:
-            col = col_index         
-        matrice[row][col] = valeur
-    return matrice
+                valeurs[idx] = ligne[colonne_cible]
+    return serpentine_matrix(valeurs, shape)
 
-def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3):
+def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3, freq=None, pas_y=None):
     try:
-        N = int((B[0] - A[0])/pas + 1)
-        with open(chemin_fichier, 'r') as fichier:
-            lecteur_csv = csv.reader(fichier, delimiter='\t') 
-            next(lecteur_csv) 
-            colonnes = list(zip(*lecteur_csv))  
-        meas = [float(i) for i in colonnes[col]]
-        matrice = np.zeros((N, N), dtype=float)
-        idx = 0
-        for row in range(N-1, -1, -1):  
-            if (N - 1 - row) % 2 == 0:
-                for col in range(N-1, -1, -1):
-                    matrice[row][col] = meas[idx]
-                    idx += 1
-            else:
-                for col in range(N):
-                    matrice[row][col] = meas[idx]
-                    idx += 1
-        return matrice
+        shape = grid_shape(A, B, pas, pas_y)
+        if chemin_fichier.endswith(STORE_EXT): # only the chunks of the chosen frequency are read
+            store = ScanStore(chemin_fichier)
+            meas = store.column(col, 0 if freq is None else store.freq_index(freq))
+        else:
+            with open(chemin_fichier, 'r') as fichier:
+                lecteur_csv = csv.reader(fichier, delimiter='\t') 
+                next(lecteur_csv) 
+                colonnes = list(zip(*lecteur_csv))  
+            meas = np.array(colonnes[col], dtype=float)
+        return serpentine_matrix(meas, shape)
     except FileNotFoundError:
         print(f"Erreur : Le fichier '{chemin_fichier}' n'a pas été trouvé.")
         return None
@@ -148,24 +126,11 @@ def move(entree = [2, 2, 1, 0, 1, "GPIB0::1::INSTR"]):
     absolute = {"1":True, "0":False}[str(entree[3])]
     speed = int(entree[4])
     ip_adress_esp = str(entree[5])
-    rm = pyvisa.ResourceManager()
-    time.sleep(3)
-    esp = rm.open_resource(f'{ip_adress_esp}')
-    esp.timeout = 30000
-    print("Connecté à :", esp.query("*IDN?")) # ask identification
-    time.sleep(1)
-    esp.write(f'{axis}MO')
-    esp.write(f'{axis}SN{units}')
-    esp.write(f'{axis}AC5')
-    esp.write(f'{axis}AG5')
-    speed_mode = {1:"JW5", 2:"JH10", 3:"VU15"}[speed]
-    esp.write(f'{axis}{speed_mode}')
-    movement_mode = f'{"PA" if absolute else "PR"}'
-    esp.write(f'{axis}{movement_mode}{movement}')
-    esp.write(f'{axis}WS')
+    def deplacement(esp): # the session of the pool stays open between the calls
+        move_meas(axis, units, movement, absolute, speed, esp, "")
+    REGISTRY.check_free([ip_adress_esp]) # the ESP of a running scan is not moved
+    POOL.call(ip_adress_esp, deplacement)
     print("Deplacment terminé")
-    esp.close()
-    print("Connexions fermées")
     return "Deplacement terminé"
 
 def plot(entree = ["C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", "0", "C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad"]):
@@ -180,76 +145,47 @@ def plot(entree = ["C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad
         ph_S21 = file_to_col(save_path, 1, 4)
         return np.concatenate((theta,mag_S12,ph_S12,mag_S21,ph_S21))
     elif rot ==1:
-        A1 = int(extraire_valeur(chemin_param, 1, 6))
-        A2 = int(extraire_valeur(chemin_param, 1, 7))
-        pas_x = int(extraire_valeur(chemin_param, 1, 4))
-        B1 = int(extraire_valeur(chemin_param, 1, 8))
-        B2 = int(extraire_valeur(chemin_param, 1, 9))
-        pas_y = int(extraire_valeur(chemin_param, 1, 5))
-        mag_S12 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, pas_y, col=2).flatten()
-        ph_S12 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, pas_y, col=3).flatten()
-        mag_S21 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, pas_y, col=4).flatten()
-        ph_S21 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, pas_y, col=5).flatten()
+        freq_plot = float(entree[3]) * 10**9 if len(entree) > 3 else None # only used with a {File_name}.scan store
+        if save_path.endswith(STORE_EXT): # the grid is read in the parameters saved in the store
+            parametres = ScanStore(save_path).parameters
+            valeur = lambda nom: float([v for k, v in parametres.items() if k.startswith(nom)][0])
+            A1, A2, pas_x, B1, B2 = valeur("x_min"), valeur("x_max"), valeur("step_x"), valeur("y_min"), valeur("y_max")
+        else:
+            A1 = int(extraire_valeur(chemin_param, 1, 6))
+            A2 = int(extraire_valeur(chemin_param, 1, 7))
+            pas_x = int(extraire_valeur(chemin_param, 1, 4))
+            B1 = int(extraire_valeur(chemin_param, 1, 8))
+            B2 = int(extraire_valeur(chemin_param, 1, 9))
+        mag_S12 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, col=2, freq=freq_plot).flatten()
+        ph_S12 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, col=3, freq=freq_plot).flatten()
+        mag_S21 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, col=4, freq=freq_plot).flatten()
+        ph_S21 = matrix_single_freq(os.path.abspath(save_path), [A1,B1], [A2,B2], pas_x, col=5, freq=freq_plot).flatten()
         return np.concatenate((mag_S12,mag_S21,ph_S12,ph_S21))  
 
 def move_meas(axis, units, movement, absolute, speed, esp, sign):
-    time.sleep(3)
-    esp.timeout = 30000
-    print("Connecté à :", esp.query("*IDN?")) # ask identification
-    time.sleep(1)
-    esp.write(f'{axis}MO')
-    esp.write(f'{axis}SN{units}')
-    esp.write(f'{axis}AC5')
-    esp.write(f'{axis}AG5')
     speed_mode = {1:"JW5", 2:"JH10", 3:"VU15"}[speed]
-    esp.write(f'{axis}{speed_mode}')
     movement_mode = f'{"PA" if absolute else "PR"}'
-    esp.write(f'{axis}{movement_mode}{sign}{movement}')
-    esp.write(f'{axis}WS')
-
-def meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path):
-    if state_avg: # if state_avg=True: turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position 
-        vna.write(f'SENSe{channel}:AVERage OFF')
-        time.sleep(0.1)
-        vna.write(f'SENSe{channel}:AVERage ON')
-        time.sleep(1)
-        vna.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
-        for z in range(count_avg): # take count_avg measures to correctly average the signals
-            vna.write(f'INITiate{channel}:IMMediate')
-            vna.write('*WAI')
-    else: 
-        esp.write(f'{axis[0]}WS')
-        esp.write(f'{axis[1]}WS')
-        vna.write(f'SENSe{channel}:AVERage OFF')
-        vna.write(f'INITiate{channel}:IMMediate')
-        vna.write('*WAI')
+    with esp.batch() as lot: # the configuration is only sent when it has changed
+        esp.configure_axis(lot, axis, units, 5, 5, speed_mode)
+        lot.write(f'{axis}{movement_mode}{sign}{movement}')
+        lot.write(f'{axis}WS')
+    esp.wait_motion(axis, delay=0)
+
+def meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path, data, journal=False):
+    esp.wait_motion(axis, delay=0) # no sweep before the arm has stopped
+    vna.sweep(channel, state_avg, count_avg, trace_name) # averaging (if state_avg=True) done at this position
 ################################################################################################
 # Saving in a file
 ################################################################################################
-    all_magnitudes = []
-    all_phases = []
     freq_data = np.linspace(int(start_freq), int(stop_freq), int(points))
-    for trace in trace_name:
-        vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
-        time.sleep(1)
-        vna.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
-        time.sleep(1)
-        mag_data = vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
-        vna.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
-        time.sleep(1)
-        phase_data = vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA')
-        all_magnitudes.append(mag_data)
-        all_phases.append(phase_data)
+    data[hh-1] = vna.read_traces(trace_name, channel, delay=1) # magnitude (dB) and phase (°) of all the traces
     date = datetime.now().strftime("%m-%d-%Y")
     esp.write(f'{axis[0]}TP?') # ask the esp the x value
     x = esp.read()
-    time.sleep(0.5)
+    esp.pause(0.5)
     esp.write(f'{axis[1]}TP?') # ask the esp the y value
     y = esp.read()
-    file_name = f"Balayage_{hh}.txt"
-    os.makedirs(save_path, exist_ok=True)
-    full_path = os.path.join(save_path, file_name)
-    with open(full_path, 'w') as f:
+    if journal: # the Balayage_#.txt files are only a crash journal, the data is kept in the cube
         header = ["Frequency (Hz)"]
         for trace in trace_name:
             header.append(f"Magnitude_{trace}")
@@ -258,16 +194,28 @@ def meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_fre
             header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_average={count_avg}_[x_y]=[{x}_{y}]')
         else:
             header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_avrage=False_[x_y]=[{x}_{y}]')
-        f.write("\t".join(header) + "\n")
-        for l in range(points):
-            line = [f"{freq_data[l]:.2f}"]
-            for mag, phase in zip(all_magnitudes, all_phases):
-                line.append(f"{mag[l]:.4f}")
-                line.append(f"{phase[l]:.4f}")
-            f.write("\t".join(line) + "\n")
+        os.makedirs(save_path, exist_ok=True)
+        write_position_file(os.path.join(save_path, f"Balayage_{hh}.txt"), header, freq_data, data[hh-1])
     return x, y    
 
-def Balayage_2D_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "GPIB1::16::INSTR", "GPIB1::1::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", 140E9, "Comp"]):
+def release(vna, esp, axes):
+    """
+    End of a scan: returns the axes to zero and closes the VISA sessions (the errors are printed,
+    so that the other steps are still done).
+    """
+    if esp is not None:
+        try:
+            esp.move_axes(axes, [0]*len(axes), wait=False) # return to zero
+        except Exception as e:
+            print(f"erreur lors du retour au zero: {e}")
+    for session in (vna, esp):
+        if session is not None:
+            try:
+                session.close()
+            except Exception as e:
+                print(f"erreur lors de la fermeture de la connexion: {e}")
+
+def Balayage_2D_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "GPIB1::16::INSTR", "GPIB1::1::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", 140E9, "Comp"], journal=False, live="full", ready=False):
     ################################################################################################
     # parameters
     ################################################################################################
@@ -302,172 +250,135 @@ def Balayage_2D_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "W
     ################################################################################################
     # init
     ################################################################################################
-    rm = pyvisa.ResourceManager()
-    vna = rm.open_resource(f'{ip_adress_vna}')
-    vna.timeout = 30000  # timeout of 30 sec
-    esp = rm.open_resource(f'{ip_adress_esp}')
-    esp.timeout = 30000
-    esp.write_termination = '\r'
-    esp.read_termination = '\r'
-    time.sleep(1)
-    vna.write(':MMEMory:LOAD:FILE "%s"' % (f'D:/{band}')) # call the saved state and calset data
-    time.sleep(2)
-    vna.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
-    vna.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
-    vna.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
-    vna.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
-    vna.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
-    vna.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
-    time.sleep(2)
-    print(f"Canal {channel} configuré : start={start_freq}, stop={stop_freq}, points={points}")
-    time.sleep(1)
-    for j, trace in enumerate(trace_name):
-        vna.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace}"+","+f'{trace}') # definie a new trace
-        vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"') # select the new trace
-        vna.write(f'DISPlay:WINDow{j+1}:STATe ON') # turn on the window display
-        vna.write(f'DISPlay:WINDow{j+1}:TRACe{j+1}:FEED "{trace}"') # put the new trace into the window
-        time.sleep(1)
-        vna.write(f':DISPlay:WINDow{j+1}:TRACe{j+1}:Y:AUTO') # autoscale the trace
-        print(f"Trace {trace} ajoutée à la fenêtre {j+1}")
-    for axe in axis:
-        esp.write(f'{axe}MO') # turn on the axis
-        esp.write(f'{axe}SN{units}') # set the unit of the axis: 0 = encoder count, 1 = motor step, 2 = millimeter, 3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient, 9 = radian, 10 = milliradian, 11 = microradian
-        esp.write(f'{axe}AC{accel}') # set the axis acceleration
-        esp.write(f'{axe}AG{deccel}') # set the axis decceleration
+    vna = esp = None
+    try:
+        rm = resource_manager()
+        vna = VNA(rm.open_resource(f'{ip_adress_vna}')) # VISA session wrapped by the driver layer
+        vna.timeout = 30000  # timeout of 30 sec
+        esp = ESP(rm.open_resource(f'{ip_adress_esp}'))
+        esp.timeout = 30000
+        esp.write_termination = '\r'
+        esp.read_termination = '\r'
+        vna.pause(1)
+        vna.write(':MMEMory:LOAD:FILE "%s"' % (f'D:/{band}')) # call the saved state and calset data
+        vna.pause(2)
+        vna.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
+        vna.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
+        vna.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
+        vna.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
+        vna.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
+        vna.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
+        vna.pause(2)
+        print(f"Canal {channel} configuré : start={start_freq}, stop={stop_freq}, points={points}")
+        for j, trace in enumerate(trace_name):
+            vna.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace}"+","+f'{trace}') # definie a new trace
+            vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"') # select the new trace
+            vna.write(f'DISPlay:WINDow{j+1}:STATe ON') # turn on the window display
+            vna.write(f'DISPlay:WINDow{j+1}:TRACe{j+1}:FEED "{trace}"') # put the new trace into the window
+            vna.pause(1)
+            vna.write(f':DISPlay:WINDow{j+1}:TRACe{j+1}:Y:AUTO') # autoscale the trace
+            print(f"Trace {trace} ajoutée à la fenêtre {j+1}")
         if speed==1:
             speed_mode = "JW5" # slow
         elif speed==2:
             speed_mode = "JH10" # medium
         elif speed==3:
             speed_mode = "VU15" # fast
-        esp.write(f'{axe}{speed_mode}') # set the speed mode
-    if start_freq == stop_freq:
-        vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
-        print("Balayage mono-fréquence:")
-    freq_data = np.linspace(int(start_freq), int(stop_freq), int(points))
-    ################################################################################################
-    # sweep spacial parameters
-    ################################################################################################
-    esp.write(f'{axis[0]}PA{A}')
-    esp.write(f'{axis[0]}WS')
-    esp.write(f'{axis[1]}PA{A}')
-    esp.write(f'{axis[1]}WS')
-    L_tot_1 = int(np.round((int(B)-int(A))/int(pas),0))
-    L_tot_2 = int(np.round((int(B)-int(A))/int(pas) + 1,0))
-    nb_tot_position = int(np.ceil((1 + (int(B)-int(A)) / int(pas) )**2))
-    hh = 1 # hh tracks the number of measurements
-    xx = []
-    yy = []
-    unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
-    ligne_cible = int(find_ind(freq_data, freq_plot)[0])
-    ################################################################################################
-    # preset file creation
-    ################################################################################################  
-    file_name = f"{File_name}_parameters.txt"
-    os.makedirs(save_path, exist_ok=True)    
-    full_path = os.path.join(save_path, file_name)
-    with open(full_path, 'w') as f:
-        header = ["start_freq (Hz)", "stop_freq (Hz)", "number_of_point", "average", f"step_x_y ({unit})", f"x_min ({unit})", f"x_max ({unit})", f"y_min ({unit})", f"y_max ({unit})"]
-        f.write("\t".join(header) + "\n")
-        if state_avg:
-            line = [f"{start_freq}",  f"{stop_freq}", f"{points}", f"{count_avg}", f"{pas}", f"{A}", f"{B}", f"{A}", f"{B}", f"{A}", f"{B}"]
-        else: 
-            line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas}", f"{A}", f"{B}", f"{A}", f"{B}", f"{A}", f"{B}"]
-        f.write("\t".join(line) + "\n")
-    ################################################################################################
-    # this is the 2D-sweeping script 
-    ################################################################################################
-    for i in range(L_tot_2):
-        for j in range(L_tot_1):
-            if i%2 ==0:
-                signe = "+" # change sign to make the arm go back and forth
-            else:
-                signe = "-"
-            x, y = meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path)  
-            xx.append(x)
-            yy.append(y)
-            mag_S12 = matrix_tps_reel(save_path, ligne_cible, 1, int(B-A), pas)
-            ph_S12 = matrix_tps_reel(save_path, ligne_cible, 2, int(B-A), pas)
-            mag_S21 = matrix_tps_reel(save_path, ligne_cible, 3, int(B-A), pas)
-            ph_S21 =  matrix_tps_reel(save_path, ligne_cible, 4, int(B-A), pas)
-            move_meas(axis[0], units, pas, False, speed, esp, signe)
-            hh = hh + 1
-            yield np.concatenate((mag_S12,mag_S21,ph_S12,ph_S21))
-        x, y = meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path)  
-        xx.append(x)
-        yy.append(y)
-        mag_S12 = matrix_tps_reel(save_path, ligne_cible, 1, int(B-A), pas)
-        ph_S12 = matrix_tps_reel(save_path, ligne_cible, 2, int(B-A), pas)
-        mag_S21 = matrix_tps_reel(save_path, ligne_cible, 3, int(B-A), pas)
-        ph_S21 =  matrix_tps_reel(save_path, ligne_cible, 4, int(B-A), pas)
-        move_meas(axis[1], units, pas, False, speed, esp, "+")
-        hh = hh + 1
-        yield np.concatenate((mag_S12,mag_S21,ph_S12,ph_S21))
-    ################################################################################################
-    # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
-    ################################################################################################  
-    freq_data = np.linspace(start_freq, stop_freq, points)
-    date = datetime.now().strftime("%m-%d-%Y")
-    for freq_idx in range(points):
-        target_frequency = freq_data[freq_idx]
-        ligne_freq = freq_idx + 1
-        file_name = f"{File_name}_{target_frequency/1E9:.3f}GHz.txt"
+        with esp.batch() as lot: # motor on, unit (0 = encoder count, 1 = motor step, 2 = millimeter, 3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient, 9 = radian, 10 = milliradian, 11 = microradian), acceleration, decceleration and speed mode of the axis
+            for axe in axis:
+                esp.configure_axis(lot, axe, units, accel, deccel, speed_mode)
+        if start_freq == stop_freq:
+            vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
+            print("Balayage mono-fréquence:")
+        freq_data = np.linspace(int(start_freq), int(stop_freq), int(points))
+        ################################################################################################
+        # sweep spacial parameters
+        ################################################################################################
+        esp.move_axes(axis, [A, A], delay=0) # both axes at once, one wait for all of them
+        L_tot_1 = int(np.round((int(B)-int(A))/int(pas),0))
+        L_tot_2 = int(np.round((int(B)-int(A))/int(pas) + 1,0))
+        nb_tot_position = int(np.ceil((1 + (int(B)-int(A)) / int(pas) )**2))
+        N = int(np.round((int(B)-int(A))/int(pas) + 1,0)) # number of positions along each axis
+        hh = 1 # hh tracks the number of measurements
+        data = np.zeros((nb_tot_position, points, len(trace_name), 2), dtype=float) # acquisition cube (position, frequency, trace, [magnitude, phase])
+        xx = []
+        yy = []
+        unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
+        ligne_cible = int(find_ind(freq_data, freq_plot)[0])
+        vue = LiveView(N, 2*len(trace_name)) # live images at freq_plot: magnitude of each trace, then phase of each trace
+        ################################################################################################
+        # preset file creation
+        ################################################################################################  
+        file_name = f"{File_name}_parameters.txt"
+        os.makedirs(save_path, exist_ok=True)    
         full_path = os.path.join(save_path, file_name)
-        all_mag = []
-        all_phase = []
-        for i, trace in enumerate(trace_name):
-            mag_col = 1 + 2 * i      
-            phase_col = mag_col + 1
-            magnitudes = file_to_array(save_path, ligne_freq, mag_col)
-            phases = file_to_array(save_path, ligne_freq, phase_col)
-            all_mag.append(magnitudes)
-            all_phase.append(phases)
         with open(full_path, 'w') as f:
-            header = ["x", "y"]
-            for trace in trace_name:
-                header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
-            if state_avg:
-                header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_xmin={A}_xmax={B}_y_min={A}_ymax={B}_stepxy={pas}_average={count_avg}')
-            else:
-                header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_xmin={A}_xmax={B}_y_min={A}_ymax={B}_stepxy={pas}')
+            header = ["start_freq (Hz)", "stop_freq (Hz)", "number_of_point", "average", f"step_x_y ({unit})", f"x_min ({unit})", f"x_max ({unit})", f"y_min ({unit})", f"y_max ({unit})"]
             f.write("\t".join(header) + "\n")
-            for pos_idx in range(nb_tot_position):
-                line = [f"{xx[pos_idx]}", f"{yy[pos_idx]}"]
-                for trace_idx in range(len(trace_name)):
-                    if pos_idx < len(all_mag[trace_idx]):
-                        mag = all_mag[trace_idx][pos_idx]
-                        phase = all_phase[trace_idx][pos_idx]
-                        line.extend([f"{mag:.4f}", f"{phase:.4f}"])
-                    else:
-                        line.extend(["0.0000", "0.0000"])
-                f.write("\t".join(line) + "\n")
-        print(f"Fichier créé: {file_name}")
-    print("Traitement terminé!")
-    ################################################################################################
-    # delete all "Balayage_i.txt" files
-    ################################################################################################  
-    motif = os.path.join(save_path, "Balayage_*.txt")
-    fichiers = glob.glob(motif)
-    for fichier in fichiers:
-        os.remove(fichier)
-        print(f"Supprimé : {fichier}")
-    ################################################################################################
-    # returning home, ask for error and closing connections
-    ################################################################################################
-    for axe in axis: 
-        esp.write(f'{axe}PA0') # return to zero when the sweep is finished
-        esp.write(f'{axe}WS')
-    vna.close() 
-    esp.close()
+            if state_avg:
+                line = [f"{start_freq}",  f"{stop_freq}", f"{points}", f"{count_avg}", f"{pas}", f"{A}", f"{B}", f"{A}", f"{B}", f"{A}", f"{B}"]
+            else: 
+                line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas}", f"{A}", f"{B}", f"{A}", f"{B}", f"{A}", f"{B}"]
+            f.write("\t".join(line) + "\n")
+        parameters = dict(zip(header, line)) # also saved in the {File_name}.scan store
+        if ready:
+            yield None # instruments configured, the first next measures the first position
+        ################################################################################################
+        # this is the 2D-sweeping script 
+        ################################################################################################
+        for i in range(L_tot_2):
+            for j in range(L_tot_1):
+                if i%2 ==0:
+                    signe = "+" # change sign to make the arm go back and forth
+                else:
+                    signe = "-"
+                x, y = meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path, data, journal)  
+                xx.append(x)
+                yy.append(y)
+                delta = vue.update(hh-1, data[hh-1, ligne_cible].T.ravel()) # only the cell just measured is updated
+                move_meas(axis[0], units, pas, False, speed, esp, signe)
+                hh = hh + 1
+                yield delta if live == "delta" else vue.buffer
+            x, y = meas_and_save(channel, state_avg, count_avg, axis, trace_name, hh, start_freq, stop_freq, points, vna, esp, save_path, data, journal)  
+            xx.append(x)
+            yy.append(y)
+            delta = vue.update(hh-1, data[hh-1, ligne_cible].T.ravel())
+            move_meas(axis[1], units, pas, False, speed, esp, "+")
+            hh = hh + 1
+            yield delta if live == "delta" else vue.buffer
+        ################################################################################################
+        # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
+        ################################################################################################  
+        freq_data = np.linspace(start_freq, stop_freq, points)
+        date = datetime.now().strftime("%m-%d-%Y")
+        coords = [(f"{xx[pos_idx]}", f"{yy[pos_idx]}") for pos_idx in range(nb_tot_position)]
+        if state_avg:
+            info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_xmin={A}_xmax={B}_y_min={A}_ymax={B}_stepxy={pas}_average={count_avg}'
+        else:
+            info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_xmin={A}_xmax={B}_y_min={A}_ymax={B}_stepxy={pas}'
+        save_scan_store(os.path.join(save_path, f"{File_name}{STORE_EXT}"), data, freq_data, trace_name, ["x", "y"], coords, parameters)
+        for fichier in write_frequency_files(save_path, File_name, freq_data, data, trace_name, ["x", "y"], coords, info): # text export derived from the same cube
+            print(f"Fichier créé: {os.path.basename(fichier)}")
+        print("Traitement terminé!")
+        ################################################################################################
+        # delete the crash journal ("Balayage_i.txt" files)
+        ################################################################################################  
+        motif = os.path.join(save_path, "Balayage_*.txt")
+        fichiers = glob.glob(motif)
+        for fichier in fichiers:
+            os.remove(fichier)
+            print(f"Supprimé : {fichier}")
+    ################################################################################################
+    # returning home and closing connections, also when the scan fails or is aborted (GeneratorExit)
+    ################################################################################################
+    finally:
+        release(vna, esp, axis)
+    print(vna.sweep_report(count_avg if state_avg else 1))
     print("Mesures terminées")
     print("Connexions fermées")
-    mag_S12 = matrix_single_freq(os.path.join(save_path,f"{File_name}_{freq_plot/1E9:.3f}GHz.txt"), [A,A], [B,B], pas, col=2)
-    ph_S12 = matrix_single_freq(os.path.join(save_path,f"{File_name}_{freq_plot/1E9:.3f}GHz.txt"), [A,A], [B,B], pas, col=3)
-    mag_S21 = matrix_single_freq(os.path.join(save_path,f"{File_name}_{freq_plot/1E9:.3f}GHz.txt"), [A,A], [B,B], pas, col=4)
-    ph_S21 = matrix_single_freq(os.path.join(save_path,f"{File_name}_{freq_plot/1E9:.3f}GHz.txt"), [A,A], [B,B], pas, col=5)
-    yield np.concatenate((mag_S12,mag_S21,ph_S12,ph_S21))
+    yield vue.buffer # final images (also with live="delta")
 
-def Rotation_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "-to+", 140, "GPIB1::16::INSTR", "GPIB1::2::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", "rot"]):
+def Rotation_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "-to+", 140, "GPIB1::16::INSTR", "GPIB1::2::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", "rot"], journal=False, ready=False):
     ################################################################################################
     # parameters
     ################################################################################################
@@ -481,11 +392,11 @@ def Rotation_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.
     ################################################################################################
     axis = {"1":1, "2":2, "3":3}[entree[0]]
     units = str(entree[1]) # 0 = encoder count, 1 = motor step, 2 = millimeter, 3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient, 9 = radian, 10 = milliradian, 11 = microradian
-    theta_max = str(entree[2])
-    theta_min = str(entree[3])
-    pas = str(entree[4])
-    count_avg = str(entree[5])
-    if count_avg == "0":
+    theta_max = float(entree[2])
+    theta_min = float(entree[3])
+    pas = float(entree[4])
+    count_avg = int(entree[5])
+    if count_avg == 0:
         state_avg = False
     else:
         state_avg = True
@@ -503,225 +414,151 @@ def Rotation_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.
     ################################################################################################
     # conexion to the vna and esp
     ################################################################################################
-    rm = pyvisa.ResourceManager()
-    vna = rm.open_resource(f'{ip_adress_vna}')
-    vna.timeout = 30000  # timeout of 30 sec
-    esp = rm.open_resource(f'{ip_adress_esp}')
-    esp.timeout = 30000
-    print("Connecté à :", esp.query("*IDN?")) # ask identification
-    print("Connecté à :", vna.query("*IDN?")) # ask identification
-    time.sleep(1)
-    vna.write(':MMEMory:LOAD:FILE "%s"' % (f'D:/{band}')) # call the saved state and calset data
-    time.sleep(2)
-    vna.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
-    vna.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
-    vna.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
-    vna.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
-    vna.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
-    vna.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
-    time.sleep(2)
-    print(f"Canal {channel} configuré : start={start_freq}, stop={stop_freq}, points={points}")
-    time.sleep(1)
-    for i in range(len(trace_name)):
-        vna.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace_name}"+","+f'{trace_name}') # definie a new trace
-        vna.write(f'CALCulate{channel}:PARameter:SELect "{trace_name}"') # select the new trace
-        vna.write(f'DISPlay:WINDow{i+1}:STATe ON') # turn on the window display
-        vna.write(f'DISPlay:WINDow{i+1}:TRACe{i+1}:FEED "{trace_name}"') # put the new trace into the window
-        time.sleep(1)
-        vna.write(f':DISPlay:WINDow{i+1}:TRACe{i+1}:Y:AUTO') # autoscale the trace
-        print(f"Trace {trace_name} ajoutée à la fenêtre {i+1}")
-    ################################################################################################
-    # I don't know why the motion controller needs this (but it does)
-    ################################################################################################
-    esp.write_termination = '\r'
-    esp.read_termination = '\r'
-    ################################################################################################
-    # give parameters to the axis (acceleration, speed mode...)
-    ################################################################################################
-    esp.write(f'{axis}MO')
-    esp.write(f'{axis}SN{units}')
-    esp.write(f'{axis}AC{accel}')
-    esp.write(f'{axis}AG{deccel}')
-    speed_mode = {1: "JW5", 2: "JH10", 3: "VU15"}[speed]
-    esp.write(f'{axis}{speed_mode}')
-    time.sleep(2)
-    ################################################################################################
-    # sweep spacial parameters
-    ################################################################################################
-    nb_tot_position = int(np.ceil(np.abs(1 + (theta_max - theta_min) / pas )))
-    sortie = []
-    if sens == '-to+':
-        sign = '+'
-        theta_min_sign = theta_min
-    elif sens == '+to-':
-        sign = '-'
-        theta_min_sign = -theta_min
-    esp.write(f'{axis}PA{theta_min_sign}')
-    esp.write(f'{axis}WS')
-    time.sleep(3)
-    start_freq = float(vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
-    stop_freq = float(vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
-    points = int(vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
-    if start_freq == stop_freq:
-        vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
-        print("Balayage mono-fréquence:")
-    unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
+    vna = esp = None
+    try:
+        rm = resource_manager()
+        vna = VNA(rm.open_resource(f'{ip_adress_vna}')) # VISA session wrapped by the driver layer
+        vna.timeout = 30000  # timeout of 30 sec
+        esp = ESP(rm.open_resource(f'{ip_adress_esp}'))
+        esp.timeout = 30000
+        print("Connecté à :", esp.query("*IDN?")) # ask identification
+        print("Connecté à :", vna.query("*IDN?")) # ask identification
+        vna.pause(1)
+        vna.write(':MMEMory:LOAD:FILE "%s"' % (f'D:/{band}')) # call the saved state and calset data
+        vna.pause(2)
+        vna.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
+        vna.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
+        vna.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
+        vna.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
+        vna.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
+        vna.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
+        vna.pause(2)
+        print(f"Canal {channel} configuré : start={start_freq}, stop={stop_freq}, points={points}")
+        for i, trace in enumerate(trace_name):
+            vna.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace}"+","+f'{trace}') # definie a new trace
+            vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"') # select the new trace
+            vna.write(f'DISPlay:WINDow{i+1}:STATe ON') # turn on the window display
+            vna.write(f'DISPlay:WINDow{i+1}:TRACe{i+1}:FEED "{trace}"') # put the new trace into the window
+            vna.pause(1)
+            vna.write(f':DISPlay:WINDow{i+1}:TRACe{i+1}:Y:AUTO') # autoscale the trace
+            print(f"Trace {trace} ajoutée à la fenêtre {i+1}")
+        ################################################################################################
+        # I don't know why the motion controller needs this (but it does)
+        ################################################################################################
+        esp.write_termination = '\r'
+        esp.read_termination = '\r'
+        ################################################################################################
+        # give parameters to the axis (acceleration, speed mode...)
+        ################################################################################################
+        speed_mode = {1: "JW5", 2: "JH10", 3: "VU15"}[speed]
+        with esp.batch() as lot:
+            esp.configure_axis(lot, axis, units, accel, deccel, speed_mode)
+            lot.pause(2)
+        ################################################################################################
+        # sweep spacial parameters
+        ################################################################################################
+        nb_tot_position = int(np.ceil(np.abs(1 + (theta_max - theta_min) / pas )))
+        sortie = []
+        if sens == '-to+':
+            sign = '+'
+            theta_min_sign = theta_min
+        elif sens == '+to-':
+            sign = '-'
+            theta_min_sign = -theta_min
+        esp.write(f'{axis}PA{theta_min_sign}')
+        esp.write(f'{axis}WS')
+        esp.wait_motion(axis, delay=3)
+        start_freq = float(vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
+        stop_freq = float(vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
+        points = int(vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
+        if start_freq == stop_freq:
+            vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
+            print("Balayage mono-fréquence:")
+        unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
     
-    ################################################################################################
-    # preset file creation
-    ################################################################################################  
-    file_name = f"{File_name}_parameters.txt"
-    os.makedirs(save_path, exist_ok=True)    
-    full_path = os.path.join(save_path, file_name)
-    with open(full_path, 'w') as f:
-        header = ["start_freq (Hz)", "stop_freq (Hz)", "number_of_point", "average", f"step ({unit})", f"theta_min ({unit})", f"theta_max ({unit})", "unit"]
-        f.write("\t".join(header) + "\n")
-        if state_avg:
-            line = [f"{start_freq}",  f"{stop_freq}", f"{points}", f"{count_avg}", f"{pas}", f"{theta_min}", f"{theta_max}", f"{unit}"]
-        else: 
-            line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas}", f"{theta_min}", f"{theta_max}", f"{unit}"]
-        f.write("\t".join(line) + "\n")
-    ################################################################################################
-    # this is the angular scan script
-    ################################################################################################
-    hh = 1 # hh tracks the number of measurements
-    theta_val = []
-    freq_data = np.linspace(int(start_freq), int(stop_freq), int(points))
-    ligne_cible = int(find_ind(freq_data, freq_plot)[0])
-    for i in range(nb_tot_position):
-        if state_avg: # if state_avg=True: turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position
-            vna.write(f'SENSe{channel}:AVERage OFF')
-            time.sleep(0.1)
-            vna.write(f'SENSe{channel}:AVERage ON')
-            time.sleep(1)
-            vna.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
-            for z in range(count_avg): # take count_avg measures to correctly average the signals
-                vna.write(f'INITiate{channel}:IMMediate')
-                vna.write('*WAI')
-        else:
-            vna.write(f'SENSe{channel}:AVERage OFF')
-            vna.write(f'INITiate{channel}:IMMediate')
-            vna.write('*WAI')
-        freq_data = np.linspace(start_freq, stop_freq, points)
-        all_magnitudes = []
-        all_phases = []
-        for trace in trace_name:
-            vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
-            time.sleep(2)
-            vna.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
-            time.sleep(2)
-            mag_data = vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
-            vna.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
-            time.sleep(2)
-            phase_data = vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA')
-            all_magnitudes.append(mag_data)
-            all_phases.append(phase_data)
-        esp.write(f'{axis}TP?') # ask the esp the theta value
-        esp.write(f'{axis}PA?') # ask the esp the theta value
-        esp.write(f'{axis}MO')
-        theta = esp.read()
-        esp.write(f'{axis}MO')
-        theta_val.append(theta)
-        time.sleep(0.5)
-    ################################################################################################
-    # save the data in a file
-    ################################################################################################
-        date = datetime.now().strftime("%m-%d-%Y")
-        file_name = f"Rotation_{hh}.txt"
-        os.makedirs(save_path, exist_ok=True)
+        ################################################################################################
+        # preset file creation
+        ################################################################################################  
+        file_name = f"{File_name}_parameters.txt"
+        os.makedirs(save_path, exist_ok=True)    
         full_path = os.path.join(save_path, file_name)
         with open(full_path, 'w') as f:
-            header = ["Frequency (Hz)"]
-            for trace in trace_name:
-                header.append(f"Magnitude_{trace}")
-                header.append(f"Phase_{trace}")
-            if state_avg:
-                header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_average={count_avg}')
-            else:
-                header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz')
+            header = ["start_freq (Hz)", "stop_freq (Hz)", "number_of_point", "average", f"step ({unit})", f"theta_min ({unit})", f"theta_max ({unit})", "unit"]
             f.write("\t".join(header) + "\n")
-            for l in range(points):
-                line = [f"{freq_data[l]:.2f}"]
-                for mag, phase in zip(all_magnitudes, all_phases):
-                    line.append(f"{mag[l]:.4f}")
-                    line.append(f"{phase[l]:.4f}")
-                f.write("\t".join(line) + "\n")
-        print(f"Mesure {hh}/{int(nb_tot_position)}")
-        if i < nb_tot_position - 1: # avoid macking too musch measurements
-            esp.write(f'{axis}PR{sign}{pas}')
-            esp.write(f'{axis}WS')
-            time.sleep(2)
-        hh = hh+1
-        mag_S12 = matrix(save_path, ligne_cible, 1, True)
-        ph_S12 = matrix(save_path, ligne_cible, 1, True)
-        mag_S21 = matrix(save_path, ligne_cible, 1, True)
-        ph_S21 =  matrix(save_path, ligne_cible, 1, True)
-        yield np.concatenate((theta_val,mag_S12,mag_S21,ph_S12,ph_S21))
-    ################################################################################################
-    # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
-    ################################################################################################      
-    for freq_idx in range(points):
-        target_frequency = freq_data[freq_idx]
-        ligne_freq = freq_idx + 1
-        file_name = f"{File_name}_{target_frequency/1E9:.3f}GHz.txt"
-        full_path = os.path.join(save_path, file_name)
-        all_mag = []
-        all_phase = []
-        for i, trace in enumerate(trace_name):
-            mag_col = 1 + 1 * i      
-            phase_col = mag_col + 1
-            magnitudes = file_to_array(save_path, ligne_freq, mag_col, rot=True)
-            phases = file_to_array(save_path, ligne_freq, phase_col, rot=True)
-            all_mag.append(magnitudes)
-            all_phase.append(phases)
-        with open(full_path, 'w') as f:
-            header = ["theta"]
-            for trace in trace_name:
-                header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
             if state_avg:
-                header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}_average={count_avg}')
-            else:
-                header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}')
-            f.write("\t".join(header) + "\n")
-            for pos_idx in range(nb_tot_position):
-                line = [f"{theta_val[pos_idx]}"]
-                for trace_idx in range(len(trace_name)):
-                    if pos_idx < len(all_mag[trace_idx]):
-                        mag = all_mag[trace_idx][pos_idx]
-                        phase = all_phase[trace_idx][pos_idx]
-                        line.extend([f"{mag:.4f}", f"{phase:.4f}"])
-                    else:
-                        line.extend(["0.0000", "0.0000"])
-                f.write("\t".join(line) + "\n")
-    print("Traitement terminé!")
+                line = [f"{start_freq}",  f"{stop_freq}", f"{points}", f"{count_avg}", f"{pas}", f"{theta_min}", f"{theta_max}", f"{unit}"]
+            else: 
+                line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas}", f"{theta_min}", f"{theta_max}", f"{unit}"]
+            f.write("\t".join(line) + "\n")
+        parameters = dict(zip(header, line)) # also saved in the {File_name}.scan store
+        if ready:
+            yield None # instruments configured, the first next measures the first position
+        ################################################################################################
+        # this is the angular scan script
+        ################################################################################################
+        hh = 1 # hh tracks the number of measurements
+        theta_val = []
+        freq_data = np.linspace(int(start_freq), int(stop_freq), int(points))
+        ligne_cible = int(find_ind(freq_data, freq_plot)[0])
+        data = np.zeros((nb_tot_position, points, len(trace_name), 2), dtype=float) # acquisition cube (position, frequency, trace, [magnitude, phase])
+        for i in range(nb_tot_position):
+            vna.sweep(channel, state_avg, count_avg, trace_name) # averaging (if state_avg=True) done at this position
+            freq_data = np.linspace(start_freq, stop_freq, points)
+            data[hh-1] = vna.read_traces(trace_name, channel, delay=2) # magnitude (dB) and phase (°) of all the traces
+            esp.write(f'{axis}TP?') # ask the esp the theta value
+            esp.write(f'{axis}PA?') # ask the esp the theta value
+            esp.write(f'{axis}MO')
+            theta = esp.read()
+            esp.write(f'{axis}MO')
+            theta_val.append(theta)
+            vna.pause(0.5)
+        ################################################################################################
+        # save the data in the crash journal
+        ################################################################################################
+            date = datetime.now().strftime("%m-%d-%Y")
+            if journal: # the Rotation_#.txt files are only a crash journal, the data is kept in the cube
+                header = ["Frequency (Hz)"]
+                for trace in trace_name:
+                    header.append(f"Magnitude_{trace}")
+                    header.append(f"Phase_{trace}")
+                if state_avg:
+                    header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_average={count_avg}_theta={theta}')
+                else:
+                    header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_theta={theta}')
+                write_position_file(os.path.join(save_path, f"Rotation_{hh}.txt"), header, freq_data, data[hh-1])
+            print(f"Mesure {hh}/{int(nb_tot_position)}")
+            if i < nb_tot_position - 1: # avoid macking too musch measurements
+                esp.write(f'{axis}PR{sign}{pas}')
+                esp.write(f'{axis}WS')
+                esp.wait_motion(axis)
+            mag_S12 = data[:hh, ligne_cible, 0, 0]
+            ph_S12 = data[:hh, ligne_cible, 0, 1]
+            mag_S21 = data[:hh, ligne_cible, 1, 0]
+            ph_S21 = data[:hh, ligne_cible, 1, 1]
+            hh = hh+1
+            yield np.concatenate((theta_val,mag_S12,mag_S21,ph_S12,ph_S21))
+        ################################################################################################
+        # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
+        ################################################################################################      
+        coords = [(f"{theta_val[pos_idx]}",) for pos_idx in range(nb_tot_position)]
+        if state_avg:
+            info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}_average={count_avg}'
+        else:
+            info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}'
+        save_scan_store(os.path.join(save_path, f"{File_name}{STORE_EXT}"), data, freq_data, trace_name, ["theta"], coords, parameters)
+        write_frequency_files(save_path, File_name, freq_data, data, trace_name, ["theta"], coords, info) # text export derived from the same cube
+        print("Traitement terminé!")
+    ################################################################################################
+    # returning home and closing connections, also when the scan fails or is aborted (GeneratorExit)
     ################################################################################################
-    esp.write(f'{axis}PA0')
-    esp.write(f'{axis}WS')
-    vna.close()
-    esp.close()
+    finally:
+        release(vna, esp, [axis])
+    print(vna.sweep_report(count_avg if state_avg else 1))
     print("Mesures terminées\nConnexions fermées")
-    fichiers = sorted([f for f in os.listdir(save_path) if re.match(r"Rotation_\d+\.txt", f)],key=lambda x: int(re.findall(r'\d+', x)[0]))
-    theta_plot = []
-    mag_s12_plot = []
-    phase_s12_plot = []
-    mag_s21_plot = []
-    phase_s21_plot = []                
-    col_mag_s12 = 2
-    col_phase_s12 = 3
-    col_mag_s21 = 4
-    col_phase_s21 = 5
-    with open(save_path, 'r') as f:
-        line = f.readlines()
-        for idx, fichier in enumerate(fichiers):
-            if line[1,idx] == freq_plot:
-                theta_plot.append(extraire_valeur(save_path, line[0,idx], 1))
-                mag_s12_plot.append(extraire_valeur(save_path, line[0,idx], col_mag_s12))
-                phase_s12_plot.append(extraire_valeur(save_path, line[0,idx], col_phase_s12))
-                mag_s21_plot.append(extraire_valeur(save_path, line[0,idx], col_mag_s21))
-                phase_s21_plot.append(extraire_valeur(save_path, line[0,idx], col_phase_s21))                        
-    sortie = np.concatenate((theta_plot, mag_s12_plot, phase_s12_plot, mag_s21_plot, phase_s21_plot))
+    theta_plot = [float(theta) for theta in theta_val]
+    sortie = np.concatenate((theta_plot, data[:, ligne_cible, 0, 0], data[:, ligne_cible, 0, 1], data[:, ligne_cible, 1, 0], data[:, ligne_cible, 1, 1]))
     ################################################################################################
-    # delete all "Rotation_i.txt" files
+    # delete the crash journal ("Rotation_i.txt" files)
     ################################################################################################  
     motif = os.path.join(save_path, "Rotation_*.txt")
     fichiers = glob.glob(motif)
@@ -729,27 +566,170 @@ def Rotation_VNA_ESP(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.
         os.remove(fichier)
     return sortie
 
-def init_bal(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "GPIB1::16::INSTR", "GPIB1::1::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", 140E9, "Comp"]):
-    try:
-        global gene
-        gene = Balayage_2D_VNA_ESP(entree)
-        return True
-    except Exception as e:
-        print(e)
-        return False
+################################################################################################
+# scan sessions (one generator per handle, several scans can run at the same time)
+################################################################################################
+class ScanSession:
+
+    def __init__(self, handle, kind, gene, adresses):
+        """
+        Scan started by ScanRegistry.open: generator advanced one position per step.
+        """
+        self.handle = handle
+        self.kind = kind
+        self.gene = gene
+        self.adresses = adresses
+        self.lock = threading.Lock() # one step at a time for a given scan
+        self.state = "running" # running, done, aborted, error
+        self.points = 0
+        self.debut = time.time()
+        self.fin = None
+        self.frame = None
+        self.erreur = None
+
+    def step(self):
+        with self.lock:
+            if self.state != "running":
+                raise RuntimeError(f"le scan {self.handle} n'est pas en cours ({self.state})")
+            try:
+                self.frame = next(self.gene)
+                self.points += 1
+            except StopIteration as e:
+                if e.value is not None: # final output of the scan (compiled data of a rotation)
+                    self.frame = e.value
+                self.finish("done")
+                raise
+            except Exception as e:
+                self.erreur = f"{type(e).__name__}: {e}"
+                self.finish("error")
+                raise
+            return self.frame
+
+    def finish(self, state):
+        if self.gene is not None:
+            self.gene.close()
+        self.gene, self.state, self.fin = None, state, time.time()
+
+    def stats(self):
+        duree = (self.fin or time.time()) - self.debut
+        return {"handle": self.handle, "kind": self.kind, "state": self.state, "points": self.points, "elapsed": duree,
+                "rate": self.points / duree if duree > 0 else 0.0, "error": self.erreur, "instruments": list(self.adresses)}
+
+class ScanRegistry:
+
+    def __init__(self):
+        """
+        Scans in progress, identified by an integer handle. The instruments of a running scan can't
+        be used by another one.
+        """
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.compteur = itertools.count(1)
+
+    def open(self, kind, entree, journal=False, live="full"):
+        """
+        Starts a scan: the instruments are configured before returning, so that an error of
+        configuration is raised here.
+
+        Parameters
+        ----------
+        kind : string
+            "bal" (Balayage_2D_VNA_ESP) or "rot" (Rotation_VNA_ESP).
+        entree : list
+            Entries of the scan.
+        journal : boolean
+            Crash journal. The default is False.
+        live : string
+            Live images of the planar scan ("full" or "delta"). The default is "full".
+
+        Returns
+        -------
+        handle : integer
+            Handle of the scan, given to step, stats and close.
+
+        """
+        if kind == "bal":
+            adresses = (str(entree[11]), str(entree[12]))
+            gene = Balayage_2D_VNA_ESP(entree, journal=journal, live=live, ready=True)
+        elif kind == "rot":
+            adresses = (str(entree[13]), str(entree[14]))
+            gene = Rotation_VNA_ESP(entree, journal=journal, ready=True)
+        else:
+            raise ValueError(f"type de scan inconnu: {kind}")
+        with self.lock:
+            self.check_free(adresses)
+            session = ScanSession(next(self.compteur), kind, gene, adresses)
+            self.sessions[session.handle] = session
+        try:
+            next(gene) # instruments opened and configured
+        except Exception:
+            session.finish("error")
+            with self.lock:
+                self.sessions.pop(session.handle, None) # the handle has not been given
+            raise
+        return session.handle
+
+    def check_free(self, adresses):
+        """
+        Raises RuntimeError if one of the instruments is used by a running scan.
+        """
+        for session in list(self.sessions.values()):
+            commun = set(adresses) & set(session.adresses)
+            if session.state == "running" and commun:
+                raise RuntimeError(f"{', '.join(sorted(commun))} déjà utilisé par le scan {session.handle}")
+
+    def get(self, handle):
+        try:
+            return self.sessions[int(handle)]
+        except KeyError:
+            raise KeyError(f"scan inconnu: {handle}") from None
+
+    def step(self, handle):
+        return self.get(handle).step()
+
+    def stats(self, handle=None):
+        if handle is None:
+            return [session.stats() for session in list(self.sessions.values())]
+        return self.get(handle).stats()
+
+    def abort(self, handle):
+        session = self.get(handle)
+        with session.lock: # after the step in progress
+            if session.state == "running":
+                session.finish("aborted")
+        return session.stats()
+
+    def close(self, handle):
+        """
+        Aborts the scan if it is still running and forgets its handle.
+        """
+        stats = self.abort(handle)
+        with self.lock:
+            self.sessions.pop(int(handle), None)
+        return stats
+
+REGISTRY = ScanRegistry()
+
+def init_bal(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "GPIB1::16::INSTR", "GPIB1::1::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", 140E9, "Comp"], live="full"):
+    return REGISTRY.open("bal", entree, live=live)
     
-def meas_bal():
-    return next(gene)
+def meas_bal(handle):
+    return REGISTRY.step(handle)
 
 def init_rot(entree = [1, 2, 10, 0, 1, 5, 110E9, 170E9, 201, 1000, "WR6.5_Galaad.csa", "-to+", 140, "GPIB1::16::INSTR", "GPIB1::2::INSTR", "C:\\Users\\Thomas\\Documents\\chahadih\\vna_data_test_galaad", "rot"]):
-    try:
-        global gene
-        gene = Rotation_VNA_ESP(entree)
-        return True
-    except Exception as e:
-        print(e)
-        return False
+    return REGISTRY.open("rot", entree)
     
-def meas_rot():
-    return next(gene)
-        
+def meas_rot(handle):
+    return REGISTRY.step(handle)
+
+def scan_stats(handle=None):
+    return REGISTRY.stats(handle)
+
+def close_scan(handle):
+    return REGISTRY.close(handle)
+
+def close_sessions():
+    for session in REGISTRY.stats():
+        REGISTRY.close(session["handle"]) # scans still registered
+    POOL.close() # sessions opened by move
+    return True
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+
+Asyncio layer of the instrument drivers: the blocking VISA calls of the VNA and ESP wrappers are run
+in an executor (one thread per instrument, so that the commands of a session stay in order) and
+exposed as awaitable operations. A scan can then await the motion of the arm, a sweep and a disk
+flush at the same time, and several benches can share one event loop.
+
+    vna, esp = AsyncVNA(scan.vna), AsyncESP(scan.esp)
+    data = run(scan_points(vna, esp, axis, positions, trace_name, data))
+
+"""
+
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+class AsyncInstrument:
+
+    def __init__(self, driver, executor=None):
+        """
+        Awaitable calls of an instrument driver.
+
+        Parameters
+        ----------
+        driver : VNA or ESP
+            Driver of instruments.py (or any object with write and query methods).
+        executor : concurrent.futures.Executor or None
+            Executor of the blocking calls. The default is None: a thread of its own, so that two
+            instruments are never blocked by each other and the calls of one session are serialized.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.driver = driver
+        self.executor = executor if executor is not None else ThreadPoolExecutor(max_workers=1)
+
+    async def call(self, fonction, *args, **kwargs):
+        """
+        Runs a blocking function in the executor of the instrument and awaits its result.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(fonction, *args, **kwargs))
+
+    async def write(self, commande):
+        return await self.call(self.driver.write, commande)
+
+    async def query(self, commande):
+        return await self.call(self.driver.query, commande)
+
+    async def close(self):
+        await self.call(self.driver.close)
+        self.executor.shutdown(wait=False)
+
+class AsyncVNA(AsyncInstrument):
+
+    async def sweep(self, channel=1, state_avg=False, count_avg=1, trace_name=None):
+        """
+        Awaits the measurement of a position (VNA.sweep).
+        """
+        await self.call(self.driver.sweep, channel, state_avg, count_avg, trace_name)
+
+    async def fetch(self, trace_name, channel=1, delay=1):
+        """
+        Awaits the readout of the traces of the last sweep (VNA.read_traces): array of shape
+        (frequency, trace, 2), the last axis being (magnitude, phase).
+        """
+        return await self.call(self.driver.read_traces, trace_name, channel, delay)
+
+    async def fetch_complex(self, trace_name, channel=1, delay=1):
+        """
+        Awaits the complex data of the traces of the last sweep (VNA.read_traces_complex).
+        """
+        return await self.call(self.driver.read_traces_complex, trace_name, channel, delay)
+
+class AsyncESP(AsyncInstrument):
+
+    async def move(self, axe, movement, absolute=True, units=2, speed=1, accel=5, deccel=5):
+        """
+        Starts the motion of an axis ({axis}PA or {axis}PR) without waiting for its end, after the
+        configuration of the axis (ESP.configure_axis: only the settings that have changed are sent).
+
+        Parameters
+        ----------
+        axe : integer or string
+            ESP axis number.
+        movement : integer or floating
+            Target position (absolute) or displacement (relative), in the unit of the axis.
+        absolute : boolean
+            Absolute or relative motion. The default is True.
+        units : integer
+            Unit of the axis (see Balayage2D_Rotation_VNA_ESP.move). The default is 2.
+        speed : integer
+            Speed mode of the axis (1 = slow, 2 = medium speed, 3 = fast). The default is 1.
+        accel : integer or floating
+            Acceleration of the axis. The default is 5.
+        deccel : integer or floating
+            Deceleration of the axis. The default is 5.
+
+        Returns
+        -------
+        None.
+
+        """
+        speed_mode = {1: "JW5", 2: "JH10", 3: "VU15"}[speed]
+        commande = f'{axe}PA{movement}' if absolute else f'{axe}PR{"+" if float(movement) >= 0 else ""}{movement}'
+        def envoi():
+            with self.driver.batch() as lot: # configuration and move in one line
+                self.driver.configure_axis(lot, axe, units, accel, deccel, speed_mode)
+                lot.write(commande)
+        await self.call(envoi)
+
+    async def wait_settled(self, axes, delay=2, timeout=None, poll=False):
+        """
+        Awaits the end of the motion of the given axes by polling their motion done status
+        ({axis}MD?), the event loop being free between two polls. With the "sleep" profile of the
+        driver, waits delay seconds instead, unless poll is True.
+
+        Parameters
+        ----------
+        axes : integer or string or array of integer or array of string
+            ESP axis number(s).
+        delay : integer or floating
+            Fixed wait (in s) of the "sleep" profile. The default is 2.
+        timeout : integer or floating or None
+            Maximum wait (in s). The default is None (timeout of the profile).
+        poll : boolean
+            Polls MD? whatever the profile (wait before a sweep). The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        profile = self.driver.profile
+        if profile["sleep"] and not poll:
+            await asyncio.sleep(delay)
+            return
+        timeout = profile["timeout"] if timeout is None else timeout
+        debut = time.time()
+        for axe in (axes if isinstance(axes, (list, tuple)) else [axes]):
+            while int(float(await self.query(f'{axe}MD?'))) != 1: # 1 = motion done
+                if time.time() - debut > timeout:
+                    raise TimeoutError(f"l'axe {axe} ne s'est pas arrêté après {timeout} s")
+                await asyncio.sleep(profile["poll"])
+
+    async def move_to(self, axes, positions, absolute=True, **config):
+        """
+        Moves several axes at the same time and awaits the end of all the motions (config: units,
+        speed, accel and deccel of move).
+        """
+        for axe, movement in zip(axes, positions):
+            await self.move(axe, movement, absolute, **config)
+        await self.wait_settled(axes, poll=True)
+
+    async def position(self, axe):
+        """
+        Awaits the actual position of an axis ({axis}TP?).
+        """
+        return float(await self.query(f'{axe}TP?'))
+
+async def flush(fonction, *args, **kwargs):
+    """
+    Runs a writing on the disk in the default executor of the event loop and awaits its end.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fonction, *args, **kwargs))
+
+async def scan_points(vna, esp, axes, positions, trace_name, data, channel=1, state_avg=False, count_avg=1, ecriture=None, units=2, speed=3):
+    """
+    Measures a list of positions. Once the sweep of a position is over, the motion to the next
+    position, the readout of the traces and the writing of the position are awaited together; the
+    next sweep starts when the arm has settled (the readout is done before it, the calls of the VNA
+    being serialized by its executor).
+
+    Parameters
+    ----------
+    vna : AsyncVNA
+        VNA of the bench.
+    esp : AsyncESP
+        Motion controller of the bench.
+    axes : array of integer or array of string
+        ESP axis numbers.
+    positions : array
+        Absolute positions, one row per measurement and one column per axis.
+    trace_name : array of string
+        List of S-parameters.
+    data : array of floating
+        Acquisition cube (position, frequency, trace, [magnitude, phase]), filled in place.
+    channel : integer
+        Channel of the measurement. The default is 1.
+    state_avg : boolean
+        Averaging. The default is False.
+    count_avg : integer
+        The number of measures to average on. The default is 1.
+    ecriture : function or None
+        Writing of a position, called with its index once its traces are read (in the default
+        executor). The default is None.
+    units : integer
+        Unit of the axes (see Balayage2D_Rotation_VNA_ESP.move). The default is 2.
+    speed : integer
+        Speed mode of the axes (1 = slow, 2 = medium speed, 3 = fast). The default is 3.
+
+    Returns
+    -------
+    data : array of floating
+        The acquisition cube.
+
+    """
+    async def lecture(k):
+        data[k] = await vna.fetch(trace_name, channel)
+        if ecriture is not None:
+            await flush(ecriture, k)
+
+    taches = []
+    await esp.move_to(axes, positions[0], units=units, speed=speed)
+    try:
+        for k in range(len(positions)):
+            if k > 0:
+                await esp.wait_settled(axes, poll=True) # no sweep before the arm has stopped, whatever the profile
+            await vna.sweep(channel, state_avg, count_avg, trace_name)
+            taches.append(asyncio.ensure_future(lecture(k)))
+            if k < len(positions) - 1:
+                for axe, avant, apres in zip(axes, positions[k], positions[k+1]):
+                    if apres != avant:
+                        await esp.move(axe, apres, units=units, speed=speed)
+            print(f"Mesure {k+1}/{len(positions)}")
+    finally:
+        await asyncio.gather(*taches) # every position has been read and written
+    return data
+
+def run(*coroutines):
+    """
+    Runs coroutines (for example the scans of several benches) together in one event loop and
+    returns their results.
+    """
+    async def ensemble():
+        return await asyncio.gather(*coroutines)
+    return asyncio.run(ensemble())
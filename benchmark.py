@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmarks of the hot paths of the scans: reconstruction of the images (matrix, matrix_single_freq,
+file_to_array), scan path (boustrophedon), final compilation of the files and full scans on the
+simulated instruments. The data is synthetic (gaussian beam) at the sizes of the presets and the
+results are written in a JSON baseline, compared to a previous baseline to catch the regressions.
+
+    python benchmark.py --preset quick --output baseline.json
+    python benchmark.py --preset quick --baseline baseline.json
+
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import numpy as np
+from datetime import datetime
+from scan_data import write_position_file, write_frequency_files, save_scan_store, compile_scan, STORE_EXT
+from xy_and_angular_scan import matrix, matrix_single_freq, file_to_array, boustrophedon, Balayage2D_Rotation_VNA_ESP
+from simulation import SimResourceManager, SimBench, SimClock
+
+# sizes of the benchmarks: grid (positions per axis) and points of the synthetic scan directory,
+# grid and points of the simulated scans, repetitions of each timing. The "full" preset writes
+# about 10 GB (per-position files, compilation files and store).
+PRESETS = {
+    "quick": {"grid": 21, "points": 201, "traces": 4, "scan_grid": 11, "scan_points": 201, "repeat": 3},
+    "medium": {"grid": 101, "points": 801, "traces": 4, "scan_grid": 11, "scan_points": 801, "repeat": 3},
+    "full": {"grid": 201, "points": 1601, "traces": 4, "scan_grid": 21, "scan_points": 1601, "repeat": 1},
+}
+TRACES = ["S12", "S21", "S11", "S22"]
+SPEED = 1000 # acceleration of the time of the simulated instruments
+
+def synthetic_scan(n, points, trace_name, start_freq=140E9, stop_freq=150E9, seed=0):
+    """
+    Synthetic planar scan of n×n positions (steps of 1 mm, boustrophedon order): gaussian beam on
+    the transmission traces, weak reflection on the others, with noise.
+
+    Parameters
+    ----------
+    n : integer
+        Number of positions along each axis.
+    points : integer
+        Number of frequencies.
+    trace_name : array of string
+        List of S-parameters.
+    start_freq : floating
+        First frequency (in Hz). The default is 140E9.
+    stop_freq : floating
+        Last frequency (in Hz). The default is 150E9.
+    seed : integer
+        Seed of the noise. The default is 0.
+
+    Returns
+    -------
+    freq_data : array of floating
+        Frequencies (in Hz).
+    data : array of floating
+        Array of shape (position, frequency, trace, 2), the last axis being (magnitude, phase).
+    parcours : list of tuple of floating
+        Positions (x, y) in the order of the scan.
+
+    """
+    rng = np.random.default_rng(seed)
+    freq_data = np.linspace(start_freq, stop_freq, points)
+    parcours = boustrophedon([-(n-1)/2, -(n-1)/2], [(n-1)/2, (n-1)/2], 1, 1)
+    xy = np.array(parcours, dtype=float)
+    r2 = (xy**2).sum(axis=1)[:, None] * 1E-6
+    k = 2*np.pi*freq_data[None, :] / 299792458
+    w = 0.25E-3 * n
+    cplx = np.empty((len(parcours), points, len(trace_name)), dtype=complex)
+    for t, trace in enumerate(trace_name):
+        if trace in ("S21", "S12"):
+            cplx[:, :, t] = 0.5 * np.exp(-r2/w**2) * np.exp(-1j*k*(0.03 + r2/0.06))
+        else:
+            cplx[:, :, t] = 0.1 * np.exp(-1j*k*0.15)
+    cplx += 1E-3 * (rng.standard_normal(cplx.shape) + 1j*rng.standard_normal(cplx.shape))
+    data = np.stack((20*np.log10(np.abs(cplx)), np.angle(cplx, deg=True)), axis=-1)
+    return freq_data, data, parcours
+
+def write_scan_directory(dossier, freq_data, data, parcours, trace_name, File_name="Compilation"):
+    """
+    Writes a synthetic scan directory as left by balayage_2D with the journal: Balayage_#.txt files,
+    "{File_name}.scan" store and the compilation file of the middle frequency.
+
+    Returns
+    -------
+    fichiers : dictionary
+        Paths of the store ("store") and of the compilation file ("single_freq").
+
+    """
+    os.makedirs(dossier, exist_ok=True)
+    header = ["Frequency (Hz)"]
+    for trace in trace_name:
+        header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
+    for k, (x, y) in enumerate(parcours):
+        write_position_file(os.path.join(dossier, f"Balayage_{k+1}.txt"), header + [f"synthetic_[x_y]=[{x}_{y}]"], freq_data, data[k])
+    coords = [(f"{x:.3f}", f"{y:.3f}") for x, y in parcours]
+    milieu = len(freq_data) // 2
+    store = os.path.join(dossier, f"{File_name}{STORE_EXT}")
+    save_scan_store(store, data, freq_data, trace_name, ["x", "y"], coords, {})
+    single = write_frequency_files(dossier, File_name, freq_data[milieu:milieu+1], data[:, milieu:milieu+1], trace_name, ["x", "y"], coords, lambda freq: "synthetic")[0]
+    return {"store": store, "single_freq": single}
+
+def timeit(fonction, repeat=3):
+    """
+    Times a function without argument.
+
+    Returns
+    -------
+    resultat : dictionary
+        Best and median durations (in s) and number of runs.
+
+    """
+    durees = []
+    for _ in range(max(1, int(repeat))):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return {"best": float(min(durees)), "median": float(np.median(durees)), "runs": len(durees)}
+
+def simulated_scan(methode, n, points, dossier, speed=SPEED, trace_name=TRACES):
+    """
+    Runs a full scan (balayage_2D on n×n positions or rotation on n angles) on the simulated
+    instruments, with the prints of the scan silenced.
+
+    Returns
+    -------
+    resultat : dictionary
+        Duration (in s), number of positions, positions per hour and acceleration of the time.
+
+    """
+    rm = SimResourceManager(bench=SimBench(SimClock(speed)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        scan = Balayage2D_Rotation_VNA_ESP("GPIB0::16::INSTR", "GPIB0::1::INSTR", backend=rm)
+        scan.setup_channel_vna(140E9, 150E9, points, 10000)
+        for i, trace in enumerate(trace_name):
+            scan.add_trace_vna(trace, i+1)
+        debut = time.perf_counter()
+        if methode == "balayage_2D":
+            scan.balayage_2D(trace_name, A=[-(n-1)/2, -(n-1)/2], B=[(n-1)/2, (n-1)/2], count_avg=1, save_path=dossier, File_name="Simulation")
+            positions = n * n
+        else:
+            scan.rotation(trace_name, theta_min=-(n-1)/2, theta_max=(n-1)/2, count_avg=1, save_path=dossier, File_name="Simulation")
+            positions = n
+        duree = time.perf_counter() - debut
+    return {"best": duree, "median": duree, "runs": 1, "positions": positions, "points_per_hour": 3600 * positions / duree, "speed": speed}
+
+def run(preset="quick", dossier=None, scans=True):
+    """
+    Runs the benchmarks of a preset.
+
+    Parameters
+    ----------
+    preset : string
+        Name of a preset of PRESETS. The default is "quick".
+    dossier : string or None
+        Working directory (kept afterwards). The default is None: temporary directory, deleted.
+    scans : boolean
+        Also run the simulated scans. The default is True.
+
+    Returns
+    -------
+    baseline : dictionary
+        Preset, sizes, environment and results ({name: {"best", "median", "runs", ...}}).
+
+    """
+    taille = PRESETS[preset]
+    temporaire = dossier is None
+    dossier = tempfile.mkdtemp(prefix="nfscan_bench_") if temporaire else dossier
+    trace_name = TRACES[:taille["traces"]]
+    n, repeat = taille["grid"], taille["repeat"]
+    resultats = {}
+    try:
+        debut = time.perf_counter()
+        freq_data, data, parcours = synthetic_scan(n, taille["points"], trace_name)
+        fichiers = write_scan_directory(os.path.join(dossier, "scan"), freq_data, data, parcours, trace_name)
+        print(f"Données synthétiques: {n}x{n} positions, {taille['points']} fréquences, {len(trace_name)} traces ({time.perf_counter()-debut:.1f} s)")
+        ligne, colonne = taille["points"] // 2 + 1, 3 # line of the middle frequency, Magnitude_S21 (Balayage_#.txt files, column 4 of the compilation file)
+        resultats["boustrophedon"] = timeit(lambda: boustrophedon([-(n-1)/2, -(n-1)/2], [(n-1)/2, (n-1)/2], 1, 1), repeat)
+        resultats["matrix"] = timeit(lambda: matrix(os.path.join(dossier, "scan"), ligne, colonne), repeat)
+        resultats["file_to_array"] = timeit(lambda: file_to_array(os.path.join(dossier, "scan"), ligne, colonne), repeat)
+        resultats["matrix_single_freq"] = timeit(lambda: matrix_single_freq(fichiers["single_freq"], A=[0, 0], B=[n-1, n-1], pas=1, col=4), repeat)
+        resultats["matrix_single_freq_store"] = timeit(lambda: matrix_single_freq(fichiers["store"], A=[0, 0], B=[n-1, n-1], pas=1, col=4, freq=freq_data[len(freq_data)//2]), repeat)
+        coords = [(f"{x:.3f}", f"{y:.3f}") for x, y in parcours]
+        def compilation(): # end of balayage_2D: store and compilation files written from the cube
+            sortie = os.path.join(dossier, "compile")
+            os.makedirs(sortie, exist_ok=True)
+            save_scan_store(os.path.join(sortie, f"Compilation{STORE_EXT}"), data, freq_data, trace_name, ["x", "y"], coords, {})
+            write_frequency_files(sortie, "Compilation", freq_data, data, trace_name, ["x", "y"], coords, lambda freq: "synthetic")
+        resultats["compile"] = timeit(compilation, repeat)
+        resultats["compile_scan"] = timeit(lambda: compile_scan(os.path.join(dossier, "scan"), "Recompilation"), repeat)
+        for nom, r in resultats.items():
+            print(f"{nom:<26}{r['best']:>10.4f} s")
+        if scans:
+            for methode in ("balayage_2D", "rotation"):
+                nom = f"scan_{methode}"
+                resultats[nom] = simulated_scan(methode, taille["scan_grid"], taille["scan_points"], os.path.join(dossier, nom))
+                print(f"{nom:<26}{resultats[nom]['best']:>10.4f} s ({resultats[nom]['points_per_hour']:.0f} positions/h)")
+    finally:
+        if temporaire:
+            shutil.rmtree(dossier, ignore_errors=True)
+    environnement = {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(), "numpy": np.__version__,
+                     "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+    return {"preset": preset, "sizes": taille, "environment": environnement, "results": resultats}
+
+def compare(baseline, reference, tolerance=0.2, floor=0.01):
+    """
+    Compares the results of two baselines.
+
+    Parameters
+    ----------
+    baseline : dictionary
+        New results (see run).
+    reference : dictionary
+        Previous results.
+    tolerance : floating
+        Relative slowdown accepted. The default is 0.2.
+    floor : floating
+        Absolute slowdown (in s) below which a benchmark is not reported (timing noise of the
+        fastest benchmarks). The default is 0.01.
+
+    Returns
+    -------
+    regressions : list of string
+        Description of each benchmark slower than the reference beyond the tolerance.
+
+    """
+    regressions = []
+    if baseline.get("sizes") != reference.get("sizes"):
+        regressions.append("tailles différentes de la référence, comparaison non significative")
+    for nom, r in baseline["results"].items():
+        ref = reference.get("results", {}).get(nom)
+        if ref is None:
+            continue
+        if "points_per_hour" in r and "points_per_hour" in ref:
+            if r["points_per_hour"] < ref["points_per_hour"] * (1 - tolerance):
+                regressions.append(f"{nom}: {r['points_per_hour']:.0f} positions/h au lieu de {ref['points_per_hour']:.0f}")
+        elif r["best"] > ref["best"] * (1 + tolerance) and r["best"] - ref["best"] > floor:
+            regressions.append(f"{nom}: {r['best']:.3f} s au lieu de {ref['best']:.3f} s")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks des scans planaires et angulaires")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--dir", default=None, help="répertoire de travail (conservé)")
+    parser.add_argument("--output", default=None, help="fichier JSON des résultats")
+    parser.add_argument("--baseline", default=None, help="résultats de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--no-scans", action="store_true", help="sans les scans simulés")
+    args = parser.parse_args()
+    baseline = run(args.preset, args.dir, not args.no_scans)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(baseline, f, indent=1)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(baseline, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Régression: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+
+Checkpoint of a running scan: the acquisition cube is written on disk position by position and a
+small JSON file keeps the arguments of the scan, the setup of the VNA and the number of positions
+already measured, so that an interrupted scan can be resumed.
+
+"""
+
+import os
+import json
+import numpy as np
+
+CKPT_EXT = ".ckpt"
+
+class Checkpoint:
+
+    def __init__(self, save_path, File_name):
+        """
+        Checkpoint files of a scan: "{File_name}.ckpt" (JSON state) and "{File_name}_checkpoint.npy"
+        (acquisition cube).
+
+        Parameters
+        ----------
+        save_path : string
+            Output directory path of the scan.
+        File_name : string
+            Name of the final files of the scan.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.chemin = os.path.join(save_path, f"{File_name}{CKPT_EXT}")
+        self.chemin_cube = os.path.join(save_path, f"{File_name}_checkpoint.npy")
+        self.etat = {}
+        self.cube = None
+
+    def create(self, methode, arguments, setup, shape, date):
+        """
+        Creates the checkpoint of a new scan.
+
+        Parameters
+        ----------
+        methode : string
+            Name of the scan method ("balayage_2D" or "rotation").
+        arguments : dictionary
+            Arguments of the scan method.
+        setup : dictionary
+            Setup of the VNA (state file, channel, traces).
+        shape : tuple of integer
+            Shape of the acquisition cube (position, frequency, trace, 2).
+        date : string
+            Date of the beginning of the scan, written in the final files.
+
+        Returns
+        -------
+        cube : array of floating
+            Acquisition cube mapped on the disk, filled with zeros.
+
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.chemin)), exist_ok=True)
+        self.etat = {"methode": methode, "arguments": arguments, "setup": setup, "shape": list(shape), "date": date, "positions_faites": 0}
+        self.cube = np.lib.format.open_memmap(self.chemin_cube, mode="w+", dtype=float, shape=tuple(shape))
+        self.save()
+        return self.cube
+
+    @classmethod
+    def load(cls, save_path, File_name):
+        """
+        Opens the checkpoint of an interrupted scan.
+
+        Parameters
+        ----------
+        save_path : string
+            Output directory path of the scan.
+        File_name : string
+            Name of the final files of the scan.
+
+        Returns
+        -------
+        checkpoint : Checkpoint
+            Checkpoint, whose cube contains the positions already measured.
+
+        """
+        checkpoint = cls(save_path, File_name)
+        if not os.path.exists(checkpoint.chemin):
+            raise FileNotFoundError(f"aucun scan interrompu: {checkpoint.chemin} n'existe pas")
+        with open(checkpoint.chemin, 'r') as f:
+            checkpoint.etat = json.load(f)
+        checkpoint.cube = np.lib.format.open_memmap(checkpoint.chemin_cube, mode="r+")
+        return checkpoint
+
+    @property
+    def positions_faites(self):
+        return self.etat["positions_faites"]
+
+    def done(self, k):
+        """
+        Records that the positions 0 to k have been measured (their data is flushed on the disk
+        before the state is updated).
+        """
+        self.cube.flush()
+        self.etat["positions_faites"] = max(self.etat["positions_faites"], k + 1)
+        self.save()
+
+    def save(self):
+        """
+        Writes the JSON state (in a temporary file renamed afterwards, so that an interruption during
+        the writing does not corrupt the checkpoint).
+        """
+        temporaire = self.chemin + ".tmp"
+        with open(temporaire, 'w') as f:
+            json.dump(self.etat, f, default=lambda o: o.tolist())
+        os.replace(temporaire, self.chemin)
+
+    def remove(self):
+        """
+        Deletes the checkpoint files once the scan is finished and saved.
+        """
+        self.cube = None
+        for chemin in (self.chemin, self.chemin_cube):
+            if os.path.exists(chemin):
+                os.remove(chemin)
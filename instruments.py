@@ -0,0 +1,926 @@
+# -*- coding: utf-8 -*-
+"""
+
+Driver layer of the VNA and of the ESP motion controller used by the planar and angular scans.
+
+"""
+
+import os
+import time
+import threading
+import numpy as np
+from scan_data import to_complex, to_mag_phase
+
+################################################################################################
+# backend: VISA instruments, or simulated instruments (module simulation)
+################################################################################################
+def resource_manager(backend=None, **options):
+    """
+    Returns the resource manager opening the instruments.
+
+    Parameters
+    ----------
+    backend : string or object or None
+        "visa" (pyvisa.ResourceManager), "sim" (simulation.SimResourceManager) or an object with an
+        open_resource method. The default is None: environment variable NFSCAN_BACKEND, "visa" if
+        it is not set.
+    **options :
+        Options of SimResourceManager (speed, vna_addresses, vna_options, esp_options). The speed
+        can also be given by the environment variable NFSCAN_SIM_SPEED.
+
+    Returns
+    -------
+    rm : resource manager
+        Object with an open_resource method.
+
+    """
+    if backend is None:
+        backend = os.environ.get("NFSCAN_BACKEND", "visa")
+    if hasattr(backend, "open_resource"):
+        return backend
+    if backend == "sim":
+        from simulation import SimResourceManager
+        options.setdefault("speed", float(os.environ.get("NFSCAN_SIM_SPEED", 1)))
+        return SimResourceManager(**options)
+    if backend != "visa":
+        raise ValueError(f"backend inconnu: {backend}")
+    import pyvisa
+    return pyvisa.ResourceManager()
+
+################################################################################################
+# synchronization profiles: "sleep" keeps the fixed waits of the first versions of the scripts,
+# the other profiles wait for the instrument itself (*OPC?, status byte, motion done)
+################################################################################################
+PROFILES = {
+    "opc": {"sleep": False, "method": "opc", "timeout": 60, "poll": 0.02},
+    "stb": {"sleep": False, "method": "stb", "timeout": 60, "poll": 0.02},
+    "sleep": {"sleep": True, "method": "opc", "timeout": 60, "poll": 0.02},
+}
+
+def get_profile(profile):
+    """
+    Returns the synchronization profile of an instrument.
+
+    Parameters
+    ----------
+    profile : string or dictionary
+        Name of a profile of PROFILES ("opc", "stb" or "sleep") or dictionary with the keys "sleep"
+        (boolean, fixed waits), "method" ("opc" or "stb"), "timeout" (s) and "poll" (s).
+
+    Returns
+    -------
+    profile : dictionary
+        Synchronization profile.
+
+    """
+    if isinstance(profile, dict):
+        return dict(PROFILES["opc"], **profile)
+    return dict(PROFILES[profile])
+
+class VNA:
+
+    max_message = 512 # characters of a message of chained commands (see batch)
+    _attributs = ("resource", "transfer", "binary", "readout", "bulk", "mnum", "profile", "averaging", "avg_config", "host_data", "sweep_times", "timing") # attributes of the wrapper, the others are the ones of the VISA session
+
+    def __init__(self, resource, transfer="REAL,64", readout="SDATA", profile="opc", averaging="group"):
+        """
+        Wraps a VISA session of the VNA. Every attribute that is not defined here (write, query,
+        read, close...) is the one of the VISA session, so the wrapper can be used in place of it.
+
+        Parameters
+        ----------
+        resource : pyvisa resource
+            Opened VISA session of the VNA.
+        transfer : string
+            Data format used to read the traces ("REAL,64", "REAL,32" or "ASCii,0"). The binary
+            format is configured on the first readout and the ASCII format is used if the VNA
+            refuses it. The default is "REAL,64".
+        readout : string
+            "SDATA": the complex data of each trace is read once and the magnitude and the phase are
+            computed on the computer. "FDATA": the trace is read twice, formatted by the VNA in MLOG
+            and then in PHAS. The default is "SDATA".
+        profile : string or dictionary
+            Synchronization profile (see get_profile). The default is "opc".
+        averaging : string
+            Averaging mode (see sweep): "group" (averaging of the VNA, the count_avg sweeps are
+            triggered by one group trigger), "host" (count_avg single sweeps read and averaged on the
+            computer) or "loop" (count_avg triggers sent one by one, first versions of the scripts).
+            The default is "group".
+
+        Returns
+        -------
+        None.
+
+        """
+        self.resource = resource
+        self.transfer = transfer
+        self.binary = None # None until the data format has been configured on the VNA
+        self.readout = readout
+        self.bulk = True # False once the VNA has refused the multi-measurement query
+        self.mnum = {} # measurement number of each trace, read once
+        self.profile = get_profile(profile)
+        self.averaging = averaging
+        self.avg_config = None # averaging configured on the VNA: None (unknown), 0 (off) or (channel, count)
+        self.host_data = None # traces averaged on the computer, returned by the next read_traces
+        self.sweep_times = [] # duration (in s) of each measurement (sweep)
+        self.timing = {"transfer": 0.0, "conversion": 0.0} # durations (in s) of the last read_traces
+
+    def __getattr__(self, nom):
+        return getattr(self.resource, nom)
+
+    def __setattr__(self, nom, valeur):
+        if nom in self._attributs:
+            object.__setattr__(self, nom, valeur)
+        else:
+            setattr(self.resource, nom, valeur) # timeout, termination...
+
+    def batch(self):
+        """
+        Returns a CommandBatch of the VNA: the commands are sent as SCPI messages chained with ";:".
+        """
+        return CommandBatch(self, self.max_message, scpi=True)
+
+    def wait(self, timeout=None):
+        """
+        Waits until the VNA has executed all the pending commands (end of the sweeps), either with
+        a *OPC? query or, with the "stb" method, by polling the status byte after a *OPC command
+        (the GPIB bus stays free while the VNA is sweeping).
+
+        Parameters
+        ----------
+        timeout : integer or floating or None
+            Maximum wait (in s). The default is None (timeout of the profile).
+
+        Returns
+        -------
+        None.
+
+        """
+        timeout = self.profile["timeout"] if timeout is None else timeout
+        if self.profile["method"] == "stb":
+            self.resource.write('*CLS')
+            self.resource.write('*ESE 1') # operation complete -> event status bit of the status byte
+            self.resource.write('*OPC')
+            debut = time.time()
+            while not self.resource.read_stb() & 0x20:
+                if time.time() - debut > timeout:
+                    raise TimeoutError(f"le VNA n'a pas terminé après {timeout} s")
+                time.sleep(self.profile["poll"])
+        else:
+            ancien = self.resource.timeout
+            self.resource.timeout = max(ancien or 0, timeout * 1000)
+            try:
+                self.resource.query('*OPC?')
+            finally:
+                self.resource.timeout = ancien
+
+    def pause(self, delay):
+        """
+        Fixed wait of delay seconds with the "sleep" profile, otherwise waits for the VNA (wait).
+        """
+        if self.profile["sleep"]:
+            time.sleep(delay)
+        else:
+            self.wait()
+
+    def sweep(self, channel=1, state_avg=False, count_avg=1, trace_name=None):
+        """
+        Takes the measurement of a position and waits for the end of the sweeps. With averaging the
+        average is restarted so that it is only done at this position:
+        - "group": the averaging of the VNA is cleared (AVERage:CLEar) and the count_avg sweeps are
+          triggered at once (SWEep:MODE GROups), with a single wait at the end;
+        - "host": count_avg single sweeps are triggered and read, the complex data is averaged on the
+          computer and returned by the next read_traces;
+        - "loop": the averaging is turned off and on and count_avg triggers are sent one by one.
+        The duration of the measurement is added to sweep_times.
+
+        Parameters
+        ----------
+        channel : integer
+            Channel of the measurement. The default is 1.
+        state_avg : boolean
+            If True the averaging will be on, if false it will be off. The default is False.
+        count_avg : integer
+            The number of measures to average on. The default is 1.
+        trace_name : array of string or None
+            List of S-parameters, needed by the "host" averaging. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        debut = time.time()
+        count_avg = int(count_avg)
+        if state_avg and self.averaging == "group" and self.avg_config != (channel, count_avg):
+            self.set_group_averaging(channel, count_avg)
+        if state_avg and self.averaging == "group":
+            self.resource.write(f'SENSe{channel}:AVERage:CLEar') # restart the averaging at this position
+            self.resource.write(f'SENSe{channel}:SWEep:MODE GROups') # count_avg sweeps
+            self.wait()
+        elif state_avg and self.averaging == "host":
+            if trace_name is None:
+                raise ValueError("la moyenne sur l'ordinateur nécessite la liste des traces (trace_name)")
+            if self.avg_config != 0:
+                self.resource.write(f'SENSe{channel}:AVERage OFF')
+                self.avg_config = 0
+            somme = 0
+            for z in range(count_avg): # the readout of each sweep waits for the end of the sweep (*WAI)
+                self.resource.write(f'INITiate{channel}:IMMediate')
+                self.resource.write('*WAI')
+                somme = somme + self.read_traces_complex(trace_name, channel)
+            self.host_data = to_mag_phase(somme / count_avg)
+        elif state_avg: # turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position
+            self.resource.write(f'SENSe{channel}:AVERage OFF')
+            self.pause(0.1)
+            self.resource.write(f'SENSe{channel}:AVERage ON')
+            self.pause(1)
+            self.resource.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
+            for z in range(count_avg): # take count_avg measures to correctly average the signals
+                self.resource.write(f'INITiate{channel}:IMMediate')
+                self.resource.write('*WAI')
+            self.avg_config = None
+            if not self.profile["sleep"]:
+                self.wait()
+        else:
+            if self.avg_config != 0:
+                self.resource.write(f'SENSe{channel}:AVERage OFF')
+                self.avg_config = 0
+            self.resource.write(f'INITiate{channel}:IMMediate')
+            self.resource.write('*WAI')
+            if not self.profile["sleep"]:
+                self.wait()
+        self.sweep_times.append(time.time() - debut)
+
+    def set_group_averaging(self, channel=1, count_avg=1):
+        """
+        Configures the averaging of the VNA for the "group" mode: sweep averaging of count_avg sweeps
+        and group trigger of count_avg sweeps. If the VNA reports an error, the "loop" mode is used.
+
+        Parameters
+        ----------
+        channel : integer
+            Channel of the measurement. The default is 1.
+        count_avg : integer
+            The number of measures to average on. The default is 1.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            self.resource.write('*CLS') # clear the error queue so that only the errors of the next commands are read
+            self.resource.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
+            self.resource.write(f'SENSe{channel}:AVERage:MODE SWEep')
+            self.resource.write(f'SENSe{channel}:AVERage ON')
+            self.resource.write(f'SENSe{channel}:SWEep:GROups:COUNt {count_avg}') # sweeps of a group trigger
+            err = self.resource.query('SYSTem:ERRor?')
+            if not err.strip().lstrip('+').startswith('0'):
+                raise ValueError(err.strip())
+            self.avg_config = (channel, count_avg)
+        except Exception as e:
+            print(f"erreur lors de la configuration de la moyenne groupée, moyenne commande par commande: {e}")
+            self.averaging = "loop"
+            self.avg_config = None
+
+    def sweep_report(self, count_avg=1):
+        """
+        Returns a line giving the mean duration of a measurement (effective time per averaged point).
+        """
+        if not self.sweep_times:
+            return "Aucune mesure"
+        return f"Temps moyen par point ({count_avg} mesure(s), moyenne {self.averaging}): {np.mean(self.sweep_times):.3f} s"
+
+    def set_transfer(self, transfer=None):
+        """
+        Configures the data format of the VNA (FORMat:DATA). For the binary formats the byte order
+        is set to little-endian (FORMat:BORDer SWAPped). If the VNA reports an error, the ASCII
+        format is used.
+
+        Parameters
+        ----------
+        transfer : string or None
+            Data format ("REAL,64", "REAL,32" or "ASCii,0"). The default is None (self.transfer).
+
+        Returns
+        -------
+        binary : boolean
+            True if the binary transfer is used.
+
+        """
+        if transfer is not None:
+            self.transfer = transfer
+        self.binary = False
+        if self.transfer.upper().startswith("REAL"):
+            try:
+                self.resource.write('*CLS') # clear the error queue so that only the errors of the next commands are read
+                self.resource.write(f'FORMat:DATA {self.transfer}') # binary block transfer
+                self.resource.write('FORMat:BORDer SWAPped') # little-endian byte order
+                err = self.resource.query('SYSTem:ERRor?')
+                self.binary = err.strip().lstrip('+').startswith('0')
+            except Exception as e:
+                print(f"erreur lors du passage en transfert binaire: {e}")
+        if not self.binary:
+            self.resource.write('FORMat:DATA ASCii,0')
+        return self.binary
+
+    def read_values(self, query):
+        """
+        Sends a data query (for example 'CALCulate1:DATA? FDATA') and returns the values. The binary
+        block is read with query_binary_values; if it cannot be read the VNA is switched back to the
+        ASCII format and the query is sent again. The duration is added to timing["transfer"].
+
+        Parameters
+        ----------
+        query : string
+            SCPI data query.
+
+        Returns
+        -------
+        values : array of floating
+            Values returned by the VNA.
+
+        """
+        debut = time.perf_counter()
+        try:
+            return self._read_values(query)
+        finally:
+            self.timing["transfer"] += time.perf_counter() - debut
+
+    def _read_values(self, query):
+        if self.binary is None:
+            self.set_transfer()
+        if self.binary:
+            datatype = 'f' if self.transfer.endswith("32") else 'd'
+            try:
+                return self.resource.query_binary_values(query, datatype=datatype, is_big_endian=False, container=np.array)
+            except Exception as e:
+                print(f"erreur lors du transfert binaire, passage en ASCII: {e}")
+                try:
+                    self.resource.clear()
+                except Exception:
+                    pass
+                self.set_transfer("ASCii,0")
+        return np.array(self.resource.query_ascii_values(query), dtype=float)
+
+    def check_transfer(self, query, transfer="REAL,64"):
+        """
+        Reads the same data with the ASCII and with the binary transfer and returns the largest
+        difference between the two readouts.
+
+        Parameters
+        ----------
+        query : string
+            SCPI data query.
+        transfer : string
+            Binary data format to check. The default is "REAL,64".
+
+        Returns
+        -------
+        ecart : floating
+            Largest absolute difference between the two readouts.
+
+        """
+        self.set_transfer("ASCii,0")
+        ascii_values = self.read_values(query)
+        if not self.set_transfer(transfer):
+            print("Le VNA refuse le transfert binaire")
+        binary_values = self.read_values(query)
+        return float(np.max(np.abs(ascii_values - binary_values))) if len(ascii_values) else 0.0
+
+    def read_trace(self, trace, channel=1, delay=1):
+        """
+        Reads the magnitude (dB) and the phase (°) of a trace.
+        In "SDATA" mode the complex data is read once (no change of the display format, so no wait);
+        the smoothing and the trace math of the display are not applied. In "FDATA" mode the display
+        format is switched to MLOG and then PHAS, with a wait (pause) after each command.
+
+        Parameters
+        ----------
+        trace : string
+            Name of the measurement (S-parameter).
+        channel : integer
+            Channel of the measurement. The default is 1.
+        delay : integer or floating
+            Wait (in s) after each command in "FDATA" mode with the "sleep" profile. The default is 1.
+
+        Returns
+        -------
+        data : array of floating
+            Array of shape (frequency, 2), the last axis being (magnitude, phase).
+
+        """
+        self.resource.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
+        if self.readout == "SDATA":
+            values = self.read_values(f'CALCulate{channel}:DATA? SDATA') # real and imaginary parts interleaved
+            return to_mag_phase(values[0::2] + 1j*values[1::2])
+        self.pause(delay)
+        self.resource.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
+        self.pause(delay)
+        mag_data = self.read_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
+        self.resource.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
+        self.pause(delay)
+        phase_data = self.read_values(f'CALCulate{channel}:DATA? FDATA')
+        return np.stack((mag_data, phase_data), axis=-1)
+
+    def read_traces(self, trace_name, channel=1, delay=1):
+        """
+        Reads the magnitude (dB) and the phase (°) of several traces of the same sweep (see
+        read_traces_complex). After a "host" averaged sweep, the averaged traces are returned.
+        The durations of the transfer and of the conversion of the data are kept in timing.
+
+        Parameters
+        ----------
+        trace_name : array of string
+            List of S-parameters.
+        channel : integer
+            Channel of the measurements. The default is 1.
+        delay : integer or floating
+            Wait (in s) after each command in "FDATA" mode. The default is 1.
+
+        Returns
+        -------
+        data : array of floating
+            Array of shape (frequency, trace, 2), the last axis being (magnitude, phase).
+
+        """
+        self.timing = {"transfer": 0.0, "conversion": 0.0}
+        if self.host_data is not None:
+            data, self.host_data = self.host_data, None
+            return data
+        debut = time.perf_counter()
+        if self.readout == "SDATA" and self.bulk:
+            data = to_mag_phase(self.read_traces_complex(trace_name, channel, delay))
+        else:
+            data = np.stack([self.read_trace(trace, channel, delay) for trace in trace_name], axis=1)
+        self.timing["conversion"] = time.perf_counter() - debut - self.timing["transfer"] # the rest of the readout
+        return data
+
+    def read_traces_complex(self, trace_name, channel=1, delay=1):
+        """
+        Reads the complex data of several traces of the same sweep.
+        In "SDATA" mode all the traces are read in one query (CALCulate:DATA:MSData?), using the
+        measurement numbers read once at the first call. If the VNA refuses this query, or in
+        "FDATA" mode, the traces are read one by one with read_trace.
+
+        Parameters
+        ----------
+        trace_name : array of string
+            List of S-parameters.
+        channel : integer
+            Channel of the measurements. The default is 1.
+        delay : integer or floating
+            Wait (in s) after each command in "FDATA" mode. The default is 1.
+
+        Returns
+        -------
+        cplx : array of complex
+            Array of shape (frequency, trace).
+
+        """
+        if self.readout == "SDATA" and self.bulk:
+            try:
+                for trace in trace_name:
+                    if (channel, trace) not in self.mnum:
+                        self.resource.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
+                        self.mnum[(channel, trace)] = int(self.resource.query(f'CALCulate{channel}:PARameter:MNUMber?'))
+                numeros = ",".join(str(self.mnum[(channel, trace)]) for trace in trace_name)
+                values = self.read_values(f'CALCulate{channel}:DATA:MSData? "{numeros}"')
+                if len(values) % (2*len(trace_name)) != 0 or len(values) == 0:
+                    raise ValueError(f"{len(values)} valeurs reçues pour {len(trace_name)} traces")
+                values = values.reshape(len(trace_name), -1)
+                return (values[:, 0::2] + 1j*values[:, 1::2]).T
+            except Exception as e:
+                print(f"erreur lors de la lecture groupée des traces, lecture trace par trace: {e}")
+                self.bulk = False
+                try:
+                    self.resource.clear()
+                except Exception:
+                    pass
+        return to_complex(np.stack([self.read_trace(trace, channel, delay) for trace in trace_name], axis=1))
+
+_AXIS_CONFIG = {} # controller -> axis -> setting -> value, shared by the wrappers of the same controller
+
+class ESP:
+
+    max_message = 80 # characters of a command line of the ESP (see batch)
+    _attributs = ("resource", "profile", "config", "group_moves") # attributes of the wrapper, the others are the ones of the VISA session
+
+    def __init__(self, resource, profile="opc"):
+        """
+        Wraps a VISA session of the ESP motion controller. Every attribute that is not defined here
+        (write, query, read, close...) is the one of the VISA session.
+
+        Parameters
+        ----------
+        resource : pyvisa resource
+            Opened VISA session of the ESP.
+        profile : string or dictionary
+            Synchronization profile (see get_profile). The default is "opc".
+
+        Returns
+        -------
+        None.
+
+        """
+        self.resource = resource
+        self.profile = get_profile(profile)
+        self.config = _AXIS_CONFIG.setdefault(getattr(resource, "resource_name", id(resource)), {})
+        self.forget_config() # state of the controller unknown when a session is opened
+        self.group_moves = None # None until a group move has been tried, False if the controller refuses them
+
+    def __getattr__(self, nom):
+        return getattr(self.resource, nom)
+
+    def __setattr__(self, nom, valeur):
+        if nom in self._attributs:
+            object.__setattr__(self, nom, valeur)
+        else:
+            setattr(self.resource, nom, valeur) # timeout, termination...
+
+    def batch(self):
+        """
+        Returns a CommandBatch of the ESP: the commands are sent as lines chained with ";".
+        """
+        return CommandBatch(self, self.max_message)
+
+    def configure_axis(self, lot, axe, units, accel, deccel, speed_mode):
+        """
+        Queues the configuration of an axis: motor on (MO), unit (SN), acceleration (AC),
+        deceleration (AG) and speed mode (JW5, JH10 or VU15). Only the settings that have changed
+        since they were last sent to the controller are queued.
+
+        Parameters
+        ----------
+        lot : CommandBatch
+            Batch of the ESP (see batch).
+        axe : integer or string
+            ESP axis number.
+        units : integer or string
+            Unit of the axis (see Balayage2D_Rotation_VNA_ESP.move).
+        accel : integer or floating or string
+            Acceleration of the axis.
+        deccel : integer or floating or string
+            Deceleration of the axis.
+        speed_mode : string
+            Speed mode command (JW5, JH10 or VU15).
+
+        Returns
+        -------
+        None.
+
+        """
+        connus = self.config.setdefault(str(axe), {})
+        for code, commande in (("MO", "MO"), ("SN", f"SN{units}"), ("AC", f"AC{accel}"), ("AG", f"AG{deccel}"), ("speed", speed_mode)):
+            if connus.get(code) != commande:
+                lot.write(f'{axe}{commande}')
+                connus[code] = commande
+
+    def forget_config(self):
+        """
+        Forgets the configuration of the axes: the next configure_axis sends every setting.
+        """
+        self.config.clear()
+
+    def move_axes(self, axes, positions, absolute=True, velocity=None, acceleration=None, group=1, wait=True, delay=2, timeout=None):
+        """
+        Moves several axes at the same time and waits once for all of them.
+        With a vector velocity the move is a linear interpolated group move (HN, HV, HA, HD, HO,
+        HL): the axes start and arrive together along a straight line. Without it, or if the
+        controller refuses the group commands, every axis is moved at its own speed, all the PA (or
+        PR) commands being sent in one line.
+
+        Parameters
+        ----------
+        axes : array of integer or array of string
+            ESP axis numbers.
+        positions : array of integer or array of floating
+            Target positions (absolute) or displacements (relative), one per axis.
+        absolute : boolean
+            Absolute or relative move. The default is True.
+        velocity : integer or floating or None
+            Vector velocity of the group move. The default is None (no group move).
+        acceleration : integer or floating or None
+            Vector acceleration and deceleration of the group move. The default is None (the one
+            of the controller).
+        group : integer
+            Group number used for the group move. The default is 1.
+        wait : boolean
+            Waits for the end of the move (wait_motion). The default is True.
+        delay : integer or floating
+            Fixed wait (in s) of the "sleep" profile. The default is 2.
+        timeout : integer or floating or None
+            Maximum wait (in s). The default is None (timeout of the profile).
+
+        Returns
+        -------
+        None.
+
+        """
+        axes = [str(axe) for axe in axes]
+        if velocity is not None and self.group_moves is not False:
+            cibles = positions if absolute else [float(self.resource.query(f'{axe}TP?')) + float(p) for axe, p in zip(axes, positions)] # HL takes absolute positions, from the actual ones
+            self.clear_errors() # errors of the previous commands
+            self.resource.write(f'{group}HX') # delete the group if it exists
+            self.clear_errors() # error if it did not exist
+            with self.batch() as lot:
+                lot.write(f'{group}HN{",".join(axes)}')
+                lot.write(f'{group}HV{velocity}')
+                if acceleration is not None:
+                    lot.write(f'{group}HA{acceleration}')
+                    lot.write(f'{group}HD{acceleration}')
+                lot.write(f'{group}HO')
+                erreur = int(float(lot.query('TE?')))
+                if erreur == 0:
+                    lot.write(f'{group}HL{",".join(str(c) for c in cibles)}')
+                    for axe in axes:
+                        lot.write(f'{axe}WS')
+                    lot.write(f'{group}HX') # executed after the move: the axes can be moved one by one again
+            if erreur == 0:
+                self.group_moves = True
+                if wait:
+                    self.wait_motion(axes, delay, timeout)
+                return
+            print(f"Déplacement groupé refusé par le contrôleur (erreur {erreur}), déplacement axe par axe")
+            self.group_moves = False
+            self.clear_errors() # the other errors of the group commands
+        with self.batch() as lot:
+            for axe, position in zip(axes, positions):
+                lot.write(f'{axe}{"PA" if absolute else "PR"}{position}')
+            for axe in axes:
+                lot.write(f'{axe}WS')
+        if wait:
+            self.wait_motion(axes, delay, timeout)
+
+    def clear_errors(self, maximum=10):
+        """
+        Reads the error buffer of the controller (TE?) until it is empty, and returns the codes read.
+        """
+        erreurs = []
+        for _ in range(maximum):
+            erreur = int(float(self.resource.query('TE?')))
+            if erreur == 0:
+                break
+            erreurs.append(erreur)
+        return erreurs
+
+    def wait_motion(self, axes, delay=2, timeout=None):
+        """
+        Waits until the given axes have stopped, by polling the motion done status of each axis
+        ({axis}MD?). With the "sleep" profile, waits delay seconds instead.
+
+        Parameters
+        ----------
+        axes : integer or string or array of integer or array of string
+            ESP axis number(s).
+        delay : integer or floating
+            Fixed wait (in s) of the "sleep" profile. The default is 2.
+        timeout : integer or floating or None
+            Maximum wait (in s). The default is None (timeout of the profile).
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.profile["sleep"]:
+            time.sleep(delay)
+            return
+        timeout = self.profile["timeout"] if timeout is None else timeout
+        debut = time.time()
+        for axe in (axes if isinstance(axes, (list, tuple)) else [axes]):
+            while int(float(self.resource.query(f'{axe}MD?'))) != 1: # 1 = motion done
+                if time.time() - debut > timeout:
+                    raise TimeoutError(f"l'axe {axe} ne s'est pas arrêté après {timeout} s")
+                time.sleep(self.profile["poll"])
+
+    def pause(self, delay):
+        """
+        Fixed wait of delay seconds with the "sleep" profile, otherwise waits until the ESP has
+        executed the pending commands (error status query TE?).
+        """
+        if self.profile["sleep"]:
+            time.sleep(delay)
+        else:
+            self.resource.query('TE?')
+
+################################################################################################
+# command batches: the commands are queued and sent as chained messages, one GPIB transaction per
+# message instead of one per command
+################################################################################################
+class CommandBatch:
+
+    def __init__(self, driver, max_length=80, scpi=False):
+        """
+        Queue of commands of an instrument, flushed as messages of commands separated by ";".
+        A query (or a pause) flushes the queue before being sent, and so does the end of a with
+        block. Used as:
+
+            with vna.batch() as lot:
+                lot.write('SENSe1:FREQuency:STARt 1E9')
+                lot.write('SENSe1:FREQuency:STOP 2E9')
+
+        Parameters
+        ----------
+        driver : VNA or ESP
+            Driver of the instrument.
+        max_length : integer
+            Maximum number of characters of a message. The default is 80.
+        scpi : boolean
+            SCPI commands: the chained commands start with ":" so that each one is read from the
+            root of the command tree. The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.driver = driver
+        self.max_length = max_length
+        self.scpi = scpi
+        self.commandes = []
+        self.messages = 0 # messages sent
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_erreur, erreur, trace):
+        if type_erreur is None:
+            self.flush()
+        else:
+            self.commandes = []
+
+    def _message(self, commandes):
+        if self.scpi:
+            commandes = [c if i == 0 or c.startswith((":", "*")) else ":" + c for i, c in enumerate(commandes)]
+        return ";".join(commandes)
+
+    def write(self, commande):
+        """
+        Queues a command, the queue being flushed first if the message would be too long.
+        """
+        if self.commandes and len(self._message(self.commandes + [commande])) > self.max_length:
+            self.flush()
+        self.commandes.append(commande)
+
+    def flush(self):
+        """
+        Sends the queued commands in one message.
+        """
+        if not self.commandes:
+            return
+        message, self.commandes = self._message(self.commandes), []
+        try:
+            self.driver.write(message)
+        except Exception:
+            if hasattr(self.driver, "forget_config"):
+                self.driver.forget_config() # the settings of the message may not have been applied
+            raise
+        self.messages += 1
+
+    def query(self, commande):
+        self.flush()
+        return self.driver.query(commande)
+
+    def pause(self, delay):
+        self.flush()
+        self.driver.pause(delay)
+
+################################################################################################
+# session pool: the VISA sessions of the LabVIEW functions are opened once and kept open between
+# the calls, their health is checked when they have not been used for a while
+################################################################################################
+class SessionPool:
+
+    def __init__(self, backend=None, check_after=2.0, timeout=30000):
+        """
+        Process-wide pool of open instrument sessions, keyed by VISA address.
+
+        Parameters
+        ----------
+        backend : string or object or None
+            Backend of the sessions (see resource_manager). The default is None.
+        check_after : integer or floating
+            Idle time (in s) after which a session is checked (VE? for the ESP, *OPC? for the VNA,
+            queries without side effect) before being reused. The default is 2.0.
+        timeout : integer
+            VISA timeout (in ms) of the sessions. The default is 30000.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.backend = backend
+        self.check_after = check_after
+        self.timeout = timeout
+        self.sessions = {} # address -> [wrapper, kind, time of the last use]
+        self.lock = threading.Lock() # only around the reads and updates of sessions and verrous
+        self.verrous = {} # address -> lock held during a whole operation (see call)
+        self.rm = None
+
+    def open(self, adresse, kind="esp", profile="opc"):
+        """
+        Opens a new session (the previous session of this address is closed). The connection is
+        made under the lock of the address only, so that the other addresses are not blocked.
+        """
+        with self.address_lock(adresse):
+            self.discard(adresse)
+            with self.lock:
+                if self.rm is None:
+                    self.rm = resource_manager(self.backend)
+            resource = self.rm.open_resource(f'{adresse}')
+            session = ESP(resource, profile=profile) if kind == "esp" else VNA(resource, profile=profile)
+            session.timeout = self.timeout
+            print("Connecté à :", session.query("*IDN?")) # ask identification, only when the session is opened
+            with self.lock:
+                self.sessions[adresse] = [session, kind, time.time()]
+            return session
+
+    def get(self, adresse, kind="esp", profile="opc"):
+        """
+        Returns the open session of an address ("esp" or "vna"), opened or reopened if needed.
+
+        Parameters
+        ----------
+        adresse : string
+            VISA address of the instrument.
+        kind : string
+            "esp" (ESP wrapper) or "vna" (VNA wrapper). The default is "esp".
+        profile : string or dictionary
+            Synchronization profile of a new session. The default is "opc".
+
+        Returns
+        -------
+        session : ESP or VNA
+            Open session.
+
+        """
+        with self.address_lock(adresse): # the check and the reconnection don't block the other addresses
+            with self.lock:
+                entree = self.sessions.get(adresse)
+            if entree is None or entree[1] != kind:
+                return self.open(adresse, kind, profile)
+            session, kind, derniere = entree
+            if time.time() - derniere > self.check_after: # lazy health check
+                try:
+                    session.query('VE?' if kind == "esp" else '*OPC?') # TE? would drop a pending error
+                except Exception as e:
+                    print(f"session {adresse} perdue, reconnexion: {e}")
+                    return self.open(adresse, kind, profile)
+            entree[2] = time.time()
+            return session
+
+    def discard(self, adresse):
+        """
+        Closes and forgets the session of an address (after an error, the next get reconnects).
+        """
+        with self.lock:
+            entree = self.sessions.pop(adresse, None)
+        if entree is not None:
+            try:
+                entree[0].close()
+            except Exception:
+                pass
+
+    def close(self):
+        """
+        Closes all the sessions.
+        """
+        with self.lock:
+            adresses = list(self.sessions)
+        for adresse in adresses:
+            with self.address_lock(adresse): # after the operation in progress
+                self.discard(adresse)
+
+    def address_lock(self, adresse):
+        """
+        Returns the lock of an address: the operations of two threads on the same instrument are
+        not interleaved (reentrant: call holds it around get and open).
+        """
+        with self.lock:
+            return self.verrous.setdefault(adresse, threading.RLock())
+
+    def call(self, adresse, fonction, kind="esp", profile="opc"):
+        """
+        Runs fonction(session) on the session of an address, the lock of the address being held
+        during the whole operation. Only the connection is retried (the session is reopened once if
+        it can't be opened): fonction is run once, since a command (a relative move for example)
+        must not be sent twice. If fonction fails, the session is closed, so that the next call
+        reconnects, and the error is raised.
+        """
+        with self.address_lock(adresse):
+            try:
+                session = self.get(adresse, kind, profile) # health check, nothing has been sent yet
+            except Exception as e:
+                print(f"erreur sur la session {adresse}, reconnexion: {e}")
+                self.discard(adresse)
+                session = self.get(adresse, kind, profile)
+            try:
+                return fonction(session)
+            except Exception:
+                self.discard(adresse)
+                raise
+
+POOL = SessionPool() # sessions shared by the functions called from LabVIEW
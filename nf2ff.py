@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+
+Planar near-field to far-field transform: the fields measured by balayage_2D on a regular grid
+are converted to their plane-wave spectrum (zero-padded 2D FFT) and the spectrum is sampled on the
+(θ, φ) directions of the far-field pattern. All the frequencies of a scan are transformed together.
+
+"""
+
+import os
+import re
+import glob
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from scan_data import ScanStore, STORE_EXT
+
+C0 = 299792458
+
+def load_planar(chemin, trace_name=None, File_name=None, unit=1E-3):
+    """
+    Loads the complex fields of a planar scan on its regular grid.
+
+    Parameters
+    ----------
+    chemin : string
+        Path of a {File_name}.scan store, or of the directory of the scan (store, or
+        "{File_name}_{f}GHz.txt" files if there is no store).
+    trace_name : array of string or None
+        S-parameters to load. The default is None (all the traces of the scan).
+    File_name : string or None
+        Name of the files of the scan when the directory contains several scans. The default is None.
+    unit : floating
+        Length (in m) of the unit of the coordinates. The default is 1E-3 (mm).
+
+    Returns
+    -------
+    scan : dictionary
+        "freq_data" (Hz), "trace_name", "x" and "y" (coordinates of the grid in m) and "field"
+        (complex array of shape (frequency, trace, y, x), 0 where no position has been measured).
+
+    """
+    if os.path.isdir(chemin):
+        chemin = _store_path(chemin, File_name) or chemin
+    if chemin.endswith(STORE_EXT):
+        store = ScanStore(chemin)
+        if store.coord_names != ["x", "y"]:
+            raise ValueError(f"{chemin} n'est pas un scan planaire")
+        noms = list(store.trace_name) if trace_name is None else list(trace_name)
+        cube = store.cube()[:, :, [store.trace_name.index(t) for t in noms]] # (position, frequency, trace)
+        coords = np.array(store.coords, dtype=float)
+        freq_data = store.freq_data
+    else:
+        cube, coords, freq_data, noms = _load_text(chemin, trace_name, File_name)
+    x, y, ix, iy = _grid(coords)
+    field = np.zeros((len(freq_data), len(noms), len(y), len(x)), dtype=complex)
+    field[:, :, iy, ix] = cube.transpose(1, 2, 0)
+    return {"freq_data": np.asarray(freq_data, dtype=float), "trace_name": noms, "x": x * unit, "y": y * unit, "field": field}
+
+def _grid(coords):
+    # regular grid of the positions: coordinates along x and y and indices of each position
+    x, ix = np.unique(np.round(coords[:, 0], 9), return_inverse=True)
+    y, iy = np.unique(np.round(coords[:, 1], 9), return_inverse=True)
+    for axe, nom in ((x, "x"), (y, "y")):
+        if len(axe) > 2 and not np.allclose(np.diff(axe), axe[1] - axe[0], rtol=1E-3):
+            raise ValueError(f"la grille n'est pas régulière selon {nom}")
+    return x, y, ix.ravel(), iy.ravel()
+
+def _store_path(chemin, File_name=None):
+    # {File_name}.scan store of a scan directory, None if there is none
+    if chemin.endswith(STORE_EXT):
+        return chemin
+    stores = sorted(glob.glob(os.path.join(chemin, f"{File_name or '*'}{STORE_EXT}")))
+    return stores[0] if stores else None
+
+def _load_text(dossier, trace_name, File_name):
+    # "{File_name}_{f}GHz.txt" files: one line per position, magnitude (dB) and phase (°) of each trace
+    motif = re.compile(rf"{re.escape(File_name) if File_name else '.+'}_(\d+\.\d+)GHz\.txt$")
+    fichiers = sorted([f for f in os.listdir(dossier) if motif.match(f)], key=lambda f: float(motif.match(f).group(1)))
+    if not fichiers:
+        raise FileNotFoundError(f"aucun fichier de scan dans {dossier}")
+    with open(os.path.join(dossier, fichiers[0]), 'r') as f:
+        header = f.readline().rstrip("\n").split("\t")
+    traces = [h[len("Magnitude_"):] for h in header if h.startswith("Magnitude_")]
+    noms = traces if trace_name is None else list(trace_name)
+    colonnes = [c for t in noms for c in (2 + 2*traces.index(t), 3 + 2*traces.index(t))]
+    tables = [np.loadtxt(os.path.join(dossier, f), delimiter="\t", skiprows=1, usecols=[0, 1] + colonnes, ndmin=2) for f in fichiers]
+    valeurs = np.stack([t[:, 2:] for t in tables], axis=1).reshape(len(tables[0]), len(fichiers), len(noms), 2)
+    cube = 10**(valeurs[..., 0]/20) * np.exp(1j*np.deg2rad(valeurs[..., 1]))
+    freq_data = np.array([float(motif.match(f).group(1)) * 1E9 for f in fichiers])
+    return cube, tables[0][:, :2], freq_data, noms
+
+def plane_wave_spectrum(field, dx, dy, pad=2, x0=0.0, y0=0.0):
+    """
+    Plane-wave spectrum of fields sampled on a regular grid (zero-padded 2D FFT on the last two axes).
+
+    Parameters
+    ----------
+    field : array of complex
+        Fields, array of shape (..., y, x).
+    dx : floating
+        Step of the grid along x (in m).
+    dy : floating
+        Step of the grid along y (in m).
+    pad : integer or floating
+        Zero-padding factor: the FFT size is the power of two at least pad times the number of
+        positions along each axis. The default is 2.
+    x0 : floating
+        Coordinate along x (in m) of the first position of the grid. The default is 0.0.
+    y0 : floating
+        Coordinate along y (in m) of the first position of the grid. The default is 0.0.
+
+    Returns
+    -------
+    kx : array of floating
+        Wavenumbers along x (in rad/m), increasing.
+    ky : array of floating
+        Wavenumbers along y (in rad/m), increasing.
+    spectrum : array of complex
+        Spectrum, array of shape (..., ky, kx), relative to the origin of the coordinates (smooth
+        when the antenna is near the origin, which keeps the interpolation accurate).
+
+    """
+    ny, nx = field.shape[-2:]
+    Ny = int(2**np.ceil(np.log2(max(pad * ny, 2))))
+    Nx = int(2**np.ceil(np.log2(max(pad * nx, 2))))
+    spectrum = np.fft.ifft2(field, s=(Ny, Nx), axes=(-2, -1)) * (Nx * Ny * dx * dy) # ∫∫ E exp(+j(kx x + ky y)) dx dy
+    kx = 2*np.pi * np.fft.fftshift(np.fft.fftfreq(Nx, dx))
+    ky = 2*np.pi * np.fft.fftshift(np.fft.fftfreq(Ny, dy))
+    spectrum = np.fft.fftshift(spectrum, axes=(-2, -1)) * np.exp(1j*(ky[:, None]*y0 + kx[None, :]*x0))
+    return kx, ky, spectrum
+
+def _bilinear(spectrum, kx, ky, kx_val, ky_val):
+    # spectrum (frequency, trace, ky, kx) sampled at (kx_val, ky_val) of shape (frequency, θ, φ)
+    u = (kx_val - kx[0]) / (kx[1] - kx[0])
+    v = (ky_val - ky[0]) / (ky[1] - ky[0])
+    dedans = (u >= 0) & (u <= len(kx) - 1) & (v >= 0) & (v <= len(ky) - 1)
+    i0 = np.clip(np.floor(u).astype(int), 0, len(kx) - 2)
+    j0 = np.clip(np.floor(v).astype(int), 0, len(ky) - 2)
+    a = np.clip(u - i0, 0, 1)[..., None]
+    b = np.clip(v - j0, 0, 1)[..., None]
+    f = np.arange(spectrum.shape[0])[:, None, None]
+    valeurs = ((1-a)*(1-b)*spectrum[f, :, j0, i0] + a*(1-b)*spectrum[f, :, j0, i0+1]
+               + (1-a)*b*spectrum[f, :, j0+1, i0] + a*b*spectrum[f, :, j0+1, i0+1]) # (frequency, θ, φ, trace)
+    valeurs[~dedans] = np.nan # direction outside of the spectrum of the grid (step larger than λ/2)
+    return valeurs
+
+def far_field(field, freq_data, x, y, theta=None, phi=(0, 90), pad=2, batch=64, probe=None):
+    """
+    Far-field patterns of planar near-field scans, for all the frequencies in one call.
+
+    Parameters
+    ----------
+    field : array of complex
+        Fields, array of shape (frequency, trace, y, x) (see load_planar).
+    freq_data : array of floating
+        Frequencies (in Hz).
+    x : array of floating
+        Coordinates of the grid along x (in m, regular).
+    y : array of floating
+        Coordinates of the grid along y (in m, regular).
+    theta : array of floating or None
+        Angles θ (in degrees, from the normal of the scan plane, signed). The default is None
+        (-90° to 90° by steps of 1°).
+    phi : array of floating
+        Angles φ (in degrees, from the x-axis) of the cuts. The default is (0, 90).
+    pad : integer or floating
+        Zero-padding factor of the FFT. The default is 2.
+    batch : integer
+        Number of frequencies transformed together (bounds the memory used). The default is 64.
+    probe : function or None
+        Probe correction: function probe(freq_data, theta, phi) returning the far-field pattern of
+        the probe (complex, broadcastable to (frequency, θ, φ), angles in degrees) by which the
+        pattern is divided. It must be defined at the top level of a module to be used by
+        batch_transform with processes. The default is None (no correction).
+
+    Returns
+    -------
+    theta : array of floating
+        Angles θ (in degrees).
+    phi : array of floating
+        Angles φ (in degrees).
+    pattern : array of complex
+        Far field (without the exp(-jkr)/r factor), array of shape (frequency, trace, θ, φ). NaN
+        where the direction is not covered by the spectrum of the grid.
+
+    """
+    theta = np.arange(-90, 91, 1.0) if theta is None else np.asarray(theta, dtype=float)
+    phi = np.atleast_1d(np.asarray(phi, dtype=float))
+    freq_data = np.asarray(freq_data, dtype=float)
+    dx = x[1] - x[0] if len(x) > 1 else 1.0
+    dy = y[1] - y[0] if len(y) > 1 else 1.0
+    if 2 * max(dx, dy) > C0 / freq_data.max():
+        print(f"Attention: pas de {max(dx, dy)*1E3:.3f} mm supérieur à λ/2 à {freq_data.max()/1E9:.3f} GHz, diagramme tronqué")
+    t, p = np.meshgrid(np.deg2rad(theta), np.deg2rad(phi), indexing="ij")
+    pattern = np.empty((len(freq_data), field.shape[1], len(theta), len(phi)), dtype=complex)
+    for debut in range(0, len(freq_data), max(1, int(batch))):
+        bloc = slice(debut, debut + max(1, int(batch)))
+        kx, ky, spectrum = plane_wave_spectrum(field[bloc], dx, dy, pad, x[0], y[0])
+        k = (2*np.pi * freq_data[bloc] / C0)[:, None, None]
+        kx_val, ky_val = k * np.sin(t) * np.cos(p), k * np.sin(t) * np.sin(p)
+        valeurs = _bilinear(spectrum, kx, ky, kx_val, ky_val)
+        valeurs *= (1j * k * np.cos(t) / (2*np.pi))[..., None] # obliquity factor
+        pattern[bloc] = valeurs.transpose(0, 3, 1, 2)
+    if probe is not None:
+        pattern /= np.broadcast_to(probe(freq_data, theta, phi), (len(freq_data), len(theta), len(phi)))[:, None]
+    return theta, phi, pattern
+
+def pattern_db(pattern, normalize=True):
+    """
+    Magnitude (in dB) of far-field patterns, normalized to the maximum of each frequency and trace.
+    """
+    db = 20*np.log10(np.maximum(np.abs(pattern), 1E-30))
+    if normalize:
+        db = db - np.nanmax(db, axis=(-2, -1), keepdims=True)
+    return db
+
+def transform(chemin, trace_name=None, File_name=None, theta=None, phi=(0, 90), pad=2, unit=1E-3, batch=64, probe=None):
+    """
+    Far-field patterns of a planar scan saved by balayage_2D (see load_planar and far_field).
+
+    Returns
+    -------
+    resultat : dictionary
+        "freq_data", "trace_name", "theta", "phi" and "pattern" (complex array of shape (frequency,
+        trace, θ, φ)).
+
+    """
+    scan = load_planar(chemin, trace_name, File_name, unit)
+    theta, phi, pattern = far_field(scan["field"], scan["freq_data"], scan["x"], scan["y"], theta, phi, pad, batch, probe)
+    return {"freq_data": scan["freq_data"], "trace_name": scan["trace_name"], "theta": theta, "phi": phi, "pattern": pattern}
+
+def save_far_field(save_path, File_name, resultat):
+    """
+    Writes the far-field patterns in "{File_name}_farfield.npz" (arrays of transform).
+
+    Returns
+    -------
+    chemin : string
+        Path of the written file.
+
+    """
+    os.makedirs(save_path, exist_ok=True)
+    chemin = os.path.join(save_path, f"{File_name}_farfield.npz")
+    np.savez(chemin, **{cle: np.asarray(valeur) for cle, valeur in resultat.items()})
+    return chemin
+
+################################################################################################
+# batch processing: frequency planes of one or several scans spread over a pool of workers,
+# read from the stores block by block
+################################################################################################
+def _transform_block(chemin, freq_idx, trace_name, theta, phi, pad, unit, probe):
+    # far field of a block of frequencies of a store (run by a worker)
+    store = ScanStore(chemin)
+    x, y, ix, iy = _grid(np.array(store.coords, dtype=float))
+    traces = [store.trace_name.index(t) for t in trace_name]
+    field = np.zeros((len(freq_idx), len(traces), len(y), len(x)), dtype=complex)
+    for n, idx in enumerate(freq_idx): # only the chunks of these frequencies are read
+        field[n][:, iy, ix] = store.frequency(idx)[:, traces].T
+    return far_field(field, store.freq_data[freq_idx], x * unit, y * unit, theta, phi, pad, len(freq_idx), probe)[2]
+
+def batch_transform(chemins, trace_name=None, theta=None, phi=(0, 90), pad=2, unit=1E-3, probe=None, workers=None, executor="process", block=8, save_path=None):
+    """
+    Far-field patterns of all the frequencies of one or several planar scans, computed by a pool of
+    workers. The tasks (blocks of frequencies of every scan) are all submitted at once, so that the
+    workers are kept busy across the scans, and their results are collected as they complete. Each
+    worker reads only the planes of its block from the {File_name}.scan store (a store is never
+    loaded at once).
+
+    Parameters
+    ----------
+    chemins : string or list of string
+        {File_name}.scan stores or directories of scans.
+    trace_name : array of string or None
+        S-parameters to transform. The default is None (all the traces of each scan).
+    theta, phi, pad, unit, probe :
+        See far_field and load_planar.
+    workers : integer or None
+        Number of workers. The default is None (number of processors).
+    executor : string
+        "process" (process pool, the calling script must be protected by
+        if __name__ == "__main__" on Windows) or "thread". The default is "process".
+    block : integer
+        Number of frequencies of a task. The default is 8.
+    save_path : string or None
+        Directory where the "{File_name}_farfield.npz" files are written. The default is None
+        (not written).
+
+    Returns
+    -------
+    resultats : dictionary
+        For each store, the result of transform ("freq_data", "trace_name", "theta", "phi",
+        "pattern") and the throughput ("planes", "seconds": time from the start of the batch to
+        the last block of the store, "planes_per_second").
+
+    """
+    if isinstance(chemins, str):
+        chemins = [chemins]
+    workers = workers or os.cpu_count() or 1
+    pool = (ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor)(max_workers=workers)
+    theta = np.arange(-90, 91, 1.0) if theta is None else np.asarray(theta, dtype=float)
+    phi = np.atleast_1d(np.asarray(phi, dtype=float))
+    resultats = {}
+    debut_total = time.perf_counter()
+    try:
+        scans = {} # store -> result in progress and number of blocks left
+        taches = {} # task -> (store, frequencies of the block)
+        for chemin in chemins:
+            store_path = _store_path(chemin)
+            if store_path is None:
+                raise FileNotFoundError(f"aucun fichier {STORE_EXT} dans {chemin}")
+            store = ScanStore(store_path)
+            noms = list(store.trace_name) if trace_name is None else list(trace_name)
+            n_freq = len(store.freq_data)
+            pattern = np.empty((n_freq, len(noms), len(theta), len(phi)), dtype=complex)
+            resultat = {"freq_data": store.freq_data, "trace_name": noms, "theta": theta, "phi": phi, "pattern": pattern}
+            scans[store_path] = [resultat, 0]
+            for d in range(0, n_freq, block): # every block of every scan is submitted up front
+                bloc = np.arange(d, min(d + block, n_freq))
+                taches[pool.submit(_transform_block, store_path, bloc, noms, theta, phi, pad, unit, probe)] = (store_path, bloc)
+                scans[store_path][1] += 1
+        for tache in as_completed(taches):
+            store_path, bloc = taches.pop(tache)
+            resultat = scans[store_path][0]
+            resultat["pattern"][bloc] = tache.result()
+            scans[store_path][1] -= 1
+            if scans[store_path][1] > 0:
+                continue
+            duree = time.perf_counter() - debut_total # last block of this scan
+            if save_path is not None:
+                save_far_field(save_path, os.path.splitext(os.path.basename(store_path))[0], resultat)
+            planes = len(resultat["freq_data"]) * len(resultat["trace_name"])
+            resultat.update({"planes": planes, "seconds": duree, "planes_per_second": planes / duree})
+            resultats[store_path] = resultat
+            print(f"{os.path.basename(store_path)}: {planes} plans en {duree:.2f} s ({resultat['planes_per_second']:.1f} plans/s)")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    resultats = {store_path: resultats[store_path] for store_path in scans} # order of chemins
+    if len(resultats) > 1:
+        planes = sum(r["planes"] for r in resultats.values())
+        duree = time.perf_counter() - debut_total
+        print(f"Total: {planes} plans en {duree:.2f} s ({planes/duree:.1f} plans/s)")
+    return resultats
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+
+Pipelined acquisition: the readout of the traces of a position and the writing of its files are
+done on worker threads while the arm moves to the next position.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+class Pipeline:
+
+    def __init__(self, workers=2):
+        """
+        Worker threads of a scan. Only one readout can be pending at a time (the VNA keeps a single
+        sweep in memory), the writings are queued.
+
+        Parameters
+        ----------
+        workers : integer
+            Number of worker threads. With 0 every task is done at once in the calling thread
+            (sequential scan). The default is 2.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        self.lecture = None # pending readout
+        self.ecritures = [] # pending writings
+
+    def read(self, lecture, ecriture=None):
+        """
+        Starts the readout of a position. The previous readout must be over (wait_read).
+
+        Parameters
+        ----------
+        lecture : function
+            Readout of the traces (VNA transfer and conversion), without argument.
+        ecriture : function or None
+            Writing of the files of the position, started once the readout is over. The default
+            is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        def tache():
+            lecture()
+            if ecriture is not None:
+                self.write(ecriture)
+        if self.executor is None:
+            tache()
+        else:
+            self.lecture = self.executor.submit(tache)
+
+    def write(self, ecriture):
+        """
+        Queues a writing (function without argument).
+        """
+        if self.executor is None:
+            ecriture()
+        else:
+            self.ecritures.append(self.executor.submit(ecriture))
+
+    def wait_read(self):
+        """
+        Waits for the end of the pending readout: the VNA can be triggered again. The errors of the
+        worker thread are raised here.
+        """
+        if self.lecture is not None:
+            lecture, self.lecture = self.lecture, None
+            lecture.result()
+
+    def close(self):
+        """
+        Waits for all the pending tasks and stops the worker threads. The first error of a task is
+        raised.
+        """
+        if self.executor is None:
+            return
+        try:
+            self.wait_read()
+            for ecriture in self.ecritures:
+                ecriture.result()
+        finally:
+            self.ecritures = []
+            self.executor.shutdown(wait=True)
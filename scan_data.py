@@ -0,0 +1,613 @@
+# -*- coding: utf-8 -*-
+"""
+
+Data handling of the planar and angular scans: parsing of the per-position files
+(Balayage_#.txt / Rotation_#.txt), writing of the per-frequency compilation files and
+binary scan store ({File_name}.scan).
+
+"""
+
+import os
+import re
+import json
+import numpy as np
+from datetime import datetime
+
+def scan_files(dossier, rot=False):
+    """
+    Lists the per-position files of a scan directory, sorted by measurement number.
+
+    Parameters
+    ----------
+    dossier : string
+        Path of the directory containing the data files.
+    rot : boolean
+        If True the functions search for files with the name Rotation_#.txt, and if
+        False, it search for files with the name Balayage_#.txt. The default is False.
+
+    Returns
+    -------
+    fichiers : list of string
+        Names of the files, sorted by their measurement number.
+
+    """
+    motif = r"Rotation_\d+\.txt" if rot else r"Balayage_\d+\.txt"
+    return sorted([f for f in os.listdir(dossier) if re.match(motif, f)], key=lambda x: int(re.findall(r'\d+', x)[0]))
+
+def read_scan_file(chemin):
+    """
+    Reads a single per-position file.
+    Lines that cannot be converted (file truncated by a crash for example) are filled with 0.
+
+    Parameters
+    ----------
+    chemin : string
+        Path of the file.
+
+    Returns
+    -------
+    header : list of string
+        Fields of the first line of the file.
+    values : array of floating
+        Data of the file (one line per frequency, first column is the frequency).
+
+    """
+    with open(chemin, 'r') as f:
+        lignes = f.read().splitlines()
+    header = lignes[0].split('\t') if lignes else []
+    rows = [l.split('\t') for l in lignes[1:] if l.strip()]
+    try:
+        values = np.array(rows, dtype=float)
+    except ValueError:
+        n_col = max((len(r) for r in rows), default=0)
+        values = np.zeros((len(rows), n_col), dtype=float)
+        for i, row in enumerate(rows):
+            for j, v in enumerate(row):
+                try:
+                    values[i, j] = float(v)
+                except ValueError:
+                    pass
+    return header, values.reshape(len(rows), -1)
+
+def parse_position(header, rot=False):
+    """
+    Extracts the position written in the header of a per-position file
+    ("[x_y]=[x_y]" for a planar scan and "theta=θ" for an angular scan).
+
+    Parameters
+    ----------
+    header : list of string
+        Fields of the first line of the file.
+    rot : boolean
+        If True the header is the one of a Rotation_#.txt file. The default is False.
+
+    Returns
+    -------
+    position : tuple of string or None
+        Position of the measurement, None if it is not written in the header.
+
+    """
+    for champ in header:
+        if rot:
+            res = re.search(r"theta=([^_\s]+)$", champ)
+            if res:
+                return (res.group(1),)
+        else:
+            res = re.search(r"\[([^_\[\]]+)_([^_\[\]]+)\]$", champ)
+            if res:
+                return (res.group(1), res.group(2))
+    return None
+
+def load_scan_files(dossier, rot=False):
+    """
+    Loads every per-position file of a scan directory. Each file is opened and parsed only once.
+
+    Parameters
+    ----------
+    dossier : string
+        Path of the directory containing the data files.
+    rot : boolean
+        If True the functions search for files with the name Rotation_#.txt, and if
+        False, it search for files with the name Balayage_#.txt. The default is False.
+
+    Returns
+    -------
+    freq_data : array of floating
+        Frequencies (in Hz) of the sweep.
+    data : array of floating
+        Array of shape (position, frequency, trace, 2), the last axis being (magnitude, phase).
+    trace_name : list of string
+        List of S-parameters, read in the headers.
+    headers : list of list of string
+        Header of each file.
+
+    """
+    fichiers = scan_files(dossier, rot)
+    headers = []
+    tables = []
+    for fichier in fichiers:
+        header, values = read_scan_file(os.path.join(dossier, fichier))
+        headers.append(header)
+        tables.append(values)
+    trace_name = [h[len("Magnitude_"):] for h in (headers[0] if headers else []) if h.startswith("Magnitude_")]
+    points = max((t.shape[0] for t in tables), default=0)
+    data = np.zeros((len(tables), points, len(trace_name), 2), dtype=float)
+    freq_data = np.zeros(points, dtype=float)
+    for idx, values in enumerate(tables):
+        n_col = min(values.shape[1] - 1, 2 * len(trace_name)) if values.size else 0
+        if n_col > 0:
+            bloc = np.zeros((values.shape[0], 2 * len(trace_name)), dtype=float)
+            bloc[:, :n_col] = values[:, 1:1 + n_col]
+            data[idx, :values.shape[0]] = bloc.reshape(values.shape[0], len(trace_name), 2)
+        if values.shape[0] == points and values.shape[1] > 0:
+            freq_data = values[:, 0]
+    return freq_data, data, trace_name, headers
+
+def write_position_file(full_path, header, freq_data, data_pos):
+    """
+    Writes a per-position file (Balayage_#.txt / Rotation_#.txt). These files are only a crash
+    journal of the scan: the data of the scan is kept in memory.
+
+    Parameters
+    ----------
+    full_path : string
+        Path of the file.
+    header : list of string
+        Fields of the first line of the file.
+    freq_data : array of floating
+        Frequencies (in Hz) of the sweep.
+    data_pos : array of floating
+        Array of shape (frequency, trace, 2) measured at this position, the last axis being
+        (magnitude, phase).
+
+    Returns
+    -------
+    None.
+
+    """
+    valeurs = np.asarray(data_pos).reshape(len(freq_data), -1)
+    lignes = ["\t".join(header)]
+    for l in range(len(freq_data)):
+        lignes.append("\t".join([f"{freq_data[l]:.2f}"] + [f"{v:.4f}" for v in valeurs[l]]))
+    with open(full_path, 'w') as f:
+        f.write("\n".join(lignes) + "\n")
+
+def grid_shape(A, B, pas_x, pas_y=None):
+    """
+    Returns the shape of the grid of a planar scan, computed as in boustrophedon.
+
+    Parameters
+    ----------
+    A : array of integer or array of floating
+        Start coordinates of the scan.
+    B : array of integer or array of floating
+        End coordinates of the scan.
+    pas_x : integer or floating
+        Step size of the x-axis.
+    pas_y : integer or floating or None
+        Step size of the y-axis. The default is None (same as pas_x).
+
+    Returns
+    -------
+    shape : tuple of integer
+        Number of lines (positions along y) and of positions along x of each line.
+
+    """
+    pas_y = pas_x if pas_y is None else pas_y
+    num_points_x = int(round(abs(B[0] - A[0]) / pas_x + 1))
+    num_points_y = int(round(abs(B[1] - A[1]) / pas_y + 1))
+    return num_points_y, num_points_x
+
+def serpentine_matrix(values, N):
+    """
+    Rebuilds the image of a serpentine scan from the values measured in the scan order (same layout
+    as matrix: the first line of the scan is the last row, the first position is the last column).
+    Positions that have not been measured yet are set to 0. The values can have extra axes (for
+    example a whole (position, frequency, trace, 2) cube), which are kept after the two axes of the
+    image.
+
+    Parameters
+    ----------
+    values : array of floating
+        Values in the order of the measurements, positions along the first axis.
+    N : integer or tuple of integer
+        Number of positions along each axis of a square grid, or shape (lines, positions per line)
+        of a rectangular grid (see grid_shape).
+
+    Returns
+    -------
+    matrice : array of floating
+        Reconstructed image, array of shape (lines, positions per line, ...).
+
+    """
+    ny, nx = (N, N) if np.ndim(N) == 0 else N
+    values = np.asarray(values)
+    grille = np.zeros((ny * nx,) + values.shape[1:], dtype=values.dtype if values.dtype.kind in "fc" else float)
+    n = min(len(values), ny * nx)
+    grille[:n] = values[:n]
+    grille = grille.reshape((ny, nx) + values.shape[1:])
+    grille[0::2] = grille[0::2, ::-1] # the even lines are scanned from x_min to x_max, the columns go from x_max to x_min
+    return grille[::-1]
+
+class LiveView:
+
+    def __init__(self, N, n_images=4):
+        """
+        Images of a running serpentine scan (same layout as serpentine_matrix), preallocated and
+        updated one cell at a time, so that the cost of the live display of a position does not
+        depend on the size of the grid.
+
+        Parameters
+        ----------
+        N : integer or tuple of integer
+            Number of positions along each axis of a square grid, or shape (lines, positions per
+            line) of a rectangular grid (see grid_shape).
+        n_images : integer
+            Number of images (for example magnitude and phase of each trace). The default is 4.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.ny, self.nx = (N, N) if np.ndim(N) == 0 else N
+        self.buffer = np.zeros((n_images * self.ny, self.nx), dtype=float) # images stacked along the rows
+        self.images = [self.buffer[i*self.ny:(i+1)*self.ny] for i in range(n_images)]
+
+    def cell(self, k):
+        """
+        Returns the (row, column) of the image where the k-th position of the scan is displayed.
+        """
+        ligne, col = divmod(k, self.nx)
+        if ligne % 2 == 0: # lines scanned from x_min to x_max
+            col = self.nx - 1 - col
+        return self.ny - 1 - ligne, col
+
+    def update(self, k, valeurs):
+        """
+        Writes the values of the k-th position in each image.
+
+        Returns
+        -------
+        delta : array of floating
+            Row, column and values of the updated cell.
+
+        """
+        row, col = self.cell(k)
+        self.buffer[row::self.ny, col] = valeurs
+        return np.concatenate(([row, col], valeurs))
+
+def write_frequency_files(save_path, File_name, freq_data, data, trace_name, coord_names, coords, info, note=None):
+    """
+    Writes the "{File_name}_{f}GHz.txt" files (one file per frequency, one line per position)
+    from an array already in memory.
+
+    Parameters
+    ----------
+    save_path : string
+        Output directory path.
+    File_name : string
+        Name of the final files.
+    freq_data : array of floating
+        Frequencies (in Hz) of the sweep.
+    data : array of floating
+        Array of shape (position, frequency, trace, 2), the last axis being (magnitude, phase).
+    trace_name : array of string
+        List of S-parameters.
+    coord_names : list of string
+        Names of the coordinate columns (["x", "y"] or ["theta"]).
+    coords : list of tuple of string
+        Already formatted coordinates of each line of the files. Lines without data are filled with 0.
+    info : function
+        Function returning the description field of the header for a given frequency (in Hz).
+    note : string or None
+        Optional annotation, not written if None. The default is None.
+
+    Returns
+    -------
+    fichiers : list of string
+        Paths of the written files.
+
+    """
+    os.makedirs(save_path, exist_ok=True)
+    n_val = 2 * len(trace_name)
+    zeros = "\t".join(["0.0000"] * n_val)
+    prefixes = ["\t".join(c) for c in coords]
+    fichiers = []
+    for freq_idx, target_frequency in enumerate(freq_data):
+        full_path = os.path.join(save_path, f"{File_name}_{target_frequency/1E9:.3f}GHz.txt")
+        header = list(coord_names)
+        for trace in trace_name:
+            header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
+        header.append(info(target_frequency))
+        if note is not None:
+            header.append(f'note=[{note}]')
+        valeurs = data[:, freq_idx].reshape(data.shape[0], n_val)
+        lignes = ["\t".join(header)]
+        for pos_idx, prefix in enumerate(prefixes):
+            if pos_idx < data.shape[0]:
+                lignes.append(prefix + "\t" + "\t".join([f"{v:.4f}" for v in valeurs[pos_idx]]))
+            else:
+                lignes.append(prefix + "\t" + zeros)
+        with open(full_path, 'w') as f:
+            f.write("\n".join(lignes) + "\n")
+        fichiers.append(full_path)
+    return fichiers
+
+def compile_scan(dossier, File_name="Compilation", rot=False, note=None):
+    """
+    Compiles an existing directory of per-position files (for example the files left behind by an
+    interrupted scan) into the "{File_name}_{f}GHz.txt" files. The positions are read in the
+    headers of the files when they are written there, otherwise the measurement number is used.
+
+    Parameters
+    ----------
+    dossier : string
+        Path of the directory containing the data files.
+    File_name : string
+        Name of the final files. The default is "Compilation".
+    rot : boolean
+        If True the functions search for files with the name Rotation_#.txt, and if
+        False, it search for files with the name Balayage_#.txt. The default is False.
+    note : string or None
+        Optional annotation, not written if None. The default is None.
+
+    Returns
+    -------
+    fichiers : list of string
+        Paths of the written files.
+
+    """
+    freq_data, data, trace_name, headers = load_scan_files(dossier, rot)
+    coords = []
+    for idx, header in enumerate(headers):
+        position = parse_position(header, rot)
+        if position is None:
+            position = (f"{idx + 1}",) if rot else (f"{idx + 1}", "0")
+        coords.append(position)
+    coord_names = ["theta"] if rot else ["x", "y"]
+    date = datetime.now().strftime("%m-%d-%Y")
+    info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq if freq else 0}m'
+    return write_frequency_files(dossier, File_name, freq_data, data, trace_name, coord_names, coords, info, note)
+
+################################################################################################
+# binary scan store
+################################################################################################
+STORE_EXT = ".scan"
+_MAGIC = b"NFSCAN01"
+_ALIGN = 4096
+
+def to_complex(data):
+    """
+    Converts (magnitude in dB, phase in °) values to complex values.
+
+    Parameters
+    ----------
+    data : array of floating
+        Array whose last axis is (magnitude, phase).
+
+    Returns
+    -------
+    cplx : array of complex
+        Complex values, the last axis of data is removed.
+
+    """
+    data = np.asarray(data, dtype=float)
+    return 10**(data[..., 0]/20) * np.exp(1j*np.deg2rad(data[..., 1]))
+
+def to_mag_phase(cplx):
+    """
+    Converts complex values to (magnitude in dB, phase in °) values.
+
+    Parameters
+    ----------
+    cplx : array of complex
+        Complex values.
+
+    Returns
+    -------
+    data : array of floating
+        Array with a new last axis (magnitude, phase).
+
+    """
+    cplx = np.asarray(cplx)
+    mag = 20*np.log10(np.maximum(np.abs(cplx), 1E-30))
+    return np.stack((mag, np.angle(cplx, deg=True)), axis=-1)
+
+def save_scan_store(chemin, data, freq_data, trace_name, coord_names, coords, parameters, chunk=(64, 64)):
+    """
+    Writes a whole scan in a single binary file: a JSON header (parameters of the scan, frequencies,
+    positions) followed by the complex cube stored in (position × frequency) chunks, so that reading
+    one frequency at all positions or one position at all frequencies only touches a few chunks.
+
+    Parameters
+    ----------
+    chemin : string
+        Path of the file (usually "{File_name}.scan").
+    data : array of floating
+        Array of shape (position, frequency, trace, 2), the last axis being (magnitude, phase).
+    freq_data : array of floating
+        Frequencies (in Hz) of the sweep.
+    trace_name : array of string
+        List of S-parameters.
+    coord_names : list of string
+        Names of the coordinates (["x", "y"] or ["theta"]).
+    coords : list of tuple of string
+        Coordinates of each position.
+    parameters : dictionary
+        Parameters of the scan (content of the "{File_name}_parameters.txt" file).
+    chunk : tuple of integer
+        Number of positions and of frequencies in a chunk. The default is (64, 64).
+
+    Returns
+    -------
+    None.
+
+    """
+    cplx = to_complex(data).astype(np.complex64)
+    n_pos, points, n_trace = cplx.shape
+    cp = max(1, min(chunk[0], n_pos))
+    cf = max(1, min(chunk[1], points))
+    n_pc = -(-n_pos // cp)
+    n_fc = -(-points // cf)
+    header = {"shape": [n_pos, points, n_trace], "chunk": [cp, cf], "dtype": "<c8",
+              "freq_data": [float(f) for f in freq_data], "trace_name": list(trace_name),
+              "coord_names": list(coord_names), "coords": [list(c) for c in coords],
+              "parameters": parameters}
+    header = json.dumps(header).encode("utf-8")
+    offset = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+    with open(chemin, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.write(b"\0" * (offset - len(_MAGIC) - 8 - len(header)))
+    tuiles = np.memmap(chemin, dtype="<c8", mode='r+', offset=offset, shape=(n_pc, n_fc, cp, cf, n_trace))
+    grille = np.zeros((n_pc*cp, n_fc*cf, n_trace), dtype=np.complex64)
+    grille[:n_pos, :points] = cplx
+    tuiles[:] = grille.reshape(n_pc, cp, n_fc, cf, n_trace).transpose(0, 2, 1, 3, 4)
+    tuiles.flush()
+    del tuiles
+
+class ScanStore:
+
+    def __init__(self, chemin):
+        """
+        Opens a binary scan store written by save_scan_store. The data is memory-mapped and only the
+        chunks needed by a request are read from the disk.
+
+        Parameters
+        ----------
+        chemin : string
+            Path of the file.
+
+        Returns
+        -------
+        None.
+
+        """
+        with open(chemin, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{chemin} n'est pas un fichier de scan")
+            taille = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(taille).decode("utf-8"))
+        offset = -(-(len(_MAGIC) + 8 + taille) // _ALIGN) * _ALIGN
+        self.chemin = chemin
+        self.shape = tuple(header["shape"])
+        self.chunk = tuple(header["chunk"])
+        self.freq_data = np.array(header["freq_data"], dtype=float)
+        self.trace_name = header["trace_name"]
+        self.coord_names = header["coord_names"]
+        self.coords = [tuple(c) for c in header["coords"]]
+        self.parameters = header["parameters"]
+        n_pos, points, n_trace = self.shape
+        cp, cf = self.chunk
+        self._tuiles = np.memmap(chemin, dtype=header["dtype"], mode='r', offset=offset,
+                                 shape=(-(-n_pos // cp), -(-points // cf), cp, cf, n_trace))
+
+    def freq_index(self, freq):
+        """
+        Returns the index of the frequency of the sweep closest to freq (in Hz).
+        """
+        return int(np.argmin(np.abs(self.freq_data - freq)))
+
+    def frequency(self, freq_idx):
+        """
+        Returns the complex data of one frequency at all positions, array of shape (position, trace).
+        """
+        cp, cf = self.chunk
+        bloc = self._tuiles[:, freq_idx // cf, :, freq_idx % cf, :]
+        return np.array(bloc.reshape(-1, self.shape[2])[:self.shape[0]])
+
+    def position(self, pos_idx):
+        """
+        Returns the complex data of one position at all frequencies, array of shape (frequency, trace).
+        """
+        cp, cf = self.chunk
+        bloc = self._tuiles[pos_idx // cp, :, pos_idx % cp, :, :]
+        return np.array(bloc.reshape(-1, self.shape[2])[:self.shape[1]])
+
+    def cube(self):
+        """
+        Returns the whole complex cube, array of shape (position, frequency, trace).
+        """
+        n_pc, n_fc, cp, cf, n_trace = self._tuiles.shape
+        grille = np.asarray(self._tuiles).transpose(0, 2, 1, 3, 4).reshape(n_pc*cp, n_fc*cf, n_trace)
+        return np.array(grille[:self.shape[0], :self.shape[1]])
+
+    def column(self, col, freq_idx):
+        """
+        Returns, in the scan order, the values of one column of the "{File_name}_{f}GHz.txt" file of
+        the frequency freq_idx (coordinates first, then magnitude and phase of each trace).
+        """
+        n_coord = len(self.coord_names)
+        if col < n_coord:
+            return np.array([float(c[col]) for c in self.coords])
+        trace_idx, kind = divmod(col - n_coord, 2)
+        return to_mag_phase(self.frequency(freq_idx)[:, trace_idx])[:, kind]
+
+def export_store_text(chemin, save_path=None, File_name=None, note=None):
+    """
+    Writes the "{File_name}_{f}GHz.txt" text files from a binary scan store.
+
+    Parameters
+    ----------
+    chemin : string
+        Path of the scan store.
+    save_path : string or None
+        Output directory path. The default is None (directory of the store).
+    File_name : string or None
+        Name of the final files. The default is None (name of the store).
+    note : string or None
+        Optional annotation, not written if None. The default is None.
+
+    Returns
+    -------
+    fichiers : list of string
+        Paths of the written files.
+
+    """
+    store = ScanStore(chemin)
+    if save_path is None:
+        save_path = os.path.dirname(os.path.abspath(chemin))
+    if File_name is None:
+        File_name = os.path.splitext(os.path.basename(chemin))[0]
+    data = to_mag_phase(store.cube())
+    date = datetime.now().strftime("%m-%d-%Y")
+    info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq if freq else 0}m'
+    return write_frequency_files(save_path, File_name, store.freq_data, data, store.trace_name, store.coord_names, store.coords, info, note)
+
+################################################################################################
+# fly scan: regridding of the sweeps taken while the arm is moving
+################################################################################################
+def regrid_line(x_mes, data_mes, x_grid):
+    """
+    Interpolates the measurements of a fly scan line (taken at arbitrary positions while the arm
+    was moving) on the positions of the regular grid. The interpolation is linear on the complex
+    values; outside of the measured positions the closest measurement is used.
+
+    Parameters
+    ----------
+    x_mes : array of floating
+        Positions of the measurements along the line.
+    data_mes : array of floating
+        Measurements, shape (measurement, frequency, trace, [magnitude, phase]).
+    x_grid : array of floating
+        Positions of the grid along the line.
+
+    Returns
+    -------
+    data : array of floating
+        Measurements on the grid, shape (position, frequency, trace, [magnitude, phase]).
+
+    """
+    ordre = np.argsort(x_mes, kind="stable")
+    x_mes = np.asarray(x_mes, dtype=float)[ordre]
+    cplx = to_complex(np.asarray(data_mes)[ordre])
+    x_grid = np.asarray(x_grid, dtype=float)
+    if len(x_mes) == 1:
+        return to_mag_phase(np.repeat(cplx, len(x_grid), axis=0))
+    idx = np.clip(np.searchsorted(x_mes, x_grid), 1, len(x_mes)-1)
+    x0, x1 = x_mes[idx-1], x_mes[idx]
+    w = np.clip((x_grid - x0) / np.where(x1 > x0, x1 - x0, 1), 0, 1) # weight of the next measurement
+    w = w.reshape((-1,) + (1,)*(cplx.ndim-1))
+    return to_mag_phase((1-w)*cplx[idx-1] + w*cplx[idx])
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+
+Dry run of the planar and angular scans: exact list of the positions, prediction of the duration
+(cost model of each phase, calibrated on the "{File_name}_timing.json" files of previous scans) and
+of the size of the files and of the memory used, before the instruments are booked for a night.
+
+"""
+
+import os
+import glob
+import json
+import numpy as np
+from xy_and_angular_scan import boustrophedon, angles
+from scan_timing import PHASES
+
+# cost model of a position, used until the model is calibrated on previous scans (durations in s)
+DEFAULT_MODEL = {
+    "settle": 0.5,          # wait for the arm to stop after a step
+    "move": 0.005,          # move commands
+    "sweep_a": 0.02,        # fixed time of a sweep
+    "sweep_b": 1.2,         # time of a sweep per point / IFBW
+    "transfer": 2E-6,       # transfer time per value (frequency × trace)
+    "conversion": 2E-7,     # conversion time per value
+    "write": 1E-7,          # checkpoint writing time per value
+    "write_journal": 2E-6,  # checkpoint and journal writing time per value
+    "runs": 0,              # number of scans used for the calibration
+}
+WRITE_SPEED = 50E6 # writing speed of the final files (byte/s)
+
+def timing_files(chemins):
+    """
+    Returns the "{File_name}_timing.json" files given directly or contained in directories.
+    """
+    if isinstance(chemins, str):
+        chemins = [chemins]
+    fichiers = []
+    for chemin in chemins:
+        if os.path.isdir(chemin):
+            fichiers.extend(sorted(glob.glob(os.path.join(chemin, "*_timing.json"))))
+        else:
+            fichiers.append(chemin)
+    return fichiers
+
+def calibrate(chemins):
+    """
+    Calibrates the cost model of a position on previous scans: median duration of the moves and of
+    the settling, time of a sweep as a linear function of points/IFBW (fitted when several IFBW have
+    been used) and transfer, conversion and writing times per value.
+
+    Parameters
+    ----------
+    chemins : string or list of string
+        "{File_name}_timing.json" files or directories containing them.
+
+    Returns
+    -------
+    model : dictionary
+        Cost model (same keys as DEFAULT_MODEL).
+
+    """
+    model = dict(DEFAULT_MODEL)
+    mesures = {cle: [] for cle in ("settle", "move", "transfer", "conversion", "write", "write_journal")}
+    balayages = [] # (points / IFBW, duration of a sweep)
+    sans_ifbw = [] # (points, duration of a sweep) when the IFBW is not known
+    runs = 0
+    for fichier in timing_files(chemins):
+        with open(fichier, 'r') as f:
+            timing = json.load(f)
+        resume, context = timing.get("summary", {}), timing.get("context", {})
+        if not context.get("points"):
+            continue
+        runs += 1
+        valeurs = context["points"] * context.get("traces", 1)
+        for phase in ("settle", "move"):
+            if phase in resume:
+                mesures[phase].append(resume[phase]["p50"])
+        for phase in ("transfer", "conversion"):
+            if phase in resume:
+                mesures[phase].append(resume[phase]["p50"] / valeurs)
+        if "write" in resume:
+            mesures["write_journal" if context.get("journal") else "write"].append(resume["write"]["p50"] / valeurs)
+        if "sweep" in resume:
+            par_balayage = resume["sweep"]["p50"] / context.get("count_avg", 1)
+            if context.get("IFBW"):
+                balayages.append((context["points"] / float(context["IFBW"]), par_balayage))
+            else:
+                sans_ifbw.append((context["points"], par_balayage))
+    for cle, valeurs in mesures.items():
+        if valeurs:
+            model[cle] = float(np.median(valeurs))
+    if len({x for x, t in balayages}) >= 2:
+        b, a = np.polyfit([x for x, t in balayages], [t for x, t in balayages], 1)
+        model["sweep_a"], model["sweep_b"] = float(max(a, 0.0)), float(max(b, 0.0))
+    elif balayages or sans_ifbw: # a single point/IFBW ratio: only the time per point/IFBW is fitted
+        x, t = balayages[-1] if balayages else (sans_ifbw[-1][0] / 1000, sans_ifbw[-1][1]) # unknown IFBW: default IFBW of setup_channel_vna
+        model["sweep_a"] = float(min(model["sweep_a"], t))
+        model["sweep_b"] = float((t - model["sweep_a"]) / x)
+    model["runs"] = runs
+    return model
+
+def predict_position(model, points, n_traces, count_avg=1, IFBW=1000, pipeline=True, journal=False, checkpoint=True):
+    """
+    Predicts the duration (in s) of each phase of a position and of the whole position.
+
+    Parameters
+    ----------
+    model : dictionary
+        Cost model (see calibrate).
+    points : integer
+        Number of frequencies of the sweep.
+    n_traces : integer
+        Number of traces.
+    count_avg : integer
+        Number of sweeps of a position. The default is 1.
+    IFBW : integer or floating
+        IF bandwidth (in Hz). The default is 1000.
+    pipeline : boolean
+        Pipelined scan: the readout is done while the arm moves. The default is True.
+    journal : boolean
+        Crash journal written at each position. The default is False.
+    checkpoint : boolean
+        Checkpoint written at each position. The default is True.
+
+    Returns
+    -------
+    phases : dictionary
+        Duration of each phase and of the position ("position").
+
+    """
+    valeurs = points * n_traces
+    phases = {"move": model["move"], "settle": model["settle"],
+              "sweep": count_avg * (model["sweep_a"] + model["sweep_b"] * points / IFBW),
+              "transfer": model["transfer"] * valeurs, "conversion": model["conversion"] * valeurs,
+              "write": (model["write_journal"] if journal else model["write"] if checkpoint else 0.0) * valeurs}
+    lecture = phases["transfer"] + phases["conversion"] + phases["write"]
+    if pipeline: # the readout of a position is done while the arm moves to the next one
+        phases["readout_wait"] = max(0.0, lecture - phases["settle"])
+        phases["position"] = phases["move"] + phases["sweep"] + max(phases["settle"], lecture)
+    else:
+        phases["readout_wait"] = 0.0
+        phases["position"] = phases["move"] + phases["sweep"] + phases["settle"] + lecture
+    return phases
+
+def footprint(coords, points, trace_name, journal=False, checkpoint=True, chunk=(64, 64)):
+    """
+    Predicts the size (in bytes) of the files of a scan and of the memory used.
+
+    Parameters
+    ----------
+    coords : list of tuple of string
+        Formatted coordinates of each position.
+    points : integer
+        Number of frequencies of the sweep.
+    trace_name : array of string
+        List of S-parameters.
+    journal : boolean
+        Crash journal written at each position. The default is False.
+    checkpoint : boolean
+        Checkpoint written at each position. The default is True.
+    chunk : tuple of integer
+        Chunks of the scan store. The default is (64, 64).
+
+    Returns
+    -------
+    disk : dictionary
+        Size of the scan store, of the text files, of the temporary files (checkpoint and journal)
+        and peak size during the scan.
+    memory : dictionary
+        Size of the acquisition cube and peak memory used while saving.
+
+    """
+    n_pos, n_trace = len(coords), len(trace_name)
+    valeurs = n_pos * points * n_trace
+    cp, cf = max(1, min(chunk[0], n_pos)), max(1, min(chunk[1], points))
+    tuiles = -(-n_pos // cp) * cp * -(-points // cf) * cf * n_trace * 8 # complex64, chunks filled with zeros
+    entete = 4096 * -(-(1024 + 12*points + sum(len(c) + 4 for coord in coords for c in coord)) // 4096)
+    ligne = np.mean([sum(len(c) + 1 for c in coord) for coord in coords]) + 2 * n_trace * 9.5 # "-12.3456\t" per value
+    texte = points * (200 + n_pos * ligne)
+    temporaire = (valeurs * 16 if checkpoint else 0) + (n_pos * points * (14 + 2 * n_trace * 9.5) if journal else 0)
+    disk = {"store": int(entete + tuiles), "text": int(texte), "temporary": int(temporaire),
+            "final": int(entete + tuiles + texte), "peak": int(entete + tuiles + texte + temporaire)}
+    cube = valeurs * 16 # float64 (magnitude, phase)
+    sauvegarde = valeurs * 16 + valeurs * 8 + tuiles # complex128, complex64 and chunk grid of the store
+    memory = {"cube": int(cube), "peak": int(cube * (2 if checkpoint else 1) + sauvegarde)}
+    return disk, memory
+
+def _plan(methode, coords, positions, trace_name, count_avg, state_avg, points, IFBW, pipeline, journal, checkpoint, model):
+    if model is None:
+        model = dict(DEFAULT_MODEL)
+    elif not isinstance(model, dict):
+        model = calibrate(model)
+    count_avg = int(count_avg) if state_avg else 1
+    phases = predict_position(model, points, len(trace_name), count_avg, IFBW, pipeline, journal, checkpoint)
+    disk, memory = footprint(coords, points, trace_name, journal, checkpoint)
+    total = len(positions) * phases["position"] + disk["final"] / WRITE_SPEED
+    return {"methode": methode, "positions": positions, "n_positions": len(positions), "points": points,
+            "time": {"phases": phases, "total": total}, "disk": disk, "memory": memory, "model": model}
+
+def plan_balayage_2D(trace_name=["S12","S21","S11","S22"], axis=[2,3], units=2, A=[0,0], B=[5,5], pas_axe1=1, pas_axe2=1, state_avg=True, count_avg=5, save_path="", note="", File_name="Compilation", journal=False, pipeline=True, checkpoint=True, points=201, IFBW=1000, model=None):
+    """
+    Dry run of balayage_2D (same arguments, nothing is sent to the instruments).
+
+    Parameters
+    ----------
+    trace_name, axis, units, A, B, pas_axe1, pas_axe2, state_avg, count_avg, save_path, note, File_name, journal, pipeline, checkpoint :
+        Arguments of balayage_2D.
+    points : integer
+        Number of frequencies of the sweep (setup_channel_vna). The default is 201.
+    IFBW : integer or floating
+        IF bandwidth in Hz (setup_channel_vna). The default is 1000.
+    model : dictionary or string or list of string or None
+        Cost model, or timing files / directories of previous scans to calibrate it on. The default
+        is None (DEFAULT_MODEL).
+
+    Returns
+    -------
+    plan : dictionary
+        "positions" (list of the (x, y) positions in the order of the scan), "n_positions",
+        "time" (duration of each phase of a position and total duration in s), "disk" and
+        "memory" (sizes in bytes, see footprint) and "model".
+
+    """
+    positions = [(float(x), float(y)) for x, y in boustrophedon(A, B, pas_axe1, pas_axe2)]
+    coords = [(f"{x:.3f}", f"{y:.3f}") for x, y in positions]
+    return _plan("balayage_2D", coords, positions, trace_name, count_avg, state_avg, points, IFBW, pipeline, journal, checkpoint, model)
+
+def plan_rotation(trace_name=["S12","S21","S11","S22"], axis=1, units=7, theta_max=10, theta_min=0, sens="-to+", pas=1, state_avg=True, count_avg=5, save_path="", note="", File_name="Compilation", journal=False, pipeline=True, checkpoint=True, points=201, IFBW=1000, model=None):
+    """
+    Dry run of rotation (same arguments, nothing is sent to the instruments). See plan_balayage_2D
+    for the other arguments and the returned plan ("positions" is the list of the angles).
+    """
+    positions = [float(theta) for theta in angles(theta_min, theta_max, pas)]
+    coords = [(f"{theta}",) for theta in positions]
+    return _plan("rotation", coords, positions, trace_name, count_avg, state_avg, points, IFBW, pipeline, journal, checkpoint, model)
+
+def report(plan):
+    """
+    Returns a summary of a plan.
+    """
+    temps = plan["time"]
+    lignes = [f"{plan['methode']}: {plan['n_positions']} positions, {plan['points']} fréquences",
+              f"Durée prévue: {temps['total']/3600:.2f} h ({temps['phases']['position']:.3f} s par position, modèle calibré sur {plan['model']['runs']} scan(s))"]
+    lignes.append("  " + ", ".join(f"{phase}={temps['phases'][phase]*1E3:.1f} ms" for phase in PHASES if phase in temps["phases"]))
+    lignes.append(f"Disque: {plan['disk']['final']/1E6:.1f} Mo de fichiers finaux, {plan['disk']['peak']/1E6:.1f} Mo au maximum pendant le scan")
+    lignes.append(f"Mémoire: {plan['memory']['cube']/1E6:.1f} Mo pour le cube, {plan['memory']['peak']/1E6:.1f} Mo au maximum")
+    return "\n".join(lignes)
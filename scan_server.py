@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+
+Local scan server: a long-running Python process owning the instrument sessions and the scan
+registry of LabVIEW_VNA_ESP, so that LabVIEW, the scripts and the notebooks are thin clients of a
+warm process. The requests and the answers are JSON lines on a local TCP socket.
+
+    python scan_server.py --port 50507
+
+Requests: {"cmd": "start", "kind": "bal" or "rot", "entree": [...], "journal": false, "live": "full"}
+(answer with the "handle" of the scan), {"cmd": "step", "handle": 1} (answer with the "frame" of the
+position, or the final output of the scan and "done": true once it has ended), {"cmd": "status", "handle": 1}
+(all the scans without handle), {"cmd": "abort", "handle": 1}, {"cmd": "fetch", "handle": 1},
+{"cmd": "close", "handle": 1}, {"cmd": "move", "entree": [...]}, {"cmd": "ping"} and {"cmd": "shutdown"}.
+Answers: {"ok": true, ...} or {"ok": false, "error": "..."}. Scans on different instruments run at the
+same time when they are stepped from different connections.
+
+"""
+
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import numpy as np
+
+HOST = "127.0.0.1"
+PORT = 50507
+
+################################################################################################
+# server side
+################################################################################################
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for ligne in self.rfile:
+            if not ligne.strip():
+                continue
+            try:
+                requete = json.loads(ligne)
+                reponse = dict(self.server.dispatch(requete), ok=True)
+            except Exception as e:
+                reponse = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reponse, default=_to_json) + "\n").encode("utf-8"))
+            if reponse.get("shutdown"):
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+def _to_json(objet):
+    if isinstance(objet, np.ndarray):
+        return objet.tolist()
+    if isinstance(objet, np.generic):
+        return objet.item()
+    raise TypeError(f"{type(objet).__name__} non sérialisable")
+
+class ScanServer(socketserver.ThreadingTCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host=HOST, port=PORT):
+        """
+        Local scan server (scans of LabVIEW_VNA_ESP.REGISTRY, sessions of move kept open by the pool).
+
+        Parameters
+        ----------
+        host : string
+            Listening address, local only by default. The default is HOST.
+        port : integer
+            TCP port. The default is PORT.
+
+        Returns
+        -------
+        None.
+
+        """
+        import LabVIEW_VNA_ESP # imported once, by the server only
+        super().__init__((host, port), _Handler)
+        self.lv = LabVIEW_VNA_ESP
+        self.registry = LabVIEW_VNA_ESP.REGISTRY
+        self.debut = time.time()
+
+    def dispatch(self, requete):
+        cmd = requete.get("cmd")
+        handle = requete.get("handle")
+        if cmd == "ping":
+            return {"uptime": time.time() - self.debut}
+        if cmd == "start":
+            handle = self.registry.open(requete.get("kind", "bal"), requete["entree"], requete.get("journal", False), requete.get("live", "full"))
+            return self.registry.stats(handle)
+        if cmd == "step":
+            fin = False
+            try:
+                frame = self.registry.step(handle)
+            except StopIteration as e:
+                frame = e.value if e.value is not None else self.registry.get(handle).frame
+                fin = True
+            reponse = dict(self.registry.stats(handle), done=fin)
+            if requete.get("frame", True):
+                reponse["frame"] = frame
+            return reponse
+        if cmd == "status":
+            return self.registry.stats(handle) if handle is not None else {"scans": self.registry.stats()}
+        if cmd == "abort":
+            return self.registry.abort(handle)
+        if cmd == "fetch":
+            return dict(self.registry.stats(handle), frame=self.registry.get(handle).frame)
+        if cmd == "close":
+            return self.registry.close(handle)
+        if cmd == "move":
+            return {"message": self.lv.move(requete["entree"])}
+        if cmd == "shutdown":
+            self.lv.close_sessions()
+            return {"shutdown": True}
+        raise ValueError(f"commande inconnue: {cmd}")
+
+def serve(host=HOST, port=PORT):
+    """
+    Runs the scan server until a "shutdown" request.
+    """
+    with ScanServer(host, port) as serveur:
+        print(f"Serveur de scan à l'écoute sur {host}:{port}")
+        serveur.serve_forever()
+
+################################################################################################
+# client side (only the standard library and numpy are imported)
+################################################################################################
+class ScanClient:
+
+    def __init__(self, host=HOST, port=PORT, timeout=None):
+        """
+        Client of the scan server (connection kept open between the requests). A request and its
+        answer are not interleaved with the ones of another thread using the same client.
+
+        Parameters
+        ----------
+        host : string
+            Address of the server. The default is HOST.
+        port : integer
+            TCP port of the server. The default is PORT.
+        timeout : floating or None
+            Timeout (in s) of a request. The default is None (no timeout, a step can be long).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.adresse = (host, port)
+        self.timeout = timeout
+        self.socket = None
+        self.fichier = None
+        self.lock = threading.RLock() # one request and its answer at a time
+
+    def request(self, cmd, **arguments):
+        """
+        Sends a request and returns the answer (RuntimeError if the server reports an error).
+        """
+        with self.lock:
+            if self.socket is None:
+                self.socket = socket.create_connection(self.adresse, timeout=self.timeout)
+                self.fichier = self.socket.makefile("rwb")
+            self.fichier.write((json.dumps(dict(arguments, cmd=cmd), default=_to_json) + "\n").encode("utf-8"))
+            self.fichier.flush()
+            ligne = self.fichier.readline()
+            if not ligne:
+                self.close()
+                raise ConnectionError("connexion au serveur de scan fermée")
+        reponse = json.loads(ligne)
+        if not reponse.pop("ok"):
+            raise RuntimeError(reponse["error"])
+        if reponse.get("frame") is not None:
+            reponse["frame"] = np.array(reponse["frame"])
+        return reponse
+
+    def start(self, kind, entree, journal=False, live="full"):
+        return self.request("start", kind=kind, entree=entree, journal=journal, live=live)["handle"]
+
+    def step(self, handle, frame=True):
+        return self.request("step", handle=handle, frame=frame)
+
+    def status(self, handle=None):
+        return self.request("status", handle=handle)
+
+    def abort(self, handle):
+        return self.request("abort", handle=handle)
+
+    def fetch(self, handle):
+        return self.request("fetch", handle=handle)
+
+    def close_scan(self, handle):
+        return self.request("close", handle=handle)
+
+    def move(self, entree):
+        return self.request("move", entree=entree)
+
+    def shutdown(self):
+        return self.request("shutdown")
+
+    def close(self):
+        with self.lock:
+            if self.socket is not None:
+                self.fichier.close()
+                self.socket.close()
+                self.socket = self.fichier = None
+
+################################################################################################
+# thin functions for the Python nodes of LabVIEW (same entries as LabVIEW_VNA_ESP)
+################################################################################################
+_clients = threading.local() # one connection per thread: the scans stepped from different threads run at the same time
+
+def _get_client():
+    if getattr(_clients, "client", None) is None:
+        _clients.client = ScanClient()
+    return _clients.client
+
+def init_bal(entree, live="full"):
+    return _get_client().start("bal", entree, live=live)
+
+def init_rot(entree):
+    return _get_client().start("rot", entree)
+
+def meas_bal(handle):
+    return _get_client().step(handle)["frame"]
+
+def meas_rot(handle):
+    return _get_client().step(handle)["frame"]
+
+def scan_stats(handle=None):
+    return _get_client().status(handle)
+
+def close_scan(handle):
+    return _get_client().close_scan(handle)
+
+def move(entree):
+    return _get_client().move(entree)["message"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur local des scans planaires et angulaires")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+
+Timing of the phases of each position of a scan (move, settling of the arm, sweep, transfer of the
+traces, conversion, writing), kept in a preallocated array and exported next to the parameters
+file of the scan.
+
+"""
+
+import os
+import csv
+import json
+import time
+import numpy as np
+
+PHASES = ("move", "settle", "readout_wait", "sweep", "transfer", "conversion", "write")
+
+class _Chrono:
+
+    __slots__ = ("timer", "k", "j", "debut")
+
+    def __init__(self, timer, k, j):
+        self.timer = timer
+        self.k = k
+        self.j = j
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._add(self.k, self.j, time.perf_counter() - self.debut)
+        return False
+
+class ScanTimer:
+
+    def __init__(self, nb_points, phases=PHASES):
+        """
+        Durations (in s) of the phases of each position of a scan.
+
+        Parameters
+        ----------
+        nb_points : integer
+            Number of positions of the scan.
+        phases : array of string
+            Names of the phases. The default is PHASES: "move" (move commands), "settle" (wait for
+            the arm to stop), "readout_wait" (wait for the readout of the previous position),
+            "sweep" (sweep and averaging), "transfer" (transfer of the traces), "conversion"
+            (conversion of the data) and "write" (writing of the checkpoint and of the journal).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.phases = list(phases)
+        self.index = {phase: j for j, phase in enumerate(self.phases)}
+        self.durees = np.full((int(nb_points), len(self.phases)), np.nan)
+
+    def chrono(self, k, phase):
+        """
+        Context manager timing a phase of the position k (the durations of a phase measured several
+        times for the same position are added).
+        """
+        return _Chrono(self, k, self.index[phase])
+
+    def add(self, k, phase, duree):
+        """
+        Adds a duration (in s) to a phase of the position k.
+        """
+        self._add(k, self.index[phase], duree)
+
+    def _add(self, k, j, duree):
+        ancienne = self.durees[k, j]
+        self.durees[k, j] = duree if ancienne != ancienne else ancienne + duree # ancienne != ancienne: NaN, phase not timed yet
+
+    def summary(self):
+        """
+        Percentiles of the duration of each phase.
+
+        Returns
+        -------
+        resume : dictionary
+            For each timed phase: number of positions, mean, 50th, 90th and 99th percentiles,
+            maximum and total duration (in s).
+
+        """
+        resume = {}
+        for j, phase in enumerate(self.phases):
+            valeurs = self.durees[:, j]
+            valeurs = valeurs[~np.isnan(valeurs)]
+            if len(valeurs) == 0:
+                continue
+            p50, p90, p99 = np.percentile(valeurs, [50, 90, 99])
+            resume[phase] = {"n": int(len(valeurs)), "mean": float(np.mean(valeurs)), "p50": float(p50), "p90": float(p90), "p99": float(p99), "max": float(np.max(valeurs)), "total": float(np.sum(valeurs))}
+        return resume
+
+    def report(self):
+        """
+        Returns the summary as a table (durations in ms, share of the total time of the scan).
+        """
+        resume = self.summary()
+        total = sum(r["total"] for r in resume.values()) or 1.0
+        lignes = [f"{'phase':<14}{'p50 (ms)':>10}{'p90 (ms)':>10}{'p99 (ms)':>10}{'total (s)':>11}{'part':>7}"]
+        for phase, r in resume.items():
+            lignes.append(f"{phase:<14}{r['p50']*1E3:>10.1f}{r['p90']*1E3:>10.1f}{r['p99']*1E3:>10.1f}{r['total']:>11.2f}{100*r['total']/total:>6.1f}%")
+        return "\n".join(lignes)
+
+    def save(self, save_path, File_name, context=None):
+        """
+        Writes the durations of each position in "{File_name}_timing.csv" and the durations with
+        their summary in "{File_name}_timing.json".
+
+        Parameters
+        ----------
+        save_path : string
+            Output directory path.
+        File_name : string
+            Name of the final files of the scan.
+        context : dictionary or None
+            Settings of the scan (number of frequencies, traces, averaging...) written in the JSON
+            file, used to calibrate the scan planner. The default is None.
+
+        Returns
+        -------
+        fichiers : list of string
+            Paths of the written files.
+
+        """
+        os.makedirs(save_path, exist_ok=True)
+        chemin_csv = os.path.join(save_path, f"{File_name}_timing.csv")
+        with open(chemin_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["position"] + [f"{phase} (s)" for phase in self.phases])
+            for k, ligne in enumerate(self.durees):
+                writer.writerow([k+1] + ["" if np.isnan(d) else f"{d:.6f}" for d in ligne])
+        chemin_json = os.path.join(save_path, f"{File_name}_timing.json")
+        with open(chemin_json, 'w') as f:
+            durees = [[None if np.isnan(d) else round(float(d), 6) for d in ligne] for ligne in self.durees]
+            json.dump({"phases": self.phases, "context": context or {}, "summary": self.summary(), "durations": durees}, f, indent=1)
+        return [chemin_csv, chemin_json]
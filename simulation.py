@@ -0,0 +1,616 @@
+# -*- coding: utf-8 -*-
+"""
+
+Simulated VNA and ESP motion controller, used in place of the GPIB instruments to run the scans
+without the bench (benchmarks, tests of the scripts). The instruments answer the SCPI / ESP commands
+used by the scripts with a configurable latency, sweep time and motion speed, and the VNA measures
+the field of a gaussian beam antenna at the position of the arm. The time can be accelerated.
+
+"""
+
+import re
+import time
+import threading
+import numpy as np
+import pyvisa
+
+################################################################################################
+# simulated time
+################################################################################################
+class SimClock:
+
+    def __init__(self, speed=1.0):
+        """
+        Simulated time: speed simulated seconds last one real second.
+
+        Parameters
+        ----------
+        speed : integer or floating
+            Acceleration of the time. The default is 1.0 (real time).
+
+        Returns
+        -------
+        None.
+
+        """
+        self.speed = float(speed)
+        self.origine = time.perf_counter()
+
+    def now(self):
+        """
+        Simulated time (in s).
+        """
+        return (time.perf_counter() - self.origine) * self.speed
+
+    def sleep(self, duree):
+        """
+        Waits duree simulated seconds.
+        """
+        if duree > 0:
+            time.sleep(duree / self.speed)
+
+    def wait_until(self, instant):
+        """
+        Waits until the simulated time instant.
+        """
+        self.sleep(instant - self.now())
+
+################################################################################################
+# antenna under test
+################################################################################################
+class SimBench:
+
+    def __init__(self, clock=None, axes_xy=("2", "3"), axe_theta="1", distance=0.03, w0=3E-3, noise_db=-70, seed=0):
+        """
+        Bench shared by the simulated instruments: positions of the ESP axis and field of a
+        gaussian beam antenna (waist w0) at the distance "distance" of the probe.
+
+        Parameters
+        ----------
+        clock : SimClock or None
+            Simulated time. The default is None (real time).
+        axes_xy : tuple of string
+            ESP axis moving the probe along x and y (in mm). The default is ("2", "3").
+        axe_theta : string
+            ESP axis rotating the antenna (in degrees). The default is "1".
+        distance : floating
+            Distance (in m) between the waist of the antenna and the scan plane. The default is 0.03.
+        w0 : floating
+            Waist (in m) of the gaussian beam. The default is 3E-3.
+        noise_db : integer or floating
+            Noise level (in dB) of a sweep at an IFBW of 1 kHz. The default is -70.
+        seed : integer
+            Seed of the noise. The default is 0.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.clock = clock if clock is not None else SimClock()
+        self.axes_xy = tuple(str(a) for a in axes_xy)
+        self.axe_theta = str(axe_theta)
+        self.distance = distance
+        self.w0 = w0
+        self.noise_db = noise_db
+        self.rng = np.random.default_rng(seed)
+        self.axes = {} # ESP axis of the bench (SimAxis), created when used
+        self.lock = threading.Lock()
+
+    def axe(self, nom):
+        nom = str(nom)
+        if nom not in self.axes:
+            self.axes[nom] = SimAxis(self.clock)
+        return self.axes[nom]
+
+    def field(self, freq_data, instant):
+        """
+        Complex transmission (S21) measured at the simulated time instant (position of the arm at
+        this time) for each frequency.
+        """
+        x = self.axe(self.axes_xy[0]).position(instant) * 1E-3
+        y = self.axe(self.axes_xy[1]).position(instant) * 1E-3
+        theta = np.deg2rad(self.axe(self.axe_theta).position(instant))
+        lbd = 299792458 / np.maximum(np.asarray(freq_data, dtype=float), 1.0)
+        k = 2*np.pi / lbd
+        z = self.distance
+        zr = np.pi * self.w0**2 / lbd
+        w = self.w0 * np.sqrt(1 + (z/zr)**2)
+        rayon = z * (1 + (zr/z)**2)
+        r2 = x**2 + y**2
+        plan = (self.w0/w) * np.exp(-r2/w**2) * np.exp(-1j*(k*z + k*r2/(2*rayon) - np.arctan(z/zr)))
+        angulaire = np.exp(-(theta / (lbd/(np.pi*self.w0)))**2) # far field divergence of the beam
+        return 0.5 * plan * angulaire
+
+    def noise(self, shape, IFBW, n_avg):
+        sigma = 10**(self.noise_db/20) * np.sqrt(IFBW/1000) / np.sqrt(max(n_avg, 1))
+        with self.lock:
+            return sigma * (self.rng.standard_normal(shape) + 1j*self.rng.standard_normal(shape)) / np.sqrt(2)
+
+class SimAxis:
+
+    def __init__(self, clock):
+        """
+        Axis of the ESP: trapezoidal velocity profile between two positions.
+        """
+        self.clock = clock
+        self.vitesse = 5.0 # speed mode (JW, JH or VU): maximum velocity
+        self.va = None # move velocity (VA), kept until it is written again
+        self.acceleration = 5.0
+        self.depart, self.cible = 0.0, 0.0
+        self.t0, self.duree = 0.0, 0.0
+        self.mouvement = (self.velocity(), self.acceleration) # velocity and acceleration of the current move
+
+    def velocity(self):
+        # velocity of a move: VA, capped by the speed mode
+        return self.vitesse if self.va is None else min(self.va, self.vitesse)
+        self.moteur = False
+
+    def profile(self, d):
+        # duration of the move and time of the acceleration ramp for a distance d
+        v, a = self.mouvement
+        if d * a <= v**2: # triangular profile
+            ta = np.sqrt(d / a)
+            return 2*ta, ta
+        ta = v / a
+        return ta + d / v, ta
+
+    def position(self, instant=None):
+        instant = self.clock.now() if instant is None else instant
+        d = abs(self.cible - self.depart)
+        t = instant - self.t0
+        if d == 0 or t >= self.duree:
+            return self.cible
+        if t <= 0:
+            return self.depart
+        duree, ta = self.profile(d)
+        v, a = self.mouvement
+        if t < ta:
+            parcouru = 0.5*a*t**2
+        elif t > duree - ta:
+            parcouru = d - 0.5*a*(duree - t)**2
+        else:
+            parcouru = 0.5*a*ta**2 + min(a*ta, v)*(t - ta)
+        return self.depart + np.sign(self.cible - self.depart) * min(parcouru, d)
+
+    def move_to(self, cible, vitesse=None, acceleration=None):
+        # vitesse and acceleration: profile of a group move (the ones of the axis by default)
+        maintenant = self.clock.now()
+        self.depart = self.position(maintenant)
+        self.cible = float(cible)
+        self.mouvement = (vitesse or self.velocity(), acceleration or self.acceleration)
+        self.t0 = maintenant
+        self.duree = self.profile(abs(self.cible - self.depart))[0] if self.cible != self.depart else 0.0
+
+    def stop(self):
+        self.depart = self.cible = self.position()
+        self.duree = 0.0
+
+    def done(self, instant=None):
+        instant = self.clock.now() if instant is None else instant
+        return instant >= self.t0 + self.duree
+
+    def end(self):
+        return self.t0 + self.duree
+
+################################################################################################
+# SCPI helpers
+################################################################################################
+def _mnemonique(token):
+    # short and long forms of a SCPI mnemonic ("FREQuency" -> ("FREQ", "FREQUENCY"))
+    return "".join(c for c in token if c.isupper() or c == "*"), token.upper()
+
+def scpi_match(header, pattern):
+    """
+    Returns the channel numbers of a SCPI header (command or query) if it matches the pattern (for
+    example scpi_match("SENS1:FREQ:STAR?", "SENSe:FREQuency:STARt") -> [1, 1, 1]), None otherwise.
+    """
+    tokens = header.strip().lstrip(":").rstrip("?").split(":")
+    motifs = pattern.split(":")
+    if len(tokens) != len(motifs):
+        return None
+    numeros = []
+    for token, motif in zip(tokens, motifs):
+        m = re.fullmatch(r"([A-Za-z*]+)(\d*)", token)
+        if m is None or m.group(1).upper() not in _mnemonique(motif):
+            return None
+        numeros.append(int(m.group(2)) if m.group(2) else 1)
+    return numeros
+
+class _SimResource:
+
+    def __init__(self, bench, latency):
+        self.bench = bench
+        self.clock = bench.clock
+        self.latency = latency
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = None
+        self.sortie = [] # answers waiting to be read
+
+    def read(self):
+        self.clock.sleep(self.latency)
+        if not self.sortie:
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return self.sortie.pop(0)
+
+    def query(self, commande):
+        self.write(commande)
+        return self.read()
+
+    def clear(self):
+        self.sortie = []
+
+    def close(self):
+        pass
+
+################################################################################################
+# VNA
+################################################################################################
+class SimVNA(_SimResource):
+
+    def __init__(self, bench, latency=2E-3, sweep_overhead=0.02, sweep_factor=1.2, bus_rate=1E6):
+        """
+        Simulated VNA (subset of the SCPI commands of a PNA used by the scripts).
+
+        Parameters
+        ----------
+        bench : SimBench
+            Bench (time, positions of the arm, antenna).
+        latency : floating
+            Duration (in s) of the processing of a command. The default is 2E-3.
+        sweep_overhead : floating
+            Fixed duration (in s) of a sweep. The default is 0.02.
+        sweep_factor : floating
+            Duration of a sweep per point / IFBW. The default is 1.2.
+        bus_rate : floating
+            Transfer rate (in byte/s) of the bus. The default is 1E6.
+
+        Returns
+        -------
+        None.
+
+        """
+        super().__init__(bench, latency)
+        self.sweep_overhead = sweep_overhead
+        self.sweep_factor = sweep_factor
+        self.bus_rate = bus_rate
+        self.start, self.stop, self.points, self.IFBW = 10E9, 20E9, 201, 1000.0
+        self.mesures = {} # name -> (S-parameter, measurement number)
+        self.selection = None
+        self.format = "MLOG"
+        self.data_format = "ASC"
+        self.swapped = False
+        self.moyenne, self.avg_count, self.n_avg = False, 1, 0
+        self.groupes = 1
+        self.fin = 0.0 # end of the pending sweeps (simulated time)
+        self.instant = 0.0 # middle of the last sweep
+        self.wai = False
+        self.opc = False
+        self.erreurs = []
+
+    # ------------------------------------------------------------------ sweeps
+    def duree_balayage(self):
+        return self.sweep_overhead + self.sweep_factor * self.points / self.IFBW
+
+    def trigger(self, n=1):
+        debut = max(self.clock.now(), self.fin)
+        self.fin = debut + n * self.duree_balayage()
+        self.instant = (debut + self.fin) / 2
+        self.n_avg = min(self.n_avg + n, self.avg_count) if self.moyenne else 1
+
+    def attente(self):
+        # blocking of the commands behind *WAI or *OPC?
+        if self.clock.now() < self.fin and (self.fin - self.clock.now()) / self.clock.speed > self.timeout / 1000:
+            self.clock.sleep(self.timeout / 1000 * self.clock.speed)
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        self.clock.wait_until(self.fin)
+
+    def trace(self, nom):
+        freq = np.linspace(self.start, self.stop, self.points)
+        parametre = self.mesures[nom][0].upper()
+        if parametre in ("S21", "S12"):
+            valeurs = self.bench.field(freq, self.instant)
+        else: # reflection of the ports
+            valeurs = 0.1 * np.exp(-2j*np.pi*freq*1E-9) * (1 + 0.2*np.cos(2*np.pi*freq*3E-10))
+        return valeurs + self.bench.noise(valeurs.shape, self.IFBW, self.n_avg)
+
+    def values(self, requete):
+        # values of a data query, in the order of the VNA
+        if scpi_match(requete.split()[0], "CALCulate:DATA:MSData") is not None:
+            numeros = [int(n) for n in requete.split('"')[1].split(",")]
+            noms = {num: nom for nom, (param, num) in self.mesures.items()}
+            cplx = [self.trace(noms[n]) for n in numeros]
+            return np.concatenate([np.stack((c.real, c.imag), axis=-1).ravel() for c in cplx])
+        cplx = self.trace(self.selection)
+        if requete.split()[-1].upper() == "SDATA":
+            return np.stack((cplx.real, cplx.imag), axis=-1).ravel()
+        if self.format == "PHAS":
+            return np.angle(cplx, deg=True)
+        return 20*np.log10(np.abs(cplx))
+
+    # ------------------------------------------------------------------ commands
+    def write(self, commande):
+        self.clock.sleep(self.latency)
+        if self.wai:
+            self.attente()
+            self.wai = False
+        for partie in commande.split(";"):
+            if partie.strip():
+                self.execute(partie.strip())
+
+    def execute(self, commande):
+        header, _, argument = commande.partition(" ")
+        argument = argument.strip()
+        h = header.upper()
+        if h == "*IDN?":
+            self.sortie.append("Keysight Technologies,N5227B,SIMULATED,A.15.00")
+        elif h == "*CLS":
+            self.erreurs, self.opc = [], False
+        elif h in ("*ESE", "*RST"):
+            pass
+        elif h == "*OPC":
+            self.opc = True
+        elif h == "*OPC?":
+            self.attente()
+            self.sortie.append("1")
+        elif h == "*WAI":
+            self.wai = True
+        elif scpi_match(header, "SYSTem:ERRor") is not None and h.endswith("?"):
+            self.sortie.append(self.erreurs.pop(0) if self.erreurs else '+0,"No error"')
+        elif scpi_match(header, "MMEMory:LOAD:FILE") is not None:
+            self.clock.sleep(0.5)
+        elif scpi_match(header, "SENSe:FREQuency:STARt") is not None:
+            self.reponse_ou_reglage(header, argument, "start", float)
+        elif scpi_match(header, "SENSe:FREQuency:STOP") is not None:
+            self.reponse_ou_reglage(header, argument, "stop", float)
+        elif scpi_match(header, "SENSe:SWEep:POINts") is not None:
+            self.reponse_ou_reglage(header, argument, "points", int)
+        elif scpi_match(header, "SENSe:BANDwidth") is not None:
+            self.reponse_ou_reglage(header, argument, "IFBW", float)
+        elif scpi_match(header, "SENSe:AVERage") is not None or scpi_match(header, "SENSe:AVERage:STATe") is not None:
+            self.moyenne = argument.upper() in ("ON", "1")
+            self.n_avg = 0
+        elif scpi_match(header, "SENSe:AVERage:COUNt") is not None:
+            self.avg_count = int(float(argument))
+        elif scpi_match(header, "SENSe:AVERage:CLEar") is not None:
+            self.n_avg = 0
+        elif scpi_match(header, "SENSe:AVERage:MODE") is not None:
+            pass
+        elif scpi_match(header, "SENSe:SWEep:GROups:COUNt") is not None:
+            self.groupes = int(float(argument))
+        elif scpi_match(header, "SENSe:SWEep:MODE") is not None:
+            if argument.upper().startswith("GRO"):
+                self.trigger(self.groupes)
+            elif argument.upper().startswith("SING"):
+                self.trigger(1)
+        elif scpi_match(header, "INITiate:IMMediate") is not None:
+            self.trigger(1)
+        elif scpi_match(header, "INITiate:CONTinuous") is not None:
+            pass
+        elif scpi_match(header, "CALCulate:PARameter:DELete:ALL") is not None:
+            self.mesures, self.selection = {}, None
+        elif scpi_match(header, "CALCulate:PARameter:DEFine") is not None:
+            nom, parametre = [a.strip().strip('"') for a in argument.split(",")[:2]]
+            self.mesures[nom] = (parametre, max([n for p, n in self.mesures.values()], default=0) + 1)
+        elif scpi_match(header, "CALCulate:PARameter:SELect") is not None:
+            nom = argument.strip('"')
+            if nom in self.mesures:
+                self.selection = nom
+            else:
+                self.erreurs.append('-224,"Illegal parameter value"')
+        elif scpi_match(header, "CALCulate:PARameter:MNUMber") is not None and h.endswith("?"):
+            self.sortie.append(str(self.mesures[self.selection][1]))
+        elif scpi_match(header, "CALCulate:FORMat") is not None:
+            self.format = argument.upper()[:4]
+        elif scpi_match(header, "CALCulate:DATA") is not None or scpi_match(header, "CALCulate:DATA:MSData") is not None:
+            self.attente()
+            self.sortie.append(self.values(commande))
+        elif scpi_match(header, "FORMat:DATA") is not None:
+            self.data_format = "ASC" if argument.upper().startswith("ASC") else argument.upper().replace(" ", "")
+        elif scpi_match(header, "FORMat:BORDer") is not None:
+            self.swapped = argument.upper().startswith("SWAP")
+        elif scpi_match(header, "DISPlay:WINDow:STATe") is not None or scpi_match(header, "DISPlay:WINDow:TRACe:FEED") is not None or scpi_match(header, "DISPlay:WINDow:TRACe:Y:AUTO") is not None:
+            pass
+        else:
+            self.erreurs.append(f'-113,"Undefined header;{header}"')
+
+    def reponse_ou_reglage(self, header, argument, nom, type_):
+        if header.endswith("?"):
+            self.sortie.append(f"{getattr(self, nom):+.11E}" if type_ is float else str(getattr(self, nom)))
+        else:
+            setattr(self, nom, type_(float(argument)))
+
+    def read(self):
+        reponse = super().read()
+        if isinstance(reponse, np.ndarray):
+            self.clock.sleep(len(reponse) * 20 / self.bus_rate) # ASCII: about 20 characters per value
+            return ",".join(f"{v:+.12E}" for v in reponse)
+        return reponse
+
+    def query_ascii_values(self, commande, converter='f', separator=',', container=list):
+        return container(float(v) for v in self.query(commande).split(separator))
+
+    def query_binary_values(self, commande, datatype='f', is_big_endian=False, container=list):
+        self.write(commande)
+        self.clock.sleep(self.latency)
+        valeurs = self.sortie.pop(0)
+        if self.data_format == "ASC":
+            raise pyvisa.errors.InvalidBinaryFormat("le VNA répond en ASCII")
+        taille = 4 if self.data_format.endswith("32") else 8
+        if taille != {'f': 4, 'd': 8}[datatype] or self.swapped == is_big_endian:
+            raise pyvisa.errors.InvalidBinaryFormat("format binaire inattendu")
+        self.clock.sleep(len(valeurs) * taille / self.bus_rate)
+        return container(np.asarray(valeurs, dtype=np.float32 if taille == 4 else np.float64).astype(float))
+
+    def read_stb(self):
+        self.clock.sleep(self.latency)
+        return 0x20 if self.opc and self.clock.now() >= self.fin else 0
+
+################################################################################################
+# ESP
+################################################################################################
+class SimESP(_SimResource):
+
+    def __init__(self, bench, latency=1E-3, groups=True):
+        """
+        Simulated ESP motion controller (commands MO, MF, SN, AC, AG, VA, JW, JH, VU, PA, PR, WS, ST,
+        DH, the group commands HN, HV, HA, HD, HO, HF, HL, HX and the queries TP?, PA?, MD?, TE?).
+
+        Parameters
+        ----------
+        bench : SimBench
+            Bench (time, positions of the axis).
+        latency : floating
+            Duration (in s) of the processing of a command. The default is 1E-3.
+        groups : boolean
+            Group commands (linear interpolated moves) supported. Without them, they are errors
+            reported by TE?. The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        super().__init__(bench, latency)
+        self.attente = None # axis the commands are waiting for (WS)
+        self.groups = groups
+        self.groupes = {} # group number -> axes, vector velocity, acceleration and deceleration
+        self.erreur = 0 # code of the last error (TE?)
+
+    def write(self, commande):
+        self.clock.sleep(self.latency)
+        for partie in commande.split(";"):
+            if partie.strip():
+                self.execute(partie.strip())
+
+    def execute(self, commande):
+        if commande.upper() == "*IDN?":
+            self.sortie.append("ESP300 Version 3.08 09/09/02 (simulated)")
+            return
+        m = re.fullmatch(r"(\d*)([A-Za-z]{2})(\??)(.*)", commande)
+        if m is None:
+            return
+        nom, code, question, argument = m.group(1) or "1", m.group(2).upper(), m.group(3), m.group(4).strip()
+        if self.attente is not None: # WS: the commands wait for the end of the move
+            self.clock.wait_until(self.bench.axe(self.attente).end())
+            self.attente = None
+        if code.startswith("H") and not question:
+            self.group(nom, code, argument)
+            return
+        axe = self.bench.axe(nom)
+        if question:
+            if code == "TP":
+                self.sortie.append(f"{axe.position():.5f}")
+            elif code == "PA":
+                self.sortie.append(f"{axe.cible:.5f}")
+            elif code == "MD":
+                self.sortie.append("1" if axe.done() else "0")
+            elif code == "VE":
+                self.sortie.append("ESP300 Version 3.08 09/09/02 (simulated)")
+            elif code == "TE":
+                self.sortie.append(str(self.erreur))
+                self.erreur = 0
+            elif code == "MO":
+                self.sortie.append("1" if axe.moteur else "0")
+            elif code == "VA":
+                self.sortie.append(f"{axe.vitesse if axe.va is None else axe.va:.5f}")
+            else:
+                self.sortie.append("0")
+        elif code == "MO":
+            axe.moteur = True
+        elif code == "MF":
+            axe.moteur = False
+        elif code == "AC":
+            axe.acceleration = float(argument)
+        elif code == "VA":
+            axe.va = float(argument)
+        elif code in ("JW", "JH", "VU"):
+            axe.vitesse = float(argument)
+        elif code == "PA":
+            axe.move_to(float(argument))
+        elif code == "PR":
+            axe.move_to(axe.cible + float(argument))
+        elif code == "WS":
+            self.attente = nom
+        elif code == "ST":
+            axe.stop()
+        elif code == "DH":
+            axe.depart = axe.cible = 0.0
+
+    def group(self, nom, code, argument):
+        # group commands: the axes of a linear interpolated move start and arrive together
+        if not self.groups:
+            self.erreur = 6 # command does not exist
+            return
+        if code == "HN":
+            self.groupes[nom] = {"axes": [a.strip() for a in argument.split(",")], "HV": None, "HA": None, "HD": None}
+        elif code in ("HV", "HA", "HD"):
+            self.groupes[nom][code] = float(argument)
+        elif code == "HX":
+            if self.groupes.pop(nom, None) is None:
+                self.erreur = 1 # the group does not exist
+        elif code == "HL":
+            groupe = self.groupes[nom]
+            axes = [self.bench.axe(a) for a in groupe["axes"]]
+            cibles = [float(v) for v in argument.split(",")]
+            distances = [abs(c - axe.position()) for axe, c in zip(axes, cibles)]
+            total = np.sqrt(np.sum(np.square(distances)))
+            for axe, cible, d in zip(axes, cibles, distances): # velocity and acceleration of the vector split along the axes
+                f = d / total if total > 0 else 1.0
+                axe.move_to(cible, (groupe["HV"] or axe.velocity()) * f or None, (groupe["HA"] or axe.acceleration) * f or None)
+
+################################################################################################
+# resource manager
+################################################################################################
+_BENCH = None
+
+class SimResourceManager:
+
+    def __init__(self, bench=None, speed=1.0, vna_addresses=(16,), vna_options=None, esp_options=None):
+        """
+        Replaces pyvisa.ResourceManager: opens simulated instruments sharing the same bench.
+
+        Parameters
+        ----------
+        bench : SimBench or None
+            Bench of the instruments. The default is None: a bench shared by all the resource
+            managers, so that the position of the arm is kept between two connections.
+        speed : integer or floating
+            Acceleration of the time of a new bench. The default is 1.0.
+        vna_addresses : tuple of integer
+            GPIB addresses of the VNA, the other addresses are ESP. The default is (16,).
+        vna_options : dictionary or None
+            Options of SimVNA (latency, sweep_overhead, sweep_factor, bus_rate). The default is None.
+        esp_options : dictionary or None
+            Options of SimESP (latency). The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        global _BENCH
+        if bench is None:
+            if _BENCH is None or _BENCH.clock.speed != float(speed):
+                _BENCH = SimBench(SimClock(speed))
+            bench = _BENCH
+        self.bench = bench
+        self.vna_addresses = [int(a) for a in vna_addresses]
+        self.vna_options = vna_options or {}
+        self.esp_options = esp_options or {}
+
+    def open_resource(self, adresse, **kwargs):
+        m = re.search(r"::(\d+)", adresse)
+        if m is not None and int(m.group(1)) in self.vna_addresses:
+            ressource = SimVNA(self.bench, **self.vna_options)
+        else:
+            ressource = SimESP(self.bench, **self.esp_options)
+        ressource.resource_name = adresse
+        return ressource
+
+    def list_resources(self):
+        return tuple(f"GPIB0::{a}::INSTR" for a in self.vna_addresses)
+
+    def close(self):
+        pass
@@ -6,7 +6,6 @@ Date: 05/20/25
     
 """
 
-import pyvisa
 import os
 import time
 import numpy as np
@@ -14,13 +13,19 @@ from datetime import datetime
 import re
 import glob
 import csv
+from instruments import VNA, ESP, resource_manager
+from scan_data import write_position_file, write_frequency_files, save_scan_store, regrid_line, grid_shape, serpentine_matrix, load_scan_files, ScanStore, STORE_EXT
+from pipeline import Pipeline
+from checkpoint import Checkpoint
+from scan_timing import ScanTimer
 
-def matrix(dossier, ligne_cible, colonne_cible):
+def matrix(dossier, ligne_cible, colonne_cible, A=None, B=None, pas_x=1, pas_y=None):
     """
     This function loads and reconstructs 2D field measurement matrices from a folder of line-
     formatted text files named Balayage_#.txt. It:
     • Reads the magnitude or phase from each file (specified line and column)
-    • Automatically determines the scan grid size
+    • Determines the scan grid size from A, B and the steps (square grid guessed from the number of
+      files if they are not given)
     • Rebuilds the matrix according to a serpentine scanning pattern
 
     Parameters
@@ -31,6 +36,14 @@ def matrix(dossier, ligne_cible, colonne_cible):
         Line of the frequency that has been chosen by the user.
     colonne_cible : integer
         Column of the chosen S-parameter.
+    A : array of integer or array of floating or None
+        Start coordinates of the scan. The default is None (square grid).
+    B : array of integer or array of floating or None
+        End coordinates of the scan. The default is None (square grid).
+    pas_x : integer or floating
+        Step size of the x-axis. The default is 1.
+    pas_y : integer or floating or None
+        Step size of the y-axis. The default is None (same as pas_x).
 
     Returns
     -------
@@ -39,30 +52,24 @@ def matrix(dossier, ligne_cible, colonne_cible):
 
     """
     fichiers = sorted([f for f in os.listdir(dossier) if re.match(r"Balayage_\d+\.txt", f)],key=lambda x: int(re.findall(r'\d+', x)[0]))
-    N = int(len(fichiers) ** 0.5)
-    matrice = np.zeros((N, N), dtype=float)
+    shape = int(len(fichiers) ** 0.5) if A is None or B is None else grid_shape(A, B, pas_x, pas_y)
+    valeurs = np.zeros(len(fichiers), dtype=float)
     for idx, fichier in enumerate(fichiers):
         with open(os.path.join(dossier, fichier), 'r') as f:
           lignes = f.readlines()
           if 0 <= ligne_cible < len(lignes):
             ligne = lignes[ligne_cible].strip().split()
             if 0 <= colonne_cible < len(ligne):
-                valeur = ligne[colonne_cible]
-        row = N - 1 - (idx // N)
-        col_index = idx % N
-        if (N - 1 - row) % 2 == 0:
-            col = N - 1 - col_index  
-        else:
-            col = col_index         
-        matrice[row][col] = valeur
-    return matrice
+                valeurs[idx] = ligne[colonne_cible]
+    return serpentine_matrix(valeurs, shape)
 
-def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3):
+def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3, freq=None, pas_y=None):
     """
-    This function reconstructs a matrix from a single tab-delimited measurement file. It:
+    This function reconstructs a matrix from a single tab-delimited measurement file or from a
+    {File_name}.scan store. It:
     • Reads data for a given column index
     • Builds a 2D matrix using a boustrophedon (serpentine) scan logic
-    • Supports custom grid bounds and step size
+    • Supports custom grid bounds and step sizes (rectangular grids)
 
     Parameters
     ----------
@@ -73,9 +80,14 @@ def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3):
     B : array of integer or array of floating
         End coordinates of the scan.. The default is [5,5].
     pas : integer or floating
-        Step size of the scan. The default is 1.
+        Step size of the scan (x-axis). The default is 1.
     col : integer
         Column of the chosen S-parameter. The default is 3.
+    freq : integer or floating or None
+        Frequency (in Hz) read when chemin_fichier is a {File_name}.scan store (the closest frequency
+        of the sweep is used). The default is None (first frequency of the sweep).
+    pas_y : integer or floating or None
+        Step size of the y-axis. The default is None (same as pas).
 
     Returns
     -------
@@ -84,28 +96,55 @@ def matrix_single_freq(chemin_fichier, A=[-5,-5], B=[5,5], pas=1, col=3):
 
     """
     try:
-        N = int((B[0] - A[0])/pas + 1)
-        with open(chemin_fichier, 'r') as fichier:
-            lecteur_csv = csv.reader(fichier, delimiter='\t') 
-            next(lecteur_csv) 
-            colonnes = list(zip(*lecteur_csv))  
-        meas = [float(i) for i in colonnes[col]]
-        matrice = np.zeros((N, N), dtype=float)
-        idx = 0
-        for row in range(N-1, -1, -1):  
-            if (N - 1 - row) % 2 == 0:
-                for col in range(N-1, -1, -1):
-                    matrice[row][col] = meas[idx]
-                    idx += 1
-            else:
-                for col in range(N):
-                    matrice[row][col] = meas[idx]
-                    idx += 1
-        return matrice
+        shape = grid_shape(A, B, pas, pas_y)
+        if chemin_fichier.endswith(STORE_EXT): # only the chunks of the chosen frequency are read
+            store = ScanStore(chemin_fichier)
+            meas = store.column(col, 0 if freq is None else store.freq_index(freq))
+        else:
+            with open(chemin_fichier, 'r') as fichier:
+                lecteur_csv = csv.reader(fichier, delimiter='\t') 
+                next(lecteur_csv) 
+                colonnes = list(zip(*lecteur_csv))  
+            meas = np.array(colonnes[col], dtype=float)
+        return serpentine_matrix(meas, shape)
     except FileNotFoundError:
         print(f"Erreur : Le fichier '{chemin_fichier}' n'a pas été trouvé.")
         return None
 
+def matrix_cube(chemin, A=[-5,-5], B=[5,5], pas_x=1, pas_y=None):
+    """
+    Rebuilds the images of all the frequencies and traces of a planar scan in one call, from a
+    {File_name}.scan store or from a folder of Balayage_#.txt files.
+
+    Parameters
+    ----------
+    chemin : string
+        Path of the {File_name}.scan store or of the directory containing the Balayage_#.txt files.
+    A : array of integer or array of floating
+        Start coordinates of the scan. The default is [-5,-5].
+    B : array of integer or array of floating
+        End coordinates of the scan. The default is [5,5].
+    pas_x : integer or floating
+        Step size of the x-axis. The default is 1.
+    pas_y : integer or floating or None
+        Step size of the y-axis. The default is None (same as pas_x).
+
+    Returns
+    -------
+    freq_data : array of floating
+        Frequencies (in Hz) of the sweep.
+    images : array
+        Images in the layout of matrix: complex array of shape (y, x, frequency, trace) for a store,
+        array of shape (y, x, frequency, trace, 2) (magnitude, phase) for a folder.
+
+    """
+    shape = grid_shape(A, B, pas_x, pas_y)
+    if chemin.endswith(STORE_EXT):
+        store = ScanStore(chemin)
+        return store.freq_data, serpentine_matrix(store.cube(), shape)
+    freq_data, data, trace_name, headers = load_scan_files(chemin)
+    return freq_data, serpentine_matrix(data, shape)
+
 def file_to_array(dossier, ligne_cible, colonne_cible, rot=False):
     """
     This function loads and returns concatenated data from a folder of line-formatted text files
@@ -180,8 +219,7 @@ def boustrophedon(A,B,pas_x,pas_y):
     max_x = max(xi, xf)
     min_y = min(yi, yf)
     max_y = max(yi, yf)
-    num_points_x = int(round((max_x - min_x) / pas_x + 1))
-    num_points_y = int(round((max_y - min_y) / pas_y + 1))
+    num_points_y, num_points_x = grid_shape(A, B, pas_x, pas_y) # same grid as the reconstruction of the images
     x_coords_full = np.linspace(min_x, max_x, num_points_x)
     y_coords_full = np.linspace(min_y, max_y, num_points_y)
     parcours_full_grid = []
@@ -197,9 +235,31 @@ def boustrophedon(A,B,pas_x,pas_y):
                 parcours_full_grid.append(pos)
     return parcours_full_grid
 
+def angles(theta_min, theta_max, pas):
+    """
+    Generates the list of the angles of an angular scan: from theta_min, one step after the
+    other, until theta_max is reached.
+
+    Parameters
+    ----------
+    theta_min : integer or floating
+        Start coordinate of the scan.
+    theta_max : integer or floating
+        End coordinate of the scan.
+    pas : integer or floating
+        Step size of the axis.
+
+    Returns
+    -------
+    theta_val : array of floating
+        Angles of the scan.
+    """
+    nb_tot_position = int(np.ceil(np.abs(1 + (theta_max - theta_min) / pas)))
+    return theta_min + pas*np.arange(nb_tot_position)
+
 class Balayage2D_Rotation_VNA_ESP:
     
-    def __init__(self, ip_address_vna, ip_adress_esp):
+    def __init__(self, ip_address_vna, ip_adress_esp, readout="SDATA", profile_vna="opc", profile_esp="opc", averaging="group", backend=None):
         """
         Establishes communication with the VNA and ESP motion controller using VISA addresses.
         It also prints the identification strings of each device.
@@ -210,6 +270,21 @@ class Balayage2D_Rotation_VNA_ESP:
             Ip address of the VNA.
         ip_adress_esp : string
             Ip adress of the ESP.
+        readout : string
+            Readout mode of the traces: "SDATA" (complex data read once, magnitude and phase computed
+            on the computer) or "FDATA" (data formatted by the VNA in MLOG and then PHAS). The default is "SDATA".
+        profile_vna : string or dictionary
+            Synchronization profile of the VNA: "opc" (*OPC? query), "stb" (status byte polling) or
+            "sleep" (fixed waits). The default is "opc".
+        profile_esp : string or dictionary
+            Synchronization profile of the ESP: "opc" (motion done polling) or "sleep" (fixed waits).
+            The default is "opc".
+        averaging : string
+            Averaging mode of the VNA: "group" (averaging of the VNA with a group trigger), "host"
+            (sweeps averaged on the computer) or "loop" (one trigger per sweep). The default is "group".
+        backend : string or object or None
+            Instruments: "visa", "sim" (simulated instruments) or resource manager, see
+            instruments.resource_manager. The default is None (environment variable NFSCAN_BACKEND).
 
         Returns
         -------
@@ -217,15 +292,16 @@ class Balayage2D_Rotation_VNA_ESP:
 
         """
         try: 
-            rm = pyvisa.ResourceManager()
-            self.vna = rm.open_resource(f'{ip_address_vna}')
+            rm = resource_manager(backend)
+            self.vna = VNA(rm.open_resource(f'{ip_address_vna}'), readout=readout, profile=profile_vna, averaging=averaging) # VISA session wrapped by the driver layer
             self.vna.timeout = 30000  # timeout of 30 sec
-            self.esp = rm.open_resource(f'{ip_adress_esp}')
+            self.esp = ESP(rm.open_resource(f'{ip_adress_esp}'), profile=profile_esp)
             self.esp.timeout = 30000
             print("Connecté à :", self.esp.query("*IDN?")) # ask identification
             print("Connecté à :", self.vna.query("*IDN?")) # ask identification
         except Exception as e:
             print(f"erreur lors de l'initialisation: {e}")
+        self.setup = {"band": None, "channel": None, "traces": []} # setup of the VNA, saved in the checkpoint of the scans
         
     def select_state_vna(self, band="WR6.5_Galaad.csa"):
         """
@@ -245,7 +321,8 @@ class Balayage2D_Rotation_VNA_ESP:
         """
         try:
             self.vna.write(':MMEMory:LOAD:FILE "%s"' % (f'D:/{band}')) # call the saved state and calset data 
-            time.sleep(2)
+            self.vna.pause(2)
+            self.setup = {"band": band, "channel": None, "traces": []}
         except Exception as e:
             print(f"erreur lors de la selection de la bande: {e}")
 
@@ -271,14 +348,17 @@ class Balayage2D_Rotation_VNA_ESP:
         """
         try:
             channel = 1
-            self.vna.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
-            self.vna.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
-            self.vna.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
-            self.vna.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
-            self.vna.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
-            self.vna.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
-            time.sleep(2)
+            with self.vna.batch() as lot: # one message for the whole setup
+                lot.write(f'CALCulate{channel}:PARameter:DELete:ALL') # delete all previous parameters
+                lot.write(f'SENSe{channel}:FREQuency:STARt {start_freq}') # set the starting frequence to start_freq
+                lot.write(f'SENSe{channel}:FREQuency:STOP {stop_freq}') # set the finishing frequence to stop_freq
+                lot.write(f'SENSe{channel}:SWEep:POINts {points}') # set the number of point to points
+                lot.write(f'SENSe{channel}:BAND {IFBW}') # set the IFBW
+                lot.write(f'INITiate{channel}:CONTinuous OFF') # turn off the continuous measure mode
+                lot.pause(2)
             print(f"Canal {channel} configuré : start={start_freq}, stop={stop_freq}, points={points}")
+            self.setup["channel"] = {"start_freq": start_freq, "stop_freq": stop_freq, "points": points, "IFBW": IFBW}
+            self.setup["traces"] = [] # the traces have been deleted
         except Exception as e:
             print(f"erreur lors du stetup du cannal de mesure: {e}")
     
@@ -303,13 +383,15 @@ class Balayage2D_Rotation_VNA_ESP:
         """
         try: 
             channel = 1
-            self.vna.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace_name}"+","+f'{trace_name}') # definie a new trace
-            self.vna.write(f'CALCulate{channel}:PARameter:SELect "{trace_name}"') # select the new trace
-            self.vna.write(f'DISPlay:WINDow{window}:STATe ON') # turn on the window display
-            self.vna.write(f'DISPlay:WINDow{window}:TRACe{trace_number}:FEED "{trace_name}"') # put the new trace into the window
-            time.sleep(1)
-            self.vna.write(f':DISPlay:WINDow{window}:TRACe{trace_number}:Y:AUTO') # autoscale the trace
+            with self.vna.batch() as lot:
+                lot.write(f'CALCulate{channel}:PARameter:DEFine'+' '+f"{trace_name}"+","+f'{trace_name}') # definie a new trace
+                lot.write(f'CALCulate{channel}:PARameter:SELect "{trace_name}"') # select the new trace
+                lot.write(f'DISPlay:WINDow{window}:STATe ON') # turn on the window display
+                lot.write(f'DISPlay:WINDow{window}:TRACe{trace_number}:FEED "{trace_name}"') # put the new trace into the window
+                lot.pause(1)
+                lot.write(f':DISPlay:WINDow{window}:TRACe{trace_number}:Y:AUTO') # autoscale the trace
             print(f"Trace {trace_name} ajoutée à la fenêtre {window}")
+            self.setup["traces"].append({"trace_name": trace_name, "trace_number": trace_number, "window": window})
         except Exception as e:
             print(f"erreur lors de l'ajout de la trace: {e}")
 
@@ -342,24 +424,80 @@ class Balayage2D_Rotation_VNA_ESP:
 
         """
         try: 
-            self.esp.write(f'{axis}MO')
-            self.esp.write(f'{axis}SN{units}')
-            self.esp.write(f'{axis}AC{accel}')
-            self.esp.write(f'{axis}AG{deccel}')
             if speed==1:
                 speed_mode = "JW5"
             elif speed==2:
                 speed_mode = "JH10"
             elif speed==3:
                 speed_mode = "VU15"
-            self.esp.write(f'{axis}{speed_mode}')
             movement_mode = f'{"PA" if absolute else "PR"}'
-            self.esp.write(f'{axis}{movement_mode}{movement}')
-            self.esp.write(f'{axis}WS')
+            with self.esp.batch() as lot: # configuration (only what has changed) and move in one line
+                self.esp.configure_axis(lot, axis, units, accel, deccel, speed_mode)
+                lot.write(f'{axis}{movement_mode}{movement}')
+                lot.write(f'{axis}WS')
+            self.esp.wait_motion(axis, delay=0)
             print("Deplacment terminé")
         except Exception as e:
             print(f"erreur lors du deplacement: {e}")
             
+    def move_axes(self, axis=[2,3], movement=[1,1], absolute=True, velocity=None, acceleration=None):
+        """
+        Moves several axes at the same time, with a single wait for all of them. With a vector
+        velocity the move is a linear interpolated group move (straight line between the two
+        points), if the controller supports it.
+
+        Parameters
+        ----------
+        axis : array of integer
+            ESP axis numbers. The default is [2,3].
+        movement : array of integer or array of floating
+            Target position (absolute) or displacement (relative) of each axis. The default is [1,1].
+        absolute : boolean
+            If True, the movement will be absolute; if False, it will be relative. The default is True.
+        velocity : integer or floating or None
+            Vector velocity of the interpolated move. The default is None (each axis at its own speed).
+        acceleration : integer or floating or None
+            Vector acceleration and deceleration of the interpolated move. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            self.esp.move_axes(axis, movement, absolute, velocity, acceleration, delay=0)
+            print("Deplacment terminé")
+        except Exception as e:
+            print(f"erreur lors du deplacement: {e}")
+
+    def follow_path(self, axis=[2,3], points=[[0,0],[1,1]], velocity=None, acceleration=None):
+        """
+        Moves several axes through a list of points (absolute positions), each segment being a
+        simultaneous (or linear interpolated, with velocity) move of all the axes.
+
+        Parameters
+        ----------
+        axis : array of integer
+            ESP axis numbers. The default is [2,3].
+        points : array
+            Points of the path, one row per point and one column per axis. The default is [[0,0],[1,1]].
+        velocity : integer or floating or None
+            Vector velocity of the interpolated moves. The default is None (each axis at its own speed).
+        acceleration : integer or floating or None
+            Vector acceleration and deceleration of the interpolated moves. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            for point in points:
+                self.esp.move_axes(axis, point, True, velocity, acceleration, delay=0)
+            print("Trajectoire terminée")
+        except Exception as e:
+            print(f"erreur lors de la trajectoire: {e}")
+
     def define_home(self, axis=2):
         """
         Defines the current position as the zero reference for the given axis.
@@ -381,12 +519,12 @@ class Balayage2D_Rotation_VNA_ESP:
         
     def return_home(self, axis=2):
         """
-        Returns the axis to its defined home position.
+        Returns the axis (or several axes at the same time) to its defined home position.
 
         Parameters
         ----------
-        axis : integer
-            ESP axis number. The default is 2.
+        axis : integer or array of integer
+            ESP axis number(s). The default is 2.
 
         Returns
         -------
@@ -394,8 +532,8 @@ class Balayage2D_Rotation_VNA_ESP:
 
         """
         try:
-            self.esp.write(f'{axis}PA0') # return to the defined zero of the axis
-            self.esp.write(f'{axis}WS') # wait for the the arm to stop moving
+            axes = axis if isinstance(axis, (list, tuple)) else [axis]
+            self.esp.move_axes(axes, [0]*len(axes), delay=0) # return to the defined zero of the axes, one wait for all of them
         except Exception as e:
             print(f"erreur lors du retour au zero: {e}")
             
@@ -412,7 +550,36 @@ class Balayage2D_Rotation_VNA_ESP:
         err = self.vna.read()
         print(f'VNA ERROR: {err}')
     
-    def balayage_2D(self, trace_name=["S12","S21","S11","S22"], axis=[2,3], units=2, A=[0,0], B=[5,5], pas_axe1=1, pas_axe2=1, state_avg=True, count_avg=5, save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", note="", File_name="Compilation"):
+    def resume(self, save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", File_name="Compilation"):
+        """
+        Resumes an interrupted scan (balayage_2D or rotation) from its checkpoint: the setup of the
+        VNA is restored (state file, channel, traces), the axis are sent back to the start of the
+        scan and the scan goes on from the first position that had not been measured. The final
+        files are the same as the ones of an uninterrupted scan.
+
+        Parameters
+        ----------
+        save_path : string
+            Output directory path of the interrupted scan. The default is "C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad".
+        File_name : string
+            Name of the final files of the interrupted scan. The default is "Compilation".
+
+        Returns
+        -------
+        None.
+
+        """
+        reprise = Checkpoint.load(save_path, File_name)
+        setup = reprise.etat["setup"]
+        if setup["band"] is not None:
+            self.select_state_vna(setup["band"])
+        if setup["channel"] is not None:
+            self.setup_channel_vna(**setup["channel"])
+        for trace in setup["traces"]:
+            self.add_trace_vna(**trace)
+        return getattr(self, reprise.etat["methode"])(**reprise.etat["arguments"], reprise=reprise)
+
+    def balayage_2D(self, trace_name=["S12","S21","S11","S22"], axis=[2,3], units=2, A=[0,0], B=[5,5], pas_axe1=1, pas_axe2=1, state_avg=True, count_avg=5, save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", note="", File_name="Compilation", journal=False, pipeline=True, checkpoint=True, reprise=None):
         """
         Performs a full 2D scan between two spatial points A and B.
         The scan will begin at point A and end at point B. It will take measures at every step.
@@ -445,12 +612,28 @@ class Balayage2D_Rotation_VNA_ESP:
             Optional annotation. The default is "".
         File_name : string
             Name of the final files returned by the script. The default is "Compilation".
+        journal : boolean
+            If True, the measurements of each position are also written in a file (crash journal) while
+            the scan is running; the data itself is kept in memory. The default is False.
+        pipeline : boolean
+            If True, the traces of a position are read (and the crash journal written) on worker
+            threads while the arm moves to the next position; the next sweep only starts once the
+            arm has stopped and the previous traces have been read. If False, every step is done in
+            sequence. The default is True.
+        checkpoint : boolean
+            If True, the data is written on disk after each position with the state of the scan
+            ("{File_name}.ckpt"), so that an interrupted scan can be resumed with resume. The
+            checkpoint files are deleted at the end of the scan. The default is True.
+        reprise : Checkpoint or None
+            Checkpoint of the interrupted scan, given by resume. The default is None.
 
         Returns
         -------
         None.
 
         """
+        arguments = {nom: valeur for nom, valeur in locals().items() if nom not in ("self", "reprise")} # saved in the checkpoint
+        ckpt = None
         try:
             ################################################################################################
             # parameters
@@ -464,39 +647,35 @@ class Balayage2D_Rotation_VNA_ESP:
             ################################################################################################
             # give parameters to the axis (acceleration, speed mode...)
             ################################################################################################
-            for axe in axis:
-                self.esp.write(f'{axe}MO') # turn on the axis
-                self.esp.write(f'{axe}SN{units}') # set the unit of the axis: 0 = encoder count, 1 = motor step, 2 = millimeter, 3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient, 9 = radian, 10 = milliradian, 11 = microradian
-                self.esp.write(f'{axe}AC{accel}') # set the axis acceleration
-                self.esp.write(f'{axe}AG{deccel}') # set the axis decceleration
-                if speed==1:
-                    speed_mode = "JW5" # slow
-                elif speed==2:
-                    speed_mode = "JH10" # medium
-                elif speed==3:
-                    speed_mode = "VU15" # fast
-                self.esp.write(f'{axe}{speed_mode}') # set the speed mode
+            if speed==1:
+                speed_mode = "JW5" # slow
+            elif speed==2:
+                speed_mode = "JH10" # medium
+            elif speed==3:
+                speed_mode = "VU15" # fast
+            with self.esp.batch() as lot: # motor on, unit (0 = encoder count, 1 = motor step, 2 = millimeter, 3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient, 9 = radian, 10 = milliradian, 11 = microradian), acceleration, decceleration and speed mode of the axis
+                for axe in axis:
+                    self.esp.configure_axis(lot, axe, units, accel, deccel, speed_mode)
             ################################################################################################
             # sweep spacial parameters
             ################################################################################################
-            self.esp.write(f'{axis[0]}PA{A[0]}')
-            self.esp.write(f'{axis[0]}WS')
-            self.esp.write(f'{axis[1]}PA{A[1]}')
-            self.esp.write(f'{axis[1]}WS')
-            L_tot_1 = int(np.round((B[0]-A[0])/pas_axe1,0))
-            L_tot_2 = int(np.round((B[1]-A[1])/pas_axe2 + 1,0))
-            nb_tot_position = int(np.ceil(((1 + (B[0]-A[0]) / pas_axe1 ))*(1 + (B[1]-A[1]) / pas_axe2 )))
-            time.sleep(2)
+            self.esp.move_axes(axis, [A[0], A[1]], wait=False) # both axes at once, waited for below
+            parcours = boustrophedon(A, B, pas_axe1, pas_axe2)
+            nb_tot_position = len(parcours) # the positions of the scan are the ones of the boustrophedon path
+            L_tot_1 = int(round(abs(B[0]-A[0]) / pas_axe1)) # moves of the axis 1 along a line
+            L_tot_2 = nb_tot_position // (L_tot_1 + 1) # number of lines
+            self.esp.wait_motion(axis)
             start_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
             stop_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
             points = int(self.vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
             if start_freq == stop_freq:
                 self.vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
                 print("Balayage mono-fréquence:")
+                points = 1
             hh = 1 # hh tracks the number of measurements
-            parcours = boustrophedon(A, B, pas_axe1, pas_axe2)
             x_val = [float(p[0]) for p in parcours]
             y_val = [float(p[1]) for p in parcours]
+            data = np.zeros((nb_tot_position, points, len(trace_name), 2), dtype=float) # acquisition cube (position, frequency, trace, [magnitude, phase])
             unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
             ################################################################################################
             # preset file creation
@@ -510,181 +689,105 @@ class Balayage2D_Rotation_VNA_ESP:
                 if state_avg:
                     line = [f"{start_freq}",  f"{stop_freq}", f"{points}", f"{count_avg}", f"{pas_axe1}", f"{pas_axe2}", f"{A[0]}", f"{B[0]}", f"{A[1]}", f"{B[1]}"]
                 else: 
-                    line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas_axe1}", f"{pas_axe1}", f"{A[0]}", f"{B[0]}", f"{A[1]}", f"{B[1]}"]
+                    line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas_axe1}", f"{pas_axe2}", f"{A[0]}", f"{B[0]}", f"{A[1]}", f"{B[1]}"]
                 f.write("\t".join(line) + "\n")
+            parameters = dict(zip(header, line)) # also saved in the {File_name}.scan store
             ################################################################################################
             # this is the 2D-sweeping script 
             ################################################################################################
             for axe in axis:
                 self.esp.write(f'{axe}MO')
-            for i in range(L_tot_2):
-                for j in range(L_tot_1):
-                    ite_start_time = time.time()
+            freq_data = np.linspace(start_freq, stop_freq, points)
+            date = datetime.now().strftime("%m-%d-%Y")
+            debut = 0 # number of positions already measured
+            if reprise is not None: # resume of an interrupted scan, the data already measured is in the checkpoint
+                ckpt = reprise
+                data, date, debut = ckpt.cube, ckpt.etat["date"], ckpt.positions_faites
+                print(f"Reprise du scan à la mesure {debut+1}/{int(nb_tot_position)}")
+                if debut < nb_tot_position:
+                    self.esp.move_axes(axis, [x_val[debut], y_val[debut]], wait=False) # first position that has not been measured
+            elif checkpoint:
+                ckpt = Checkpoint(save_path, File_name)
+                data = ckpt.create("balayage_2D", arguments, self.setup, data.shape, date)
+            taches = Pipeline(2 if pipeline else 0) # readout and writing of a position while the arm moves to the next one
+            timer = ScanTimer(nb_tot_position) # duration of each phase of each position
+            context = {"points": points, "traces": len(trace_name), "count_avg": int(count_avg) if state_avg else 1, "averaging": self.vna.averaging,
+                       "IFBW": (self.setup["channel"] or {}).get("IFBW"), "pipeline": pipeline, "journal": journal, "checkpoint": checkpoint} # used to calibrate the scan planner
+            try:
+                for i in range(L_tot_2):
                     if i%2 ==0:
                         signe = "+" # change sign to make the arm go back and forth
                     else:
                         signe = "-"
-                    time.sleep(2)   
-                    if state_avg: # if state_avg=True: turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position 
-                        self.vna.write(f'SENSe{channel}:AVERage OFF')
-                        time.sleep(0.1)
-                        self.vna.write(f'SENSe{channel}:AVERage ON')
-                        time.sleep(1)
-                        self.vna.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
-                        for z in range(count_avg): # take count_avg measures to correctly average the signals
-                            self.vna.write(f'INITiate{channel}:IMMediate')
-                            self.vna.write('*WAI')
-                    else: 
-                        self.esp.write(f'{axis[0]}WS')
-                        self.esp.write(f'{axis[1]}WS')
-                        self.vna.write(f'SENSe{channel}:AVERage OFF')
-                        self.vna.write(f'INITiate{channel}:IMMediate')
-                        self.vna.write('*WAI')
-            ################################################################################################
-            # Saving in a file
-            ################################################################################################
-                    all_magnitudes = []
-                    all_phases = []
-                    freq_data = np.linspace(start_freq, stop_freq, points)
-                    for trace in trace_name:
-                        self.vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
-                        time.sleep(1)
-                        self.vna.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
-                        time.sleep(1)
-                        mag_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
-                        self.vna.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
-                        time.sleep(1)
-                        phase_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA')
-                        all_magnitudes.append(mag_data)
-                        all_phases.append(phase_data)
-                    date = datetime.now().strftime("%m-%d-%Y")
-                    file_name = f"Balayage_{hh}.txt"
-                    os.makedirs(save_path, exist_ok=True)
-                    full_path = os.path.join(save_path, file_name)
-                    with open(full_path, 'w') as f:
-                        header = ["Frequency (Hz)"]
-                        for trace in trace_name:
-                            header.append(f"Magnitude_{trace}")
-                            header.append(f"Phase_{trace}")
-                        if state_avg:
-                            header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_average={count_avg}_[x_y]=[{x_val[hh-1]}_{y_val[hh-1]}]')
-                        else:
-                            header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_avrage=False_[x_y]=[{x_val[hh-1]}_{y_val[hh-1]}]')
-                        header.append(f'note=[{note}]')
-                        f.write("\t".join(header) + "\n")
-                        for l in range(points):
-                            line = [f"{freq_data[l]:.2f}"]
-                            for mag, phase in zip(all_magnitudes, all_phases):
-                                line.append(f"{mag[l]:.4f}")
-                                line.append(f"{phase[l]:.4f}")
-                            f.write("\t".join(line) + "\n")
-                    print(f"Mesure {hh}/{int(nb_tot_position)}")
-                    self.esp.write(f'{axis[0]}PR{signe}{str(pas_axe1)}') # move the axis 1
-                    self.esp.write(f'{axis[0]}WS')            
-                    hh = hh+1
-                    ite_end_time = time.time()
-                    time_meas = ite_end_time - ite_start_time
-                    if i==0 and j==0:
-                        print(f"Temps estimé pour le scan: {np.round(time_meas*nb_tot_position/3600,2)}h")
-                if hh>nb_tot_position: # avoid making too much measurement
-                    break
-                if state_avg: # if state_avg=True: turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position 
-                    self.vna.write(f'SENSe{channel}:AVERage OFF')
-                    time.sleep(0.1)
-                    self.vna.write(f'SENSe{channel}:AVERage ON')
-                    self.vna.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
-                    for z in range(count_avg): # take count_avg measures to correctly average the signals
-                        self.vna.write(f'INITiate{channel}:IMMediate')
-                        self.vna.write('*WAI') 
-                else: 
-                    self.vna.write(f'SENSe{channel}:AVERage OFF')
-                    self.vna.write(f'INITiate{channel}:IMMediate')
-                    self.vna.write('*WAI') 
-            ################################################################################################
-            # Saving in a file (for each value j we save and for each value i we also save after the j-loop)
-            ################################################################################################
-                all_magnitudes = []
-                all_phases = []
-                start_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
-                stop_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
-                points = int(self.vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
-                freq_data = np.linspace(start_freq, stop_freq, points)
-                for trace in trace_name:
-                    self.vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
-                    time.sleep(1)
-                    self.vna.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
-                    time.sleep(1)
-                    mag_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
-                    self.vna.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
-                    time.sleep(1)
-                    phase_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA')
-                    all_magnitudes.append(mag_data)
-                    all_phases.append(phase_data)
-                date = datetime.now().strftime("%m-%d-%Y")
-                file_name = f"Balayage_{hh}.txt"
-                os.makedirs(save_path, exist_ok=True)
-                full_path = os.path.join(save_path, file_name)
-                with open(full_path, 'w') as f:
-                    header = ["Frequency (Hz)"]
-                    for trace in trace_name:
-                        header.append(f"Magnitude_{trace}")
-                        header.append(f"Phase_{trace}")
-                    if state_avg:
-                        header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_average={count_avg}_[{x_val[hh-1]}_{y_val[hh-1]}]')
-                    else:
-                        header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_[x_y]=[{x_val[hh-1]}_{y_val[hh-1]}]')
-                    header.append(f'note=[{note}]')
-                    f.write("\t".join(header) + "\n")
-                    for l in range(points):
-                        line = [f"{freq_data[l]:.2f}"]
-                        for mag, phase in zip(all_magnitudes, all_phases):
-                            line.append(f"{mag[l]:.4f}")
-                            line.append(f"{phase[l]:.4f}")
-                        f.write("\t".join(line) + "\n")
-                print(f"Mesure {hh}/{int(nb_tot_position)}")
-                hh = hh+1
-                self.esp.write(f'{axis[1]}PR{str(pas_axe2)}') # when the axis 1 is at B[0] we need the axis 2 to move
-                self.esp.write(f'{axis[1]}WS')
+                    for j in range(L_tot_1 + 1): # the last position of a line is followed by a move of the axis 2
+                        if hh>nb_tot_position: # avoid making too much measurement
+                            break
+                        if hh <= debut: # measured before the interruption
+                            hh = hh+1
+                            continue
+                        if hh == debut+2:
+                            print(f"Temps estimé pour le scan: {np.round((time.time()-scan_start_time)*(nb_tot_position-debut)/3600,2)}h")
+                        elif hh == debut+1:
+                            scan_start_time = time.time()
+                        with timer.chrono(hh-1, "settle"):
+                            self.esp.wait_motion(axis, delay=2 if j < L_tot_1 else 0) # no sweep before the arm has stopped
+                        with timer.chrono(hh-1, "readout_wait"):
+                            taches.wait_read() # nor before the traces of the previous position have been read
+                        with timer.chrono(hh-1, "sweep"):
+                            self.vna.sweep(channel, state_avg, count_avg, trace_name) # averaging (if state_avg=True) done at this position
+                        with timer.chrono(hh-1, "move"):
+                            if j < L_tot_1:
+                                self.esp.write(f'{axis[0]}PR{signe}{str(pas_axe1)}') # move the axis 1
+                                self.esp.write(f'{axis[0]}WS')
+                            elif i < L_tot_2-1:
+                                self.esp.write(f'{axis[1]}PR{str(pas_axe2)}') # when the axis 1 is at B[0] we need the axis 2 to move
+                                self.esp.write(f'{axis[1]}WS')
+            ################################################################################################
+            # Saving in a file (done by the worker threads while the arm moves)
+            ################################################################################################
+                        def lecture(k=hh-1):
+                            data[k] = self.vna.read_traces(trace_name, channel, delay=1) # magnitude (dB) and phase (°) of all the traces
+                            timer.add(k, "transfer", self.vna.timing["transfer"])
+                            timer.add(k, "conversion", self.vna.timing["conversion"])
+                            if ckpt is not None:
+                                with timer.chrono(k, "write"):
+                                    ckpt.done(k)
+                        def ecriture(k=hh-1): # the Balayage_#.txt files are only a crash journal, the data is kept in the cube
+                            header = ["Frequency (Hz)"]
+                            for trace in trace_name:
+                                header.append(f"Magnitude_{trace}")
+                                header.append(f"Phase_{trace}")
+                            if state_avg:
+                                header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_average={count_avg}_[x_y]=[{x_val[k]}_{y_val[k]}]')
+                            else:
+                                header.append(f'{date}_{trace_name}_strat={start_freq/1E9}GHz_strop={stop_freq/1E9}GHz_avrage=False_[x_y]=[{x_val[k]}_{y_val[k]}]')
+                            header.append(f'note=[{note}]')
+                            with timer.chrono(k, "write"):
+                                write_position_file(os.path.join(save_path, f"Balayage_{k+1}.txt"), header, freq_data, data[k])
+                        taches.read(lecture, ecriture if journal else None)
+                        print(f"Mesure {hh}/{int(nb_tot_position)}")
+                        hh = hh+1
+            finally:
+                taches.close() # every position has been read and written
+            if ckpt is not None:
+                data = np.array(data) # copy in memory of the cube mapped on the disk
             ################################################################################################
             # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
             ################################################################################################  
-            for freq_idx in range(points):
-                target_frequency = freq_data[freq_idx]
-                ligne_freq = freq_idx + 1
-                file_name = f"{File_name}_{target_frequency/1E9:.3f}GHz.txt"
-                full_path = os.path.join(save_path, file_name)
-                all_mag = []
-                all_phase = []
-                for i, trace in enumerate(trace_name):
-                    mag_col = 1 + 2 * i      
-                    phase_col = mag_col + 1
-                    magnitudes = file_to_array(save_path, ligne_freq, mag_col)
-                    phases = file_to_array(save_path, ligne_freq, phase_col)
-                    all_mag.append(magnitudes)
-                    all_phase.append(phases)
-                with open(full_path, 'w') as f:
-                    header = ["x", "y"]
-                    for trace in trace_name:
-                        header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
-                    if state_avg:
-                        header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_xmin={A[0]}_xmax={B[0]}_y_min={A[1]}_ymax={B[1]}_stepx={pas_axe1}_stepy={pas_axe2}_average={count_avg}')
-                    else:
-                        header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_xmin={A[0]}_xmax={B[0]}_y_min={A[1]}_ymax={B[1]}_stepx={pas_axe1}_stepy={pas_axe2}')
-                    header.append(f'note=[{note}]')
-                    f.write("\t".join(header) + "\n")
-                    for pos_idx in range(nb_tot_position):
-                        line = [f"{x_val[pos_idx]:.3f}", f"{y_val[pos_idx]:.3f}"]
-                        for trace_idx in range(len(trace_name)):
-                            if pos_idx < len(all_mag[trace_idx]):
-                                mag = all_mag[trace_idx][pos_idx]
-                                phase = all_phase[trace_idx][pos_idx]
-                                line.extend([f"{mag:.4f}", f"{phase:.4f}"])
-                            else:
-                                line.extend(["0.0000", "0.0000"])
-                        f.write("\t".join(line) + "\n")
+            coords = [(f"{x_val[pos_idx]:.3f}", f"{y_val[pos_idx]:.3f}") for pos_idx in range(nb_tot_position)]
+            if state_avg:
+                info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_xmin={A[0]}_xmax={B[0]}_y_min={A[1]}_ymax={B[1]}_stepx={pas_axe1}_stepy={pas_axe2}_average={count_avg}'
+            else:
+                info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_xmin={A[0]}_xmax={B[0]}_y_min={A[1]}_ymax={B[1]}_stepx={pas_axe1}_stepy={pas_axe2}'
+            save_scan_store(os.path.join(save_path, f"{File_name}{STORE_EXT}"), data, freq_data, trace_name, ["x", "y"], coords, dict(parameters, note=note))
+            write_frequency_files(save_path, File_name, freq_data, data, trace_name, ["x", "y"], coords, info, note) # text export derived from the same cube
             print("Traitement terminé!")
+            timer.save(save_path, File_name, context) # {File_name}_timing.csv and {File_name}_timing.json
+            print(timer.report())
+            if ckpt is not None:
+                ckpt.remove() # the scan is saved
             ################################################################################################
-            # delete all "Balayage_i.txt" files
+            # delete the crash journal ("Balayage_i.txt" files)
             ################################################################################################  
             motif = os.path.join(save_path, "Balayage_*.txt")
             fichiers = glob.glob(motif)
@@ -693,19 +796,208 @@ class Balayage2D_Rotation_VNA_ESP:
             ################################################################################################
             # returning home, ask for error and closing connections
             ################################################################################################
-            for axe in axis: 
-                self.esp.write(f'{axe}PA0') # return to zero when the sweep is finished
-                self.esp.write(f'{axe}WS')
+            self.esp.move_axes(axis, [0]*len(axis), wait=False) # return to zero when the sweep is finished
             self.vna.close() 
             self.esp.close()
+            print(self.vna.sweep_report(count_avg if state_avg else 1))
             print("Mesures terminées")
             print("Connexions fermées")
         except Exception as e:
             print(f"Erreur dans balayage_2D: {e}")
+            if ckpt is not None:
+                print(f"Le scan peut être repris avec resume({save_path!r}, {File_name!r})")
+            try:
+                self.esp.move_axes(axis, [0]*len(axis), wait=False)
+            except:
+                pass
+            try:
+                self.vna.close()
+                self.esp.close()
+            except:
+                pass
+            raise  
+            
+    def balayage_2D_fly(self, trace_name=["S12","S21","S11","S22"], axis=[2,3], units=2, A=[0,0], B=[5,5], pas_axe1=1, pas_axe2=1, vitesse=None, tag="TP", save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", note="", File_name="Compilation"):
+        """
+        Performs a 2D scan between two spatial points A and B in "fly scan" mode: the axis 1 moves
+        continuously at constant velocity along each line of the boustrophedon path while the VNA
+        sweeps one after the other. Each sweep is tagged with the position of the arm and the lines
+        are interpolated on the grid of boustrophedon, so the files are the same as the ones of
+        balayage_2D. Only the axis 2 stops between the lines. No averaging is done (the arm is
+        moving), this mode is meant for single frequency or narrow band scans with fast sweeps.
+
+        Parameters
+        ----------
+        trace_name : array of string
+            List of S-parameters . The default is ["S12","S21","S11","S22"].
+        axis : array of integer
+            List of the ESP axis. The default is [2,3].
+        units : integer
+            The unit of the movement (0 = encoder count, 1 = motor step, 2 = millimeter,
+            3 = micrometer, 4 = inches, 5 = milli-inches, 6 = micro-inches, 7 = degree, 8 = gradient,
+            9 = radian, 10 = milliradian, 11 = microradian). The default is 2.
+        A : array of integer or array of floating
+            Start coordinates of the scan. The default is [0,0].
+        B : array of integer or array of floating
+            End coordinates of the scan. The default is [5,5].
+        pas_axe1 : integer or floating
+            Step size of the grid along the axis 1. The default is 1.
+        pas_axe2 : integer or floating
+            Step size of the axis 2. The default is 1.
+        vitesse : integer or floating or None
+            Velocity of the axis 1 (in units per second). The default is None: the duration of a
+            sweep is measured before the scan and the velocity is set to one step per sweep.
+        tag : string
+            "TP": each sweep is tagged with the mean of the positions reported by the ESP (TP?)
+            before and after the sweep. "time": the position is computed from the time of the sweep
+            and the velocity (no query to the ESP while the arm is moving). The default is "TP".
+        save_path : string
+            Output directory path. The default is "C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad".
+        note : string
+            Optional annotation. The default is "".
+        File_name : string
+            Name of the final files returned by the script. The default is "Compilation".
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            ################################################################################################
+            # parameters
+            ################################################################################################
+            channel=1
+            accel="5"
+            deccel="5"
+            speed_mode = "VU15" # speed mode of the moves between the lines
+            self.esp.write_termination = '\r'
+            self.esp.read_termination = '\r'
+            ################################################################################################
+            # give parameters to the axis (acceleration, speed mode...)
+            ################################################################################################
+            with self.esp.batch() as lot: # motor on, unit, acceleration, decceleration and speed mode of the axis
+                for axe in axis:
+                    self.esp.configure_axis(lot, axe, units, accel, deccel, speed_mode)
+            ################################################################################################
+            # sweep spacial parameters
+            ################################################################################################
+            parcours = boustrophedon(A, B, pas_axe1, pas_axe2)
+            N_x = int(round(abs(B[0]-A[0]) / pas_axe1 + 1)) # number of positions of a line
+            N_y = len(parcours) // N_x # number of lines
+            nb_tot_position = len(parcours)
+            x_val = [float(p[0]) for p in parcours]
+            y_val = [float(p[1]) for p in parcours]
+            self.esp.move_axes(axis, [x_val[0], y_val[0]])
+            start_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
+            stop_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
+            points = int(self.vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
+            if start_freq == stop_freq:
+                self.vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
+                print("Balayage mono-fréquence:")
+                points = 1
+            freq_data = np.linspace(start_freq, stop_freq, points)
+            data = np.zeros((nb_tot_position, points, len(trace_name), 2), dtype=float) # acquisition cube (position, frequency, trace, [magnitude, phase])
+            if vitesse is None: # one step of the grid per sweep
+                debut = time.time()
+                self.vna.sweep(channel)
+                self.vna.read_traces(trace_name, channel, delay=0)
+                vitesse = pas_axe1 / (time.time() - debut)
+            print(f"Vitesse de l'axe {axis[0]}: {vitesse}")
+            unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
+            ################################################################################################
+            # preset file creation
+            ################################################################################################  
+            file_name = f"{File_name}_parameters.txt"
+            os.makedirs(save_path, exist_ok=True)    
+            full_path = os.path.join(save_path, file_name)
+            with open(full_path, 'w') as f:
+                header = ["start_freq (Hz)", "stop_freq (Hz)", "number_of_point", "average", f"step_x ({unit})", f"step_y ({unit})", f"x_min ({unit})", f"x_max ({unit})", f"y_min ({unit})", f"y_max ({unit})", f"velocity_x ({unit}/s)"]
+                f.write("\t".join(header) + "\n")
+                line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas_axe1}", f"{pas_axe2}", f"{A[0]}", f"{B[0]}", f"{A[1]}", f"{B[1]}", f"{vitesse}"]
+                f.write("\t".join(line) + "\n")
+            parameters = dict(zip(header, line)) # also saved in the {File_name}.scan store
+            ################################################################################################
+            # this is the fly scan script: one continuous move of the axis 1 per line
+            ################################################################################################
+            date = datetime.now().strftime("%m-%d-%Y")
+            scan_start_time = time.time()
+            va_initial = self.esp.query(f'{axis[0]}VA?').strip() # move velocity of the axis 1, restored after the lines
+            with self.esp.batch() as lot:
+                self.esp.configure_axis(lot, axis[0], units, accel, deccel, f"VA{vitesse}") # constant velocity of the axis 1 along the lines
+            try:
+                for i in range(N_y):
+                    ligne = slice(i*N_x, (i+1)*N_x)
+                    x_debut, x_fin = x_val[ligne][0], x_val[ligne][-1]
+                    if i > 0:
+                        self.esp.write(f'{axis[1]}PA{y_val[ligne][0]}') # next line
+                        self.esp.wait_motion(axis)
+                    x_mes = [] # position of each sweep
+                    mesures = [] # traces of each sweep
+                    taches = Pipeline(1) # readout of a sweep during the next one
+                    try:
+                        lance = False
+                        en_mouvement = True
+                        while en_mouvement: # the last sweep is taken once the arm has stopped at the end of the line
+                            if lance:
+                                en_mouvement = int(float(self.esp.query(f'{axis[0]}MD?'))) != 1
+                            taches.wait_read()
+                            if tag == "TP" and lance:
+                                x_avant = float(self.esp.query(f'{axis[0]}TP?'))
+                            t_avant = time.time()
+                            self.vna.sweep(channel)
+                            t_apres = time.time()
+                            if not lance or not en_mouvement: # arm stopped at the start or at the end of the line
+                                x_mes.append(x_debut if not lance else x_fin)
+                            elif tag == "TP":
+                                x_mes.append((x_avant + float(self.esp.query(f'{axis[0]}TP?'))) / 2)
+                            else:
+                                parcouru = min(vitesse * ((t_avant + t_apres)/2 - t_depart), abs(x_fin - x_debut))
+                                x_mes.append(x_debut + np.sign(x_fin - x_debut) * parcouru)
+                            mesures.append(None)
+                            def lecture(k=len(mesures)-1):
+                                mesures[k] = self.vna.read_traces(trace_name, channel, delay=0) # magnitude (dB) and phase (°) of all the traces
+                            taches.read(lecture)
+                            if not lance:
+                                self.esp.write(f'{axis[0]}PA{x_fin}') # the sweeps go on while the arm moves
+                                t_depart = time.time()
+                                lance = True
+                    finally:
+                        taches.close()
+                    data[ligne] = regrid_line(x_mes, np.array(mesures), x_val[ligne]) # interpolation on the grid
+                    print(f"Ligne {i+1}/{N_y}: {len(mesures)} mesures")
+                    if i == 0:
+                        print(f"Temps estimé pour le scan: {np.round((time.time()-scan_start_time)*N_y/3600,2)}h")
+            finally:
+                self.esp.write(f'{axis[0]}VA{va_initial}') # also after an error or an abort
+                self.esp.forget_config() # VA restored without configure_axis
+            with self.esp.batch() as lot:
+                self.esp.configure_axis(lot, axis[0], units, accel, deccel, speed_mode)
+            ################################################################################################
+            # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
+            ################################################################################################  
+            coords = [(f"{x_val[pos_idx]:.3f}", f"{y_val[pos_idx]:.3f}") for pos_idx in range(nb_tot_position)]
+            info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_xmin={A[0]}_xmax={B[0]}_y_min={A[1]}_ymax={B[1]}_stepx={pas_axe1}_stepy={pas_axe2}_fly={vitesse}'
+            save_scan_store(os.path.join(save_path, f"{File_name}{STORE_EXT}"), data, freq_data, trace_name, ["x", "y"], coords, dict(parameters, note=note))
+            write_frequency_files(save_path, File_name, freq_data, data, trace_name, ["x", "y"], coords, info, note) # text export derived from the same cube
+            print("Traitement terminé!")
+            ################################################################################################
+            # returning home, ask for error and closing connections
+            ################################################################################################
+            self.esp.move_axes(axis, [0]*len(axis), wait=False) # return to zero when the sweep is finished
+            self.vna.close() 
+            self.esp.close()
+            print(self.vna.sweep_report())
+            print("Mesures terminées")
+            print("Connexions fermées")
+        except Exception as e:
+            print(f"Erreur dans balayage_2D_fly: {e}")
             try:
                 for axe in axis:
-                    self.esp.write(f'{axe}PA0') 
-                    self.esp.write(f'{axe}WS')   
+                    self.esp.write(f'{axe}ST') # stop the continuous move
+                    self.esp.write(f'{axe}{speed_mode}')
+                self.esp.forget_config() # speed mode changed without configure_axis
+                self.esp.move_axes(axis, [0]*len(axis), wait=False)
             except:
                 pass
             try:
@@ -715,7 +1007,7 @@ class Balayage2D_Rotation_VNA_ESP:
                 pass
             raise  
             
-    def rotation(self, trace_name=["S12","S21","S11","S22"], axis=1, units=7, theta_max=10, theta_min=0, sens="-to+", pas=1, state_avg=True, count_avg=5, save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", note="", File_name="Compilation"):
+    def rotation(self, trace_name=["S12","S21","S11","S22"], axis=1, units=7, theta_max=10, theta_min=0, sens="-to+", pas=1, state_avg=True, count_avg=5, save_path="C:\\Users\\Thomas\\Documents\\Galaad_B\\vna_data_test_galaad", note="", File_name="Compilation", journal=False, pipeline=True, checkpoint=True, reprise=None):
         """
         Performs a full angular scan between two values of the θ angle θmin and θmax.
         The scan will begin at θmin and end at θmax. It will take measures at every step.
@@ -748,12 +1040,25 @@ class Balayage2D_Rotation_VNA_ESP:
             Optional annotation. The default is "".
         File_name : string
             Name of the final files returned by the script. The default is "Compilation".
+        journal : boolean
+            If True, the measurements of each position are also written in a file (crash journal) while
+            the scan is running; the data itself is kept in memory. The default is False.
+        pipeline : boolean
+            If True, the traces of a position are read (and the crash journal written) on worker
+            threads while the arm moves to the next position. The default is True.
+        checkpoint : boolean
+            If True, the scan can be resumed with resume after an interruption (see balayage_2D).
+            The default is True.
+        reprise : Checkpoint or None
+            Checkpoint of the interrupted scan, given by resume. The default is None.
 
         Returns
         -------
         None.
 
         """
+        arguments = {nom: valeur for nom, valeur in locals().items() if nom not in ("self", "reprise")} # saved in the checkpoint
+        ckpt = None
         try:
             ################################################################################################
             # parameters
@@ -770,17 +1075,15 @@ class Balayage2D_Rotation_VNA_ESP:
             ################################################################################################
             # give parameters to the axis (acceleration, speed mode...)
             ################################################################################################
-            self.esp.write(f'{axis}MO')
-            self.esp.write(f'{axis}SN{units}')
-            self.esp.write(f'{axis}AC{accel}')
-            self.esp.write(f'{axis}AG{deccel}')
             speed_mode = {1: "JW5", 2: "JH10", 3: "VU15"}[speed]
-            self.esp.write(f'{axis}{speed_mode}')
-            time.sleep(2)
+            with self.esp.batch() as lot:
+                self.esp.configure_axis(lot, axis, units, accel, deccel, speed_mode)
+                lot.pause(2)
             ################################################################################################
             # sweep spacial parameters
             ################################################################################################
-            nb_tot_position = int(np.ceil(np.abs(1 + (theta_max - theta_min) / pas )))
+            theta_val = angles(theta_min, theta_max, pas)
+            nb_tot_position = len(theta_val)
             if sens == '-to+':
                 sign = '+'
                 theta_min_sign = theta_min
@@ -789,13 +1092,14 @@ class Balayage2D_Rotation_VNA_ESP:
                 theta_min_sign = -theta_min
             self.esp.write(f'{axis}PA{theta_min_sign}')
             self.esp.write(f'{axis}WS')
-            time.sleep(3)
+            self.esp.wait_motion(axis, delay=3)
             start_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STARt?')) # ask the vna the value of start_freq
             stop_freq = float(self.vna.query(f'SENSe{channel}:FREQuency:STOP?')) # ask the vna the value of stop_freq
             points = int(self.vna.query(f'SENSe{channel}:SWEep:POINts?')) # ask the vna the number of point
             if start_freq == stop_freq:
                 self.vna.write(f'SENSe{channel}:SWEep:POINts 1') # set the number of point to 1
                 print("Balayage mono-fréquence:")
+                points = 1
             unit = {0:"encoder_count", 1:"motor_step", 2:"mm", 3:"µm", 4:"inches", 5:"milli-inches", 6:"micro-inches", 7:"deg", 8:"grad", 9:"rad", 10:"mili-rad", 11:"µ-rad"}[int(units)]
             ################################################################################################
             # preset file creation
@@ -811,110 +1115,90 @@ class Balayage2D_Rotation_VNA_ESP:
                 else: 
                     line = [f"{start_freq}",  f"{stop_freq}", f"{points}", "0", f"{pas}", f"{theta_min}", f"{theta_max}"]
                 f.write("\t".join(line) + "\n")
+            parameters = dict(zip(header, line)) # also saved in the {File_name}.scan store
             ################################################################################################
             # this is the angular scan script
             ################################################################################################
             hh = 1 # hh tracks the number of measurements
-            theta_val = np.arange(theta_min, theta_max + pas, pas)
-            for i in range(nb_tot_position):
-                if state_avg: # if state_avg=True: turn off and on the averaging before tacking the measure to make sure the averaging is done at a given position
-                    self.vna.write(f'SENSe{channel}:AVERage OFF')
-                    time.sleep(0.1)
-                    self.vna.write(f'SENSe{channel}:AVERage ON')
-                    time.sleep(1)
-                    self.vna.write(f'SENSe{channel}:AVERage:COUNt {count_avg}') # set the average count to count_avg
-                    for z in range(count_avg): # take count_avg measures to correctly average the signals
-                        self.vna.write(f'INITiate{channel}:IMMediate')
-                        self.vna.write('*WAI')
-                else:
-                    self.vna.write(f'SENSe{channel}:AVERage OFF')
-                    self.vna.write(f'INITiate{channel}:IMMediate')
-                    self.vna.write('*WAI')
-                freq_data = np.linspace(start_freq, stop_freq, points)
-                all_magnitudes = []
-                all_phases = []
-                for trace in trace_name:
-                    self.vna.write(f'CALCulate{channel}:PARameter:SELect "{trace}"')
-                    time.sleep(2)
-                    self.vna.write(f'CALCulate{channel}:FORMat MLOG') # magnitude (dB)
-                    time.sleep(2)
-                    mag_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA') # 'FDATA' -> real part of the data
-                    self.vna.write(f'CALCulate{channel}:FORMat PHAS') # phase (°)
-                    time.sleep(2)
-                    phase_data = self.vna.query_ascii_values(f'CALCulate{channel}:DATA? FDATA')
-                    all_magnitudes.append(mag_data)
-                    all_phases.append(phase_data)
-                time.sleep(0.5)
-            ################################################################################################
-            # save the data in a file
-            ################################################################################################
-                date = datetime.now().strftime("%m-%d-%Y")
-                file_name = f"Rotation_{hh}.txt"
-                os.makedirs(save_path, exist_ok=True)
-                full_path = os.path.join(save_path, file_name)
-                with open(full_path, 'w') as f:
-                    header = ["Frequency (Hz)"]
-                    for trace in trace_name:
-                        header.append(f"Magnitude_{trace}")
-                        header.append(f"Phase_{trace}")
-                    if state_avg:
-                        header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_average={count_avg}_theta={theta_val[hh-1]}')
-                    else:
-                        header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_theta={theta_val[hh-1]}')
-                    header.append(f'note=[{note}]')                
-                    f.write("\t".join(header) + "\n")
-                    for l in range(points):
-                        line = [f"{freq_data[l]:.2f}"]
-                        for mag, phase in zip(all_magnitudes, all_phases):
-                            line.append(f"{mag[l]:.4f}")
-                            line.append(f"{phase[l]:.4f}")
-                        f.write("\t".join(line) + "\n")
-                print(f"Mesure {hh}/{int(nb_tot_position)}")
-                if i < nb_tot_position - 1: # avoid macking too musch measurements
-                    self.esp.write(f'{axis}PR{sign}{pas}')
-                    self.esp.write(f'{axis}WS')
-                    time.sleep(2)
-                hh = hh+1
+            data = np.zeros((nb_tot_position, points, len(trace_name), 2), dtype=float) # acquisition cube (position, frequency, trace, [magnitude, phase])
+            freq_data = np.linspace(start_freq, stop_freq, points)
+            date = datetime.now().strftime("%m-%d-%Y")
+            debut = 0 # number of positions already measured
+            if reprise is not None: # resume of an interrupted scan, the data already measured is in the checkpoint
+                ckpt = reprise
+                data, date, debut = ckpt.cube, ckpt.etat["date"], ckpt.positions_faites
+                print(f"Reprise du scan à la mesure {debut+1}/{int(nb_tot_position)}")
+                if 0 < debut < nb_tot_position:
+                    self.esp.write(f'{axis}PA{theta_min_sign + (debut*pas if sign == "+" else -debut*pas)}') # first position that has not been measured
+            elif checkpoint:
+                ckpt = Checkpoint(save_path, File_name)
+                data = ckpt.create("rotation", arguments, self.setup, data.shape, date)
+            taches = Pipeline(2 if pipeline else 0) # readout and writing of a position while the arm moves to the next one
+            timer = ScanTimer(nb_tot_position) # duration of each phase of each position
+            context = {"points": points, "traces": len(trace_name), "count_avg": int(count_avg) if state_avg else 1, "averaging": self.vna.averaging,
+                       "IFBW": (self.setup["channel"] or {}).get("IFBW"), "pipeline": pipeline, "journal": journal, "checkpoint": checkpoint} # used to calibrate the scan planner
+            try:
+                for i in range(nb_tot_position):
+                    if i < debut: # measured before the interruption
+                        hh = hh+1
+                        continue
+                    if i > 0:
+                        with timer.chrono(hh-1, "settle"):
+                            self.esp.wait_motion(axis) # no sweep before the arm has stopped
+                    with timer.chrono(hh-1, "readout_wait"):
+                        taches.wait_read() # nor before the traces of the previous position have been read
+                    with timer.chrono(hh-1, "sweep"):
+                        self.vna.sweep(channel, state_avg, count_avg, trace_name) # averaging (if state_avg=True) done at this position
+                    if i < nb_tot_position - 1: # avoid macking too musch measurements
+                        with timer.chrono(hh-1, "move"):
+                            self.esp.write(f'{axis}PR{sign}{pas}')
+                            self.esp.write(f'{axis}WS')
+            ################################################################################################
+            # save the data in the crash journal (done by the worker threads while the arm moves)
+            ################################################################################################
+                    def lecture(k=hh-1):
+                        data[k] = self.vna.read_traces(trace_name, channel, delay=2) # magnitude (dB) and phase (°) of all the traces
+                        timer.add(k, "transfer", self.vna.timing["transfer"])
+                        timer.add(k, "conversion", self.vna.timing["conversion"])
+                        if ckpt is not None:
+                            with timer.chrono(k, "write"):
+                                ckpt.done(k)
+                    def ecriture(k=hh-1): # the Rotation_#.txt files are only a crash journal, the data is kept in the cube
+                        header = ["Frequency (Hz)"]
+                        for trace in trace_name:
+                            header.append(f"Magnitude_{trace}")
+                            header.append(f"Phase_{trace}")
+                        if state_avg:
+                            header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_average={count_avg}_theta={theta_val[k]}')
+                        else:
+                            header.append(f'{date}_{trace_name}_freq={start_freq/1E9}GHz_theta={theta_val[k]}')
+                        header.append(f'note=[{note}]')
+                        with timer.chrono(k, "write"):
+                            write_position_file(os.path.join(save_path, f"Rotation_{k+1}.txt"), header, freq_data, data[k])
+                    taches.read(lecture, ecriture if journal else None)
+                    print(f"Mesure {hh}/{int(nb_tot_position)}")
+                    hh = hh+1
+            finally:
+                taches.close() # every position has been read and written
+            if ckpt is not None:
+                data = np.array(data) # copy in memory of the cube mapped on the disk
             ################################################################################################
             # one file to rule them all (create a final data file at the end of the acquisition to compile the data at a given frequency)
             ################################################################################################      
-            for freq_idx in range(points):
-                target_frequency = freq_data[freq_idx]
-                ligne_freq = freq_idx + 1
-                file_name = f"{File_name}_{target_frequency/1E9:.3f}GHz.txt"
-                full_path = os.path.join(save_path, file_name)
-                all_mag = []
-                all_phase = []
-                for i, trace in enumerate(trace_name):
-                    mag_col = 1 + 1 * i      
-                    phase_col = mag_col + 1
-                    magnitudes = file_to_array(save_path, ligne_freq, mag_col, rot=True)
-                    phases = file_to_array(save_path, ligne_freq, phase_col, rot=True)
-                    all_mag.append(magnitudes)
-                    all_phase.append(phases)
-                with open(full_path, 'w') as f:
-                    header = ["theta"]
-                    for trace in trace_name:
-                        header.extend([f"Magnitude_{trace}", f"Phase_{trace}"])
-                    if state_avg:
-                        header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}_average={count_avg}')
-                    else:
-                        header.append(f'{date}_freq={freq_data[freq_idx]/1E9}GHz_lbd={299792458/freq_data[freq_idx]}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}')
-                    header.append(f'note=[{note}]')
-                    f.write("\t".join(header) + "\n")
-                    for pos_idx in range(nb_tot_position):
-                        line = [f"{theta_val[pos_idx]}"]
-                        for trace_idx in range(len(trace_name)):
-                            if pos_idx < len(all_mag[trace_idx]):
-                                mag = all_mag[trace_idx][pos_idx]
-                                phase = all_phase[trace_idx][pos_idx]
-                                line.extend([f"{mag:.4f}", f"{phase:.4f}"])
-                            else:
-                                line.extend(["0.0000", "0.0000"])
-                        f.write("\t".join(line) + "\n")
+            coords = [(f"{theta_val[pos_idx]}",) for pos_idx in range(nb_tot_position)]
+            if state_avg:
+                info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}_average={count_avg}'
+            else:
+                info = lambda freq: f'{date}_freq={freq/1E9}GHz_lbd={299792458/freq}m_thetamin={theta_min}_thetamax={theta_max}_step={pas}'
+            save_scan_store(os.path.join(save_path, f"{File_name}{STORE_EXT}"), data, freq_data, trace_name, ["theta"], coords, dict(parameters, note=note))
+            write_frequency_files(save_path, File_name, freq_data, data, trace_name, ["theta"], coords, info, note) # text export derived from the same cube
             print("Traitement terminé!")
+            timer.save(save_path, File_name, context) # {File_name}_timing.csv and {File_name}_timing.json
+            print(timer.report())
+            if ckpt is not None:
+                ckpt.remove() # the scan is saved
             ################################################################################################
-            # delete all "Rotation_i.txt" files
+            # delete the crash journal ("Rotation_i.txt" files)
             ################################################################################################  
             motif = os.path.join(save_path, "Rotation_*.txt")
             fichiers = glob.glob(motif)
@@ -927,6 +1211,9 @@ class Balayage2D_Rotation_VNA_ESP:
             self.esp.write(f'{axis}WS')
             self.vna.close()
             self.esp.close()
+            print(self.vna.sweep_report(count_avg if state_avg else 1))
             print("Mesures terminées\nConnexions fermées")
         except Exception as e:
             print(f"Erreur lors du balayage : {e}")
+            if ckpt is not None:
+                print(f"Le scan peut être repris avec resume({save_path!r}, {File_name!r})")